@@ -1,5 +1,10 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F
+from django.utils.functional import cached_property
 from .models import (
     CustomUser,
     Product,
@@ -11,8 +16,42 @@ from .models import (
     Wishlist,
     CustomerAddress,
     Order,
-    OrderItem
+    OrderItem,
+    Task
 )
+from .inventory import OutOfStock, adjust_stock, available_stock
+from .money import to_major
+
+# Tables at or above this many rows (per the planner's estimate) are counted approximately.
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses PostgreSQL's row estimate for unfiltered changelists on large tables
+    instead of a full COUNT(*); filtered lists and other databases count exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables that grow with traffic."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 # -------------------------------------------------
 # Custom User admin
@@ -27,13 +66,54 @@ class CustomUserAdmin(UserAdmin):
 # -------------------------------------------------
 # Product admin
 # -------------------------------------------------
+class ProductAdminForm(forms.ModelForm):
+    stock_adjustment = forms.IntegerField(
+        required=False,
+        help_text="Units to add to the stock, or remove when negative (e.g. a delivery or a stock count).",
+    )
+
+    class Meta:
+        model = Product
+        fields = "__all__"
+
+
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ("name", "price", "featured", "category")
+class ProductAdmin(LargeTableAdmin):
+    form = ProductAdminForm
+    list_display = ("name", "price_display", "stock", "featured", "category")
     list_filter = ("featured", "category")
-    search_fields = ("name",)
+    list_select_related = ("category",)
+    search_fields = ("^name",)
     prepopulated_fields = {"slug": ("name",)}
 
+    def get_readonly_fields(self, request, obj=None):
+        # Checkouts decrement the counters concurrently; change them through stock_adjustment
+        # and the shard_stock command so a saved form can't write back a stale count.
+        if obj is not None:
+            return ("stock", "stock_shards")
+        return ()
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=[field.name for field in obj._meta.concrete_fields if field.name in form.fields])
+        else:
+            obj.save()
+        adjustment = form.cleaned_data.get("stock_adjustment")
+        if adjustment:
+            try:
+                adjust_stock(obj, adjustment)
+            except OutOfStock:
+                obj.refresh_from_db(fields=["stock"])
+                self.message_user(
+                    request,
+                    f"Only {available_stock(obj) or 0} units of {obj.name} are left; the stock was not changed.",
+                    messages.WARNING,
+                )
+
+    @admin.display(description="Price", ordering="price")
+    def price_display(self, obj):
+        return f"{to_major(obj.price):,.2f}"
+
 
 # -------------------------------------------------
 # Category admin
@@ -49,10 +129,12 @@ class CategoryAdmin(admin.ModelAdmin):
 # Cart admin
 # -------------------------------------------------
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     list_display = ("cart_code", "user", "created_at", "updated_at")
-    search_fields = ("cart_code", "user__username")
+    search_fields = ("=cart_code", "^user__username")
     list_filter = ("created_at",)
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
     readonly_fields = ("cart_code",)
 
 
@@ -60,22 +142,29 @@ class CartAdmin(admin.ModelAdmin):
 # Cart Item admin
 # -------------------------------------------------
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(LargeTableAdmin):
     list_display = ("cart", "product", "quantity", "sub_total_display")
-    search_fields = ("cart__cart_code", "product__name")
+    search_fields = ("=cart__cart_code", "^product__name")
+    list_select_related = ("cart__user", "product")
+    raw_id_fields = ("cart", "product")
 
-    @admin.display(description="Sub Total")
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(line_total=F("product__price") * F("quantity"))
+
+    @admin.display(description="Sub Total", ordering="line_total")
     def sub_total_display(self, obj):
-        return f"₦{obj.sub_total:,.2f}"
+        return f"₦{to_major(obj.line_total):,.2f}"
 
 
 # -------------------------------------------------
 # Product Rating admin
 # -------------------------------------------------
 @admin.register(ProductRating)
-class ProductRatingAdmin(admin.ModelAdmin):
+class ProductRatingAdmin(LargeTableAdmin):
     list_display = ("product", "average_rating_display", "total_reviews_display")
-    search_fields = ("product__name",)
+    search_fields = ("^product__name",)
+    list_select_related = ("product",)
+    raw_id_fields = ("product",)
 
     @admin.display(description="Average Rating")
     def average_rating_display(self, obj):
@@ -90,45 +179,68 @@ class ProductRatingAdmin(admin.ModelAdmin):
 # Review admin
 # -------------------------------------------------
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdmin):
     list_display = ("product", "user", "rating", "created", "updated")
     list_filter = ("rating", "created")
-    search_fields = ("review", "user__username", "product__name")
+    search_fields = ("^user__username", "^product__name")
+    list_select_related = ("product", "user")
+    raw_id_fields = ("product", "user")
 
 
 # -------------------------------------------------
 # Wishlist admin
 # -------------------------------------------------
 @admin.register(Wishlist)
-class WishlistAdmin(admin.ModelAdmin):
+class WishlistAdmin(LargeTableAdmin):
     list_display = ("user", "product", "created")
-    search_fields = ("user__username", "product__name")
+    search_fields = ("^user__username", "^product__name")
     list_filter = ("created",)
+    list_select_related = ("user", "product")
+    raw_id_fields = ("user", "product")
 
 
 # -------------------------------------------------
 # Customer Address admin
 # -------------------------------------------------
 @admin.register(CustomerAddress)
-class CustomerAddressAdmin(admin.ModelAdmin):
+class CustomerAddressAdmin(LargeTableAdmin):
     list_display = ("customer", "email", "street", "city", "state", "phone", "created")
-    search_fields = ("customer__username", "email", "city", "state")
+    search_fields = ("^customer__username", "^email", "^city", "^state")
+    list_select_related = ("customer",)
+    raw_id_fields = ("customer",)
 
 
 # -------------------------------------------------
 # Order admin
 # -------------------------------------------------
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ("stripe_checkout_id", "customer_email", "amount", "currency", "status", "created")
-    search_fields = ("stripe_checkout_id", "customer_email")
-    list_filter = ("status", "created")
+class OrderAdmin(LargeTableAdmin):
+    list_display = ("stripe_checkout_id", "customer_email", "amount_display", "currency", "status", "created")
+    search_fields = ("=stripe_checkout_id", "^customer_email")
+    list_filter = ("status", "backordered", "created")
+    raw_id_fields = ("user",)
+
+    @admin.display(description="Amount", ordering="amount")
+    def amount_display(self, obj):
+        return f"{to_major(obj.amount):,.2f}"
 
 
 # -------------------------------------------------
 # Order Item admin
 # -------------------------------------------------
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ("order", "product", "quantity")
-    search_fields = ("order__stripe_checkout_id", "product__name")
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ("order", "product", "quantity", "backordered")
+    search_fields = ("=order__stripe_checkout_id", "^product__name")
+    list_select_related = ("order", "product")
+    raw_id_fields = ("order", "product")
+
+
+# -------------------------------------------------
+# Task admin
+# -------------------------------------------------
+@admin.register(Task)
+class TaskAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "status", "attempts", "run_at", "finished_at")
+    list_filter = ("status", "name")
+    readonly_fields = ("last_error", "locked_by", "started_at", "finished_at")
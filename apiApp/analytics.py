@@ -0,0 +1,130 @@
+"""
+Daily sales rollups.
+
+DailySales, DailyProductSales and DailyCategorySales hold one row per day (per
+product / category). fulfill_checkout adds each new order to them with
+increment-in-place updates, so reports read a handful of rows per day instead
+of scanning orders. Every checkout touches the overall day, so DailySales is
+spread over SALES_SHARDS rows per day, one picked at random per order, and
+read back as their sum. rebuild_days() recomputes a date range from the orders
+themselves, for backfills and repairs.
+
+Days are calendar days in TIME_ZONE. Order revenue is the charged
+Order.amount; product and category revenue is quantity × OrderItem.unit_price
+(falling back to the current Product.price for items recorded before
+unit_price existed).
+"""
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import (
+    DailyCategorySales, DailyProductSales, DailySales, Order, OrderItem
+)
+
+# DailySales rows per day; checkouts in the same day contend for one of these instead of one row.
+SALES_SHARDS = 8
+
+
+def _increment(model, lookup, amounts):
+    """Add `amounts` to the row matching `lookup`, creating it if this is its first sale."""
+    changes = {field: F(field) + value for field, value in amounts.items()}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **amounts)
+    except IntegrityError:
+        # Another checkout created the row first
+        model.objects.filter(**lookup).update(**changes)
+
+
+def record_order(order, lines):
+    """
+    Add a fulfilled order to the rollups.
+
+    `lines` is [(product_id, category_id, quantity, unit_price)], prices in minor units.
+    """
+    day = timezone.localdate(order.created)
+    products = defaultdict(lambda: [0, 0])
+    categories = defaultdict(lambda: [0, 0])
+    for product_id, category_id, quantity, unit_price in lines:
+        for totals in [products[product_id]] + ([categories[category_id]] if category_id else []):
+            totals[0] += quantity
+            totals[1] += quantity * unit_price
+
+    _increment(DailySales, {"date": day, "shard": random.randrange(SALES_SHARDS)}, {
+        "orders": 1, "units": sum(units for units, _ in products.values()), "revenue": order.amount
+    })
+    # Sorted so concurrent checkouts lock shared rows in the same order
+    for product_id, (units, revenue) in sorted(products.items()):
+        _increment(DailyProductSales, {"date": day, "product_id": product_id}, {"units": units, "revenue": revenue})
+    for category_id, (units, revenue) in sorted(categories.items()):
+        _increment(DailyCategorySales, {"date": day, "category_id": category_id}, {"units": units, "revenue": revenue})
+
+
+@transaction.atomic
+def rebuild_days(start, end):
+    """Recompute every rollup for the days start..end (inclusive) from Order/OrderItem. Returns orders counted."""
+    for model in (DailySales, DailyProductSales, DailyCategorySales):
+        model.objects.filter(date__gte=start, date__lte=end).delete()
+
+    orders = Order.objects.annotate(day=TruncDate("created")).filter(day__gte=start, day__lte=end)
+    items = (
+        OrderItem.objects.annotate(day=TruncDate("order__created"))
+        .filter(day__gte=start, day__lte=end)
+        .annotate(line_revenue=F("quantity") * Coalesce("unit_price", "product__price"))
+    )
+
+    daily = {
+        row["day"]: DailySales(date=row["day"], orders=row["orders"], revenue=row["revenue"] or 0)
+        for row in orders.values("day").annotate(orders=Count("id"), revenue=Sum("amount")).order_by()
+    }
+    product_rows = []
+    for row in items.values("day", "product_id").annotate(units=Sum("quantity"), revenue=Sum("line_revenue")).order_by():
+        product_rows.append(DailyProductSales(
+            date=row["day"], product_id=row["product_id"], units=row["units"], revenue=row["revenue"] or 0
+        ))
+        if row["day"] in daily:
+            daily[row["day"]].units += row["units"]
+    category_rows = [
+        DailyCategorySales(date=row["day"], category_id=row["product__category_id"], units=row["units"], revenue=row["revenue"] or 0)
+        for row in items.filter(product__category__isnull=False)
+        .values("day", "product__category_id")
+        .annotate(units=Sum("quantity"), revenue=Sum("line_revenue"))
+        .order_by()
+    ]
+
+    DailySales.objects.bulk_create(daily.values(), batch_size=1000)
+    DailyProductSales.objects.bulk_create(product_rows, batch_size=1000)
+    DailyCategorySales.objects.bulk_create(category_rows, batch_size=1000)
+    return sum(row.orders for row in daily.values())
+
+
+def sales_series(start, end, product=None, category=None):
+    """
+    [{date, orders?, units, revenue}] for every day start..end (inclusive), zero-filled.
+
+    Totals across all orders by default, or for one product / category; `orders`
+    is only present in the overall series.
+    """
+    if product is not None:
+        rows = DailyProductSales.objects.filter(product=product)
+    elif category is not None:
+        rows = DailyCategorySales.objects.filter(category=category)
+    else:
+        rows = DailySales.objects.all()
+    fields = ["date", "units", "revenue"] + (["orders"] if product is None and category is None else [])
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    by_day = {day: {"date": day, **{field: 0 for field in fields if field != "date"}} for day in days}
+    # Adds up the DailySales shards; product and category rows are already one per day.
+    for row in rows.filter(date__gte=start, date__lte=end).values(*fields):
+        totals = by_day[row.pop("date")]
+        for field, value in row.items():
+            totals[field] += value
+    return list(by_day.values())
@@ -6,4 +6,4 @@ class ApiappConfig(AppConfig):
 
     def ready(self):
         # Import signals here — ensures apps are loaded first
-        from . import signals
+        from . import checks, signals
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.permissions import BasePermission
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+
+class TokenCache:
+    """Small LRU of validated tokens, keyed by the raw token and dropped once expired."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, raw_token):
+        with self._lock:
+            entry = self._tokens.get(raw_token)
+            if entry is None:
+                return None
+            expires_at, token = entry
+            if expires_at <= time.time():
+                del self._tokens[raw_token]
+                return None
+            self._tokens.move_to_end(raw_token)
+            return token
+
+    def set(self, raw_token, token):
+        with self._lock:
+            self._tokens[raw_token] = (token.get("exp", 0), token)
+            self._tokens.move_to_end(raw_token)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+token_cache = TokenCache(getattr(settings, "JWT_TOKEN_CACHE_SIZE", 10_000))
+
+
+class CachedJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Stateless JWT authentication: `request.user` is a TokenUser built from the
+    token claims, so identifying the caller never touches the database. Tokens
+    already verified by this worker skip signature validation until they expire.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = token_cache.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            token_cache.set(raw_token, token)
+        return token
+
+
+class IsStaff(BasePermission):
+    """Staff only. TokenUser carries no flags, so this one check reads the user row."""
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user and request.user.is_authenticated
+            and get_user_model().objects.filter(pk=request.user.id, is_staff=True).exists()
+        )
@@ -0,0 +1,166 @@
+"""Micro-benchmarks run by `manage.py benchmark`. Each returns a dict of measurements."""
+import time
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def _per_call_ns(func, iterations):
+    start = time.perf_counter_ns()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter_ns() - start) / iterations
+
+
+@benchmark("throttle")
+def throttle_overhead(iterations):
+    """Cost of SlidingWindowThrottle.allow_request (on the configured cache) for a hot key and for many clients."""
+    from django.test import override_settings
+    from rest_framework.test import APIRequestFactory
+    from rest_framework.request import Request
+
+    from .throttling import SlidingWindowThrottle
+
+    class View:
+        throttle_scope = "benchmark"
+        throttle_key = "ip"
+
+    factory = APIRequestFactory()
+    requests = [Request(factory.get("/", REMOTE_ADDR=f"10.0.{i // 256 % 256}.{i % 256}")) for i in range(1000)]
+    throttle, view = SlidingWindowThrottle(), View()
+
+    with override_settings(REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {"benchmark": f"{iterations * 2}/s"}}):
+        same_client = _per_call_ns(lambda i: throttle.allow_request(requests[0], view), iterations)
+        many_clients = _per_call_ns(lambda i: throttle.allow_request(requests[i % 1000], view), iterations)
+
+    return {
+        "iterations": iterations,
+        "same_client_us": round(same_client / 1000, 2),
+        "many_clients_us": round(many_clients / 1000, 2),
+    }
+
+
+@benchmark("cart_total")
+def cart_total(iterations):
+    """Summing a 500-line cart: per-line string->Decimal conversion vs integer minor units."""
+    from decimal import Decimal
+    from types import SimpleNamespace
+
+    lines = [
+        (SimpleNamespace(quantity=i % 5 + 1), SimpleNamespace(price=Decimal("19.99"), price_cents=1999))
+        for i in range(500)
+    ]
+    rounds = max(1, iterations // 500)
+
+    def decimal_total(_):
+        return sum(Decimal(str(product.price)) * Decimal(str(item.quantity)) for item, product in lines)
+
+    def minor_units_total(_):
+        return sum(product.price_cents * item.quantity for item, product in lines)
+
+    assert decimal_total(0) * 100 == minor_units_total(0)
+    return {
+        "lines": len(lines),
+        "decimal_us": round(_per_call_ns(decimal_total, rounds) / 1000, 1),
+        "minor_units_us": round(_per_call_ns(minor_units_total, rounds) / 1000, 1),
+    }
+
+
+@benchmark("startup")
+def startup(iterations):
+    """Cold start of a fresh interpreter: importing the WSGI app and URLconf, median of up to 10 runs."""
+    import os
+    import statistics
+    import subprocess
+    import sys
+
+    from django.conf import settings
+
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {settings.WSGI_APPLICATION.rsplit('.', 1)[0]}\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+        "print((time.perf_counter() - start) * 1000, len(sys.modules), 'stripe' in sys.modules)\n"
+    )
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE)}
+    runs = max(1, min(iterations // 10_000, 10))
+    app_ms, process_ms = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True, env=env, cwd=settings.BASE_DIR
+        ).stdout.split()
+        process_ms.append((time.perf_counter() - start) * 1000)
+        app_ms.append(float(output[-3]))
+    return {
+        "runs": runs,
+        "app_load_ms": round(statistics.median(app_ms), 1),
+        "process_ms": round(statistics.median(process_ms), 1),
+        "modules": int(output[-2]),
+        "stripe_loaded": output[-1] == "True",
+    }
+
+
+@benchmark("bulk_reviews")
+def bulk_reviews(iterations):
+    """
+    Review import/delete throughput with deferred rating recomputation, against
+    per-row saves that run the rating signal each time. `iterations` reviews are
+    written inside a transaction that is rolled back.
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+
+    from .models import Product, ProductRating, Review
+    from .ratings import delete_reviews, import_reviews
+
+    class Rollback(Exception):
+        pass
+
+    users_count = 1000
+    products_count = max(1, -(-iterations // users_count))
+    results = {"reviews": iterations, "products": products_count}
+    try:
+        with transaction.atomic():
+            User = get_user_model()
+            users = User.objects.bulk_create(
+                [User(username=f"bench-review-{i}", email=f"bench-review-{i}@example.com") for i in range(users_count)]
+            )
+            products = Product.objects.bulk_create(
+                [Product(name=f"bench-{i}", slug=f"bench-review-product-{i}", description="", price=100)
+                 for i in range(products_count)]
+            )
+            reviews = (
+                Review(product=products[i // users_count], user=users[i % users_count], rating=i % 5 + 1, review="")
+                for i in range(iterations)
+            )
+
+            start = time.perf_counter()
+            import_reviews(reviews)
+            elapsed = time.perf_counter() - start
+            results["import_per_s"] = round(iterations / elapsed)
+            assert ProductRating.objects.filter(product__in=products).count() == products_count
+
+            start = time.perf_counter()
+            delete_reviews(Review.objects.filter(product__in=products))
+            elapsed = time.perf_counter() - start
+            results["delete_per_s"] = round(iterations / elapsed)
+
+            # Per-row path on a sample, for comparison
+            sample = min(iterations, 1000)
+            start = time.perf_counter()
+            for i in range(sample):
+                Review.objects.create(product=products[0], user=users[i % users_count], rating=i % 5 + 1, review="")
+            results["per_row_save_per_s"] = round(sample / (time.perf_counter() - start))
+            raise Rollback
+    except Rollback:
+        pass
+    return results
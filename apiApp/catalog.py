@@ -0,0 +1,184 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Max, Min, Window
+from django.db.models.functions import RowNumber
+
+# Shared counter bumped on every product change; workers drop their snapshots when it moves.
+VERSION_KEY = "catalog:snapshot-version"
+VERSION_CHECK_SECONDS = 2
+# Upper bound on staleness if the cache backend isn't shared between workers.
+SNAPSHOT_MAX_AGE = 60
+
+
+class ProductSnapshot:
+    """The fields pricing and checkout need; `price_cents` is Product.price in minor units."""
+    __slots__ = ("id", "name", "slug", "price_cents", "image")
+
+    def __init__(self, id, name, slug, price_cents, image):
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.price_cents = price_cents
+        self.image = image
+
+    @classmethod
+    def from_values(cls, id, name, slug, price, image):
+        image_url = default_storage.url(str(image)) if image else None
+        return cls(id, name, slug, price, image_url)
+
+
+class SnapshotStore:
+    """Per-worker {product_id: ProductSnapshot}, filled lazily one query at a time."""
+
+    fields = ("id", "name", "slug", "price", "image")
+
+    def __init__(self):
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self.version = None
+        self._checked_at = 0.0
+        self._loaded_at = time.monotonic()
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        version = cache.get(VERSION_KEY, 0)
+        with self._lock:
+            self._checked_at = now
+            if version != self.version or now - self._loaded_at > SNAPSHOT_MAX_AGE:
+                self._snapshots = {}
+                self.version = version
+                self._loaded_at = now
+
+    def get_many(self, product_ids):
+        """{product_id: ProductSnapshot} for the given ids, loading any misses in one query."""
+        from .models import Product
+
+        self._sync()
+        snapshots = self._snapshots
+        missing = {product_id for product_id in product_ids if product_id not in snapshots}
+        if missing:
+            loaded = {
+                values[0]: ProductSnapshot.from_values(*values)
+                for values in Product.objects.filter(id__in=missing).values_list(*self.fields)
+            }
+            with self._lock:
+                self._snapshots.update(loaded)
+            snapshots = {**snapshots, **loaded}
+        return {product_id: snapshots[product_id] for product_id in product_ids if product_id in snapshots}
+
+    def get(self, product_id):
+        return self.get_many([product_id]).get(product_id)
+
+    def refresh(self, product):
+        snapshot = ProductSnapshot.from_values(*(getattr(product, field) for field in self.fields))
+        with self._lock:
+            self._snapshots[product.id] = snapshot
+        self.bump()
+
+    def discard(self, product_id):
+        with self._lock:
+            self._snapshots.pop(product_id, None)
+        self.bump()
+
+    def bump(self):
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 1, timeout=None)
+            version = cache.get(VERSION_KEY, 1)
+        # Our own snapshot already reflects this change; anyone else's is picked up by _sync().
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._snapshots = {}
+
+
+product_snapshots = SnapshotStore()
+
+
+def cart_lines(items):
+    """[(cart_item, snapshot)] for cart items, resolving every product in one lookup."""
+    items = list(items)
+    snapshots = product_snapshots.get_many({item.product_id for item in items})
+    return [(item, snapshots[item.product_id]) for item in items if item.product_id in snapshots]
+
+
+def cart_total_cents(items):
+    return sum(snapshot.price_cents * item.quantity for item, snapshot in cart_lines(items))
+
+
+# ----------------------------
+# Category navigation stats
+# ----------------------------
+# Best rated products kept on each category for navigation menus.
+TOP_RATED_PER_CATEGORY = 3
+
+
+def compute_category_stats(category_ids=None):
+    """
+    {category_id: {product_count, min_price, max_price, top_rated}} from two grouped queries.
+
+    With `category_ids=None` every category is computed.
+    """
+    from .models import Category, Product
+
+    products = Product.objects.all()
+    categories = Category.objects.all()
+    if category_ids is not None:
+        products = products.filter(category_id__in=category_ids)
+        categories = categories.filter(id__in=category_ids)
+
+    stats = {
+        category_id: {"product_count": 0, "min_price": None, "max_price": None, "top_rated": []}
+        for category_id in categories.values_list("id", flat=True)
+    }
+    totals = (
+        products.filter(category__isnull=False)
+        .values("category_id")
+        .annotate(product_count=Count("id"), min_price=Min("price"), max_price=Max("price"))
+    )
+    for row in totals:
+        stats[row.pop("category_id")].update(row)
+
+    ranked = (
+        products.filter(category__isnull=False, rating__total_reviews__gt=0)
+        .annotate(rank=Window(
+            RowNumber(),
+            partition_by=F("category_id"),
+            order_by=[F("rating__average_rating").desc(), F("id").asc()],
+        ))
+        .filter(rank__lte=TOP_RATED_PER_CATEGORY)
+        .order_by("category_id", "rank")
+        .values("category_id", "id", "name", "slug", "rating__average_rating")
+    )
+    for row in ranked:
+        stats[row["category_id"]]["top_rated"].append({
+            "id": row["id"],
+            "name": row["name"],
+            "slug": row["slug"],
+            "average_rating": row["rating__average_rating"],
+        })
+    return stats
+
+
+def refresh_category_stats(category_ids=None):
+    """Recompute and store the navigation stats for the given categories (all when None)."""
+    from .models import Category
+
+    if category_ids is not None:
+        category_ids = {category_id for category_id in category_ids if category_id is not None}
+        if not category_ids:
+            return 0
+    stats = compute_category_stats(category_ids)
+    categories = [Category(id=category_id, **values) for category_id, values in stats.items()]
+    Category.objects.bulk_update(
+        categories, ["product_count", "min_price", "max_price", "top_rated"], batch_size=500
+    )
+    return len(categories)
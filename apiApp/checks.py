@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+STRIPE_SETTINGS = ("STRIPE_SECRET_KEY", "STRIPE_PUBLIC_KEY", "STRIPE_WEBHOOK_SECRET")
+
+
+@register()
+def stripe_settings_check(app_configs, **kwargs):
+    missing = [name for name in STRIPE_SETTINGS if not getattr(settings, name, "")]
+    if not missing:
+        return []
+    return [
+        Warning(
+            f"Stripe is not configured: {', '.join(missing)} not set.",
+            hint="Checkout and the webhook will fail until these environment variables are set.",
+            id="apiApp.W001",
+        )
+    ]
+
+
+PER_PROCESS_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    backend = settings.CACHES["default"]["BACKEND"]
+    if settings.DEBUG or backend not in PER_PROCESS_CACHES:
+        return []
+    return [
+        Warning(
+            f"The default cache ({backend.rsplit('.', 1)[-1]}) is not shared between worker processes.",
+            hint="Set REDIS_URL. Until then throttle limits apply per worker and replica pins, "
+                 "cached pages and membership invalidations are not seen by other workers.",
+            id="apiApp.W002",
+        )
+    ]
@@ -0,0 +1,202 @@
+"""
+Streaming exports of orders, order items, reviews and carts for offline analysis.
+
+Rows are read in (created, id) order with QuerySet.iterator(), which uses a
+server-side cursor on PostgreSQL, and written to numbered part files as they
+arrive, so memory stays bounded by one chunk whatever the table size. Parts are
+Parquet when pyarrow is installed and gzip-compressed CSV otherwise.
+
+Each run records, per table, the last (created, id) it wrote in a watermark
+file next to the parts; an incremental run exports only rows after it. Rows
+newer than `settle_seconds` are left for the next run so checkouts still
+committing are not skipped past. Money columns are integer minor units.
+"""
+import csv
+import gzip
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Cart, Order, OrderItem, Review
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Optional; fall back to CSV
+    pyarrow = None
+
+WATERMARK_FILE = "_watermarks.json"
+
+
+@dataclass(frozen=True)
+class Table:
+    model: type
+    created: str  # Lookup ordering the export; also the watermark column
+    columns: tuple
+
+    def field(self, lookup):
+        model = self.model
+        *relations, name = lookup.split("__")
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+
+TABLES = {
+    # customer_email is left out; join on user_id where it's needed.
+    "orders": Table(Order, "created", (
+        "id", "created", "user_id", "amount", "currency", "status", "stripe_checkout_id",
+    )),
+    "order_items": Table(OrderItem, "order__created", (
+        "id", "order_id", "order__created", "product_id", "quantity", "unit_price",
+    )),
+    "reviews": Table(Review, "created", (
+        "id", "created", "updated", "product_id", "user_id", "rating", "review",
+    )),
+    "carts": Table(Cart, "created_at", ("id", "cart_code", "user_id", "created_at", "updated_at")),
+}
+
+
+# ----------------------------
+# Part writers
+# ----------------------------
+class CsvPart:
+    suffix = ".csv.gz"
+
+    def __init__(self, path, table):
+        self._file = gzip.open(path, "wt", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([column.replace("__", "_") for column in table.columns])
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+def _arrow_type(field):
+    if isinstance(field, models.ForeignKey):
+        field = field.target_field
+    if isinstance(field, models.DateTimeField):
+        return pyarrow.timestamp("us", tz="UTC")
+    if isinstance(field, models.DateField):
+        return pyarrow.date32()
+    if isinstance(field, (models.IntegerField, models.AutoField)):  # Includes MoneyField
+        return pyarrow.int64()
+    if isinstance(field, models.FloatField):
+        return pyarrow.float64()
+    if isinstance(field, models.BooleanField):
+        return pyarrow.bool_()
+    return pyarrow.string()
+
+
+class ParquetPart:
+    """Each written chunk becomes one row group."""
+    suffix = ".parquet"
+
+    def __init__(self, path, table):
+        # Declared from the model so an all-null chunk can't change a column's type.
+        self._schema = pyarrow.schema([
+            (column.replace("__", "_"), _arrow_type(table.field(column))) for column in table.columns
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_table(pyarrow.table(
+            {name: list(values) for name, values in zip(self._schema.names, columns)}, schema=self._schema
+        ))
+
+    def close(self):
+        self._writer.close()
+
+
+def part_writer(format="auto"):
+    if format == "parquet" or (format == "auto" and pyarrow is not None):
+        if pyarrow is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).")
+        return ParquetPart
+    return CsvPart
+
+
+# ----------------------------
+# Watermarks
+# ----------------------------
+def read_watermarks(directory):
+    try:
+        with open(os.path.join(directory, WATERMARK_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_watermarks(directory, watermarks):
+    path = os.path.join(directory, WATERMARK_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+# ----------------------------
+# Export
+# ----------------------------
+def export_table(name, directory, writer, after=None, chunk_size=10_000, rows_per_file=500_000,
+                 settle_seconds=60, using="default"):
+    """
+    Write `name`'s rows created after the `after` watermark ({"created", "id"})
+    to numbered parts under directory/name. Returns (rows, files, new watermark),
+    the watermark being `after` again when nothing was exported.
+    """
+    table = TABLES[name]
+    rows = table.model._base_manager.using(using).filter(
+        **{f"{table.created}__lte": timezone.now() - timedelta(seconds=settle_seconds)}
+    )
+    if after:
+        created = datetime.fromisoformat(after["created"])
+        rows = rows.filter(Q(**{f"{table.created}__gt": created}) | Q(**{table.created: created, "id__gt": after["id"]}))
+    rows = rows.order_by(table.created, "id").values_list(*table.columns).iterator(chunk_size=chunk_size)
+
+    out = os.path.join(directory, name)
+    os.makedirs(out, exist_ok=True)
+    # Down to microseconds so back-to-back runs do not overwrite each other's parts.
+    run = timezone.now().strftime("%Y%m%dT%H%M%S%f")
+    created_at, id_at = table.columns.index(table.created), table.columns.index("id")
+
+    total, files, last, part = 0, [], None, None
+
+    def finish():
+        # Parts appear under their final name only once complete.
+        part.close()
+        os.replace(path + ".tmp", path)
+        files.append(path)
+
+    try:
+        while chunk := list(islice(rows, chunk_size)):
+            if part is None:
+                path = os.path.join(out, f"{run}-{len(files):05d}{writer.suffix}")
+                part, part_rows = writer(path + ".tmp", table), 0
+            part.write(chunk)
+            part_rows += len(chunk)
+            total += len(chunk)
+            last = chunk[-1]
+            if part_rows >= rows_per_file:
+                finish()
+                part = None
+        if part is not None:
+            finish()
+    except BaseException:
+        if part is not None:
+            part.close()
+            os.remove(path + ".tmp")
+        raise
+
+    if last is None:
+        return 0, [], after
+    return total, files, {"created": last[created_at].isoformat(), "id": last[id_at]}
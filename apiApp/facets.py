@@ -0,0 +1,167 @@
+"""
+Faceted product filtering.
+
+Facets are disjunctive: the counts for one dimension are computed with every
+filter applied except that dimension's own, so picking "Books" still shows how
+many products the other categories would add. Each dimension is one grouped or
+conditional-aggregate query, so a request costs a fixed handful of queries
+however large the catalogue is.
+"""
+import math
+
+from django.db.models import Count, F, Max, Min, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Product
+from .money import format_minor, to_minor
+
+# Bucket edges in minor units; the last bucket is open-ended.
+PRICE_BUCKETS = [0, 2500, 5000, 10000, 25000, 50000]
+RATING_THRESHOLDS = [4, 3, 2, 1]
+SORTS = {
+    "price": [F("price").asc(), F("id").asc()],
+    "-price": [F("price").desc(), F("id").desc()],
+    "rating": [F("rating__average_rating").desc(nulls_last=True), F("id").desc()],
+    "newest": [F("id").desc()],
+}
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+# Deepest row a page may start at; OFFSET scans every skipped row.
+MAX_OFFSET = 10_000
+
+
+class ProductFilters:
+    """Parsed filter query parameters, each kept as its own Q so facets can leave one out."""
+
+    def __init__(self, params):
+        self.q = {}
+        categories = [slug for slug in params.get("category", "").split(",") if slug]
+        if categories:
+            self.q["category"] = Q(category__slug__in=categories)
+
+        price = Q()
+        if params.get("min_price"):
+            price &= Q(price__gte=self._money(params, "min_price"))
+        if params.get("max_price"):
+            price &= Q(price__lte=self._money(params, "max_price"))
+        if price:
+            self.q["price"] = price
+
+        if params.get("min_rating"):
+            self.q["rating"] = Q(rating__average_rating__gte=self._number(params, "min_rating"))
+
+        featured = params.get("featured")
+        if featured in ("true", "false"):
+            self.q["featured"] = Q(featured=featured == "true")
+        elif featured:
+            raise ValidationError({"featured": "Expected true or false."})
+
+        self.sort = params.get("sort", "newest")
+        if self.sort not in SORTS:
+            raise ValidationError({"sort": f"Expected one of {', '.join(SORTS)}."})
+
+    @staticmethod
+    def _money(params, name):
+        try:
+            return to_minor(params[name])
+        except ValueError:
+            raise ValidationError({name: "Expected an amount such as 12.50."})
+
+    @staticmethod
+    def _number(params, name):
+        try:
+            value = float(params[name])
+        except ValueError:
+            value = math.nan
+        if not math.isfinite(value):
+            raise ValidationError({name: "Expected a number."})
+        return value
+
+    def queryset(self, exclude=None):
+        condition = Q()
+        for dimension, q in self.q.items():
+            if dimension != exclude:
+                condition &= q
+        return Product.objects.filter(condition)
+
+
+def category_facet(filters):
+    rows = (
+        filters.queryset(exclude="category")
+        .filter(category__isnull=False)
+        .values("category__slug", "category__name")
+        .annotate(count=Count("id"))
+        .order_by("-count", "category__name")
+    )
+    return [
+        {"slug": row["category__slug"], "name": row["category__name"], "count": row["count"]}
+        for row in rows
+    ]
+
+
+def price_facet(filters):
+    edges = PRICE_BUCKETS + [None]
+    aggregates = {"lowest": Min("price"), "highest": Max("price")}
+    for index, (low, high) in enumerate(zip(edges, edges[1:])):
+        bucket = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f"bucket_{index}"] = Count("id", filter=bucket)
+    totals = filters.queryset(exclude="price").aggregate(**aggregates)
+    return {
+        "min": format_minor(totals["lowest"]) if totals["lowest"] is not None else None,
+        "max": format_minor(totals["highest"]) if totals["highest"] is not None else None,
+        "buckets": [
+            {
+                "min": format_minor(low),
+                "max": format_minor(high) if high is not None else None,
+                "count": totals[f"bucket_{index}"],
+            }
+            for index, (low, high) in enumerate(zip(edges, edges[1:]))
+        ],
+    }
+
+
+def rating_facet(filters):
+    totals = filters.queryset(exclude="rating").aggregate(**{
+        f"at_least_{threshold}": Count("id", filter=Q(rating__average_rating__gte=threshold))
+        for threshold in RATING_THRESHOLDS
+    })
+    return [
+        {"min_rating": threshold, "count": totals[f"at_least_{threshold}"]}
+        for threshold in RATING_THRESHOLDS
+    ]
+
+
+def featured_facet(filters):
+    totals = filters.queryset(exclude="featured").aggregate(
+        featured_count=Count("id", filter=Q(featured=True)),
+        other_count=Count("id", filter=Q(featured=False)),
+    )
+    return {"true": totals["featured_count"], "false": totals["other_count"]}
+
+
+def filter_products(params):
+    """
+    Return (products, total, facets) for the query parameters.
+
+    `products` is the requested page, sorted; `total` counts the full result set.
+    """
+    filters = ProductFilters(params)
+    try:
+        page = max(int(params.get("page", 1)), 1)
+        page_size = min(max(int(params.get("page_size", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValidationError({"page": "page and page_size must be integers."})
+
+    offset = (page - 1) * page_size
+    if offset > MAX_OFFSET:
+        raise ValidationError({"page": f"Pages must start within the first {MAX_OFFSET} results; narrow the filters."})
+
+    results = filters.queryset()
+    products = list(results.order_by(*SORTS[filters.sort])[offset:offset + page_size])
+    facets = {
+        "category": category_facet(filters),
+        "price": price_facet(filters),
+        "rating": rating_facet(filters),
+        "featured": featured_facet(filters),
+    }
+    return products, results.count(), facets
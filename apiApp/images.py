@@ -0,0 +1,79 @@
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def render_variants(data):
+    """
+    Resize raw image bytes to every width/format pair.
+
+    Runs inside worker processes, so it only touches Pillow. Images are never
+    upscaled; widths larger than the original collapse onto the original width.
+    Returns a list of (format, width, bytes).
+    """
+    from PIL import Image, ImageOps  # Only image workers pay for importing Pillow
+
+    rendered = []
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for fmt, (pil_format, options) in VARIANT_FORMATS.items():
+                frame = resized.convert("RGB") if fmt == "jpeg" or resized.mode not in ("RGB", "RGBA") else resized
+                buffer = BytesIO()
+                frame.save(buffer, pil_format, **options)
+                rendered.append((fmt, width, buffer.getvalue()))
+    return rendered
+
+
+def store_variants(source_name, rendered):
+    """Save rendered variants under content-hashed names and return the variant map."""
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    variants = {"source": source_name}
+    for fmt, width, data in rendered:
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        name = posixpath.join(directory, "variants", f"{stem}-{width}w-{digest}.{fmt}")
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(data))
+        variants.setdefault(fmt, {})[str(width)] = name
+    return variants
+
+
+def needs_variants(instance):
+    return bool(instance.image) and instance.image_variants.get("source") != instance.image.name
+
+
+def read_image(instance):
+    with instance.image.open("rb") as image_file:
+        return image_file.read()
+
+
+def save_variants(model, pk, source_name, rendered):
+    variants = store_variants(source_name, rendered)
+    # update() rather than save() so post_save doesn't schedule the work again.
+    model.objects.filter(pk=pk, image=source_name).update(image_variants=variants)
+    return variants
+
+
+def variant_srcsets(variants):
+    """{"webp": "url 320w, url 640w", ...} for use in <img srcset> / <source srcset>."""
+    return {
+        fmt: ", ".join(
+            f"{default_storage.url(name)} {width}w"
+            for width, name in sorted(variants[fmt].items(), key=lambda item: int(item[0]))
+        )
+        for fmt in VARIANT_FORMATS
+        if variants.get(fmt)
+    }
@@ -0,0 +1,211 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockReservation, StockShard
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_name):
+        super().__init__(f"{product_name} is out of stock")
+        self.product_name = product_name
+
+
+def reservation_ttl():
+    return timedelta(minutes=getattr(settings, "STOCK_RESERVATION_MINUTES", 35))
+
+
+def take_stock(product, quantity):
+    """
+    Atomically remove `quantity` units. Returns the [(shard, units)] they came
+    from, shard None meaning Product.stock.
+
+    Each single-counter decrement is one conditional UPDATE, so concurrent
+    buyers can't take a counter below zero. Sharded products start at a random
+    shard and move on until one holds enough units, then try Product.stock,
+    then take the quantity from several counters at once.
+    """
+    if product.stock_shards:
+        start = random.randrange(product.stock_shards)
+        for offset in range(product.stock_shards):
+            shard = (start + offset) % product.stock_shards
+            updated = StockShard.objects.filter(
+                product_id=product.id, shard=shard, quantity__gte=quantity
+            ).update(quantity=F("quantity") - quantity)
+            if updated:
+                return [(shard, quantity)]
+
+    updated = Product.objects.filter(id=product.id, stock__gte=quantity).update(stock=F("stock") - quantity)
+    if updated:
+        return [(None, quantity)]
+    if product.stock_shards:
+        return _take_across_shards(product, quantity)
+    raise OutOfStock(product.name)
+
+
+@transaction.atomic
+def _take_across_shards(product, quantity):
+    """Take `quantity` from the combined total of the shards and Product.stock, none holding enough alone."""
+    # Product first, then shards in shard order, so two takers can't deadlock.
+    stock = Product.objects.select_for_update().filter(id=product.id).values_list("stock", flat=True).first()
+    shards = list(
+        StockShard.objects.select_for_update().filter(product_id=product.id, quantity__gt=0)
+        .order_by("shard").values_list("shard", "quantity")
+    )
+    if (stock or 0) + sum(units for _, units in shards) < quantity:
+        raise OutOfStock(product.name)
+
+    taken = []
+    for shard, units in [*shards, (None, stock or 0)]:
+        units = min(units, quantity - sum(part for _, part in taken))
+        if units <= 0:
+            break
+        if shard is None:
+            Product.objects.filter(id=product.id).update(stock=F("stock") - units)
+        else:
+            StockShard.objects.filter(product_id=product.id, shard=shard).update(quantity=F("quantity") - units)
+        taken.append((shard, units))
+    return taken
+
+
+def return_stock(product_id, quantity, shard=None):
+    if shard is not None:
+        updated = StockShard.objects.filter(product_id=product_id, shard=shard).update(
+            quantity=F("quantity") + quantity
+        )
+        if updated:
+            return
+    # Unsharded, or the shard was removed by a reshard since the units were taken.
+    Product.objects.filter(id=product_id, stock__isnull=False).update(stock=F("stock") + quantity)
+
+
+def is_tracked(product):
+    return product.stock is not None
+
+
+def available_stock(product):
+    if not is_tracked(product):
+        return None
+    return product.stock + (product.shards.aggregate(total=Sum("quantity"))["total"] or 0)
+
+
+def _locked(queryset):
+    # Let the sweeper and fulfillment skip each other's rows instead of waiting on PostgreSQL.
+    if connection.features.has_select_for_update_skip_locked:
+        return queryset.select_for_update(skip_locked=True)
+    return queryset.select_for_update()
+
+
+def _release(reservations):
+    released = 0
+    for reservation in reservations:
+        return_stock(reservation.product_id, reservation.quantity, reservation.shard)
+        reservation.delete()
+        released += 1
+    return released
+
+
+@transaction.atomic
+def reserve_cart(cart):
+    """Hold stock for every tracked line of `cart`. Returns the reservation expiry."""
+    _release(_locked(StockReservation.objects.filter(cart_code=cart.cart_code)))
+
+    expires_at = timezone.now() + reservation_ttl()
+    reservations = []
+    # In product order, so carts sharing products lock their counters in the same order.
+    for item in cart.cartitems.select_related("product").order_by("product_id"):
+        if not is_tracked(item.product):
+            continue
+        for shard, units in take_stock(item.product, item.quantity):
+            reservations.append(StockReservation(
+                product=item.product, cart_code=cart.cart_code, quantity=units,
+                shard=shard, expires_at=expires_at
+            ))
+    StockReservation.objects.bulk_create(reservations)
+    return expires_at
+
+
+@transaction.atomic
+def release_cart(cart_code):
+    return _release(_locked(StockReservation.objects.filter(cart_code=cart_code)))
+
+
+@transaction.atomic
+def commit_cart(cart):
+    """
+    Turn a paid cart's reservations into sold stock. Returns {product_id: units}
+    that couldn't be supplied.
+
+    Reserved units the cart no longer needs (a line was reduced or removed
+    after checkout) go back to stock. Lines without a reservation (expired,
+    or orders created without checkout) are decremented now; what's out of
+    stock by then is returned as a shortfall rather than oversold.
+    """
+    needed = {}
+    items = list(cart.cartitems.select_related("product").order_by("product_id"))
+    for item in items:
+        needed[item.product_id] = needed.get(item.product_id, 0) + item.quantity
+
+    reservations = _locked(StockReservation.objects.filter(cart_code=cart.cart_code)).order_by("product_id", "id")
+    for reservation in reservations:
+        used = min(reservation.quantity, needed.get(reservation.product_id, 0))
+        if used < reservation.quantity:
+            return_stock(reservation.product_id, reservation.quantity - used, reservation.shard)
+        needed[reservation.product_id] = needed.get(reservation.product_id, 0) - used
+        reservation.delete()
+
+    shortfall = {}
+    for item in items:
+        missing = needed.pop(item.product_id, 0)
+        if missing > 0 and is_tracked(item.product):
+            try:
+                take_stock(item.product, missing)
+            except OutOfStock:
+                shortfall[item.product_id] = missing
+    return shortfall
+
+
+def adjust_stock(product, change):
+    """Add `change` units (remove them when negative) without overwriting concurrent sales."""
+    if change > 0:
+        Product.objects.filter(id=product.id).update(stock=Coalesce(F("stock"), 0) + change)
+    elif change < 0:
+        take_stock(product, -change)
+
+
+def release_expired_reservations(batch_size=500):
+    """Return stock held by expired reservations. Returns how many were released."""
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = _locked(StockReservation.objects.filter(expires_at__lte=timezone.now()))[:batch_size]
+            count = _release(list(expired))
+        released += count
+        if count < batch_size:
+            return released
+
+
+@transaction.atomic
+def reshard_stock(product, shards):
+    """Spread a product's stock over `shards` counters (0 folds it back into Product.stock)."""
+    product = Product.objects.select_for_update().get(pk=product.pk)
+    if product.stock is None:
+        raise ValueError("Untracked products can't be sharded")
+    total = product.stock + (product.shards.aggregate(total=Sum("quantity"))["total"] or 0)
+    product.shards.all().delete()
+    if shards:
+        StockShard.objects.bulk_create(
+            StockShard(product=product, shard=i, quantity=total // shards + (1 if i < total % shards else 0))
+            for i in range(shards)
+        )
+        product.stock = 0
+    else:
+        product.stock = total
+    product.stock_shards = shards
+    product.save(update_fields=["stock", "stock_shards"])
+    return product
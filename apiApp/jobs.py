@@ -0,0 +1,63 @@
+"""Deferred work run by `manage.py run_worker`; see apiApp.tasks."""
+import logging
+
+from django.apps import apps
+from django.http import Http404
+
+from . import inventory, ratings, response_cache
+from .images import read_image, render_variants, save_variants
+from .models import Order
+from .tasks import task
+from .tracing import KIND_CLIENT, span
+
+logger = logging.getLogger(__name__)
+
+
+@task(name="recompute_ratings")
+def recompute_ratings(product_ids):
+    ratings.recompute_product_ratings(product_ids)
+
+
+@task(name="fulfill_checkout", max_attempts=5, retry_delay=60)
+def fulfill_checkout_session(session_id, cart_code):
+    """
+    Fetch a paid Stripe session and turn the cart into an order (idempotent per session).
+
+    A session that already has an order, or whose cart is gone, is logged and
+    finished rather than failed: retrying can't change either.
+    """
+    from .payments import paid_unit_prices, stripe_client
+    from .views import fulfill_checkout
+
+    with span("checkout.fulfill_task", {"checkout.id": session_id}, trace_key=cart_code):
+        if Order.objects.filter(stripe_checkout_id=session_id).exists():
+            logger.info("Checkout already fulfilled", extra={"checkout_id": session_id})
+            return
+        with span("stripe.checkout.session.retrieve", kind=KIND_CLIENT):
+            session = stripe_client().checkout.Session.retrieve(session_id, expand=["customer_details"])
+        with span("stripe.checkout.session.list_line_items", kind=KIND_CLIENT):
+            unit_prices = paid_unit_prices(session_id)
+        try:
+            fulfill_checkout(session, cart_code, unit_prices)
+        except Http404:
+            logger.error("Paid checkout has no cart", extra={"checkout_id": session_id, "cart_code": cart_code})
+
+
+@task(name="render_image_variants")
+def render_image_variants(model, pk, source):
+    """Render variants for the image `source` of the `model` ("app_label.Model") row `pk`, if it's still current."""
+    model = apps.get_model(model)
+    instance = model.objects.filter(pk=pk, image=source).first()
+    if instance is not None:
+        save_variants(model, pk, source, render_variants(read_image(instance)))
+
+
+@task(name="release_expired_reservations")
+def release_expired_reservations():
+    inventory.release_expired_reservations()
+
+
+@task(name="warm_cache")
+def warm_cache():
+    """Only useful with a shared cache backend; add it to TASK_SCHEDULE when one is configured."""
+    response_cache.warm()
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apiApp.analytics import rebuild_days
+from apiApp.models import Order
+
+
+def _date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups from orders, one chunk of days per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=_date, help="First day (YYYY-MM-DD); default: the first order.")
+        parser.add_argument("--until", type=_date, help="Last day (YYYY-MM-DD); default: the last order.")
+        parser.add_argument("--chunk-days", type=int, default=31)
+
+    def handle(self, *args, **options):
+        bounds = Order.objects.aggregate(first=Min("created"), last=Max("created"))
+        if bounds["first"] is None and not (options["since"] and options["until"]):
+            self.stdout.write("No orders to backfill.")
+            return
+        start = options["since"] or timezone.localdate(bounds["first"])
+        end = options["until"] or timezone.localdate(bounds["last"])
+        if start > end:
+            raise CommandError("--since must not be after --until.")
+        if options["chunk_days"] < 1:
+            raise CommandError("--chunk-days must be at least 1.")
+
+        orders = 0
+        while start <= end:
+            chunk_end = min(start + timedelta(days=options["chunk_days"] - 1), end)
+            orders += rebuild_days(start, chunk_end)
+            self.stdout.write(f"{start}..{chunk_end}: {orders} orders so far")
+            start = chunk_end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollups from {orders} orders."))
@@ -0,0 +1,49 @@
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apiApp.benchmarks import BENCHMARKS
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Run micro-benchmarks (all of them unless names are given)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help=f"Benchmarks to run: {', '.join(sorted(BENCHMARKS))}")
+        parser.add_argument("--iterations", type=int, default=100_000)
+        parser.add_argument(
+            "--record", nargs="?", const="benchmark-results.jsonl", metavar="PATH",
+            help="Append results as JSON lines (with timestamp and git commit) to track them over time."
+        )
+
+    def handle(self, *args, **options):
+        names = options["names"] or sorted(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        commit = current_commit() if options["record"] else None
+        for name in names:
+            results = BENCHMARKS[name](options["iterations"])
+            summary = ", ".join(f"{key}={value}" for key, value in results.items())
+            self.stdout.write(f"{name}: {summary}")
+            if options["record"]:
+                with open(options["record"], "a", encoding="utf-8") as f:
+                    f.write(json.dumps({
+                        "benchmark": name,
+                        "recorded_at": timezone.now().isoformat(),
+                        "commit": commit,
+                        "iterations": options["iterations"],
+                        "results": results,
+                    }) + "\n")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apiApp.recommendations import SIMILAR_PRODUCTS_LIMIT, rebuild_similar_products
+
+
+class Command(BaseCommand):
+    help = "Precompute the top similar products for every product."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=SIMILAR_PRODUCTS_LIMIT, help="Neighbours kept per product")
+        parser.add_argument(
+            "--batch-size", type=int,
+            help="Products whose co-occurrence is held in memory at once (default: all); "
+                 "each batch re-reads the baskets",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] is not None and options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        rows = rebuild_similar_products(limit=options["limit"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Stored {rows} similar product rows."))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apiApp.models import Review
+from apiApp.ratings import BATCH_SIZE, delete_reviews
+
+
+class Command(BaseCommand):
+    help = "Bulk-delete reviews (e.g. spam) by author, product or id, then recompute the affected ratings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", default=[], help="Author id (repeatable).")
+        parser.add_argument("--product", action="append", default=[], help="Product slug (repeatable).")
+        parser.add_argument("--ids-file", help="File with one review id per line.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not (options["user"] or options["product"] or options["ids_file"]):
+            raise CommandError("Give at least one of --user, --product or --ids-file.")
+
+        reviews = Review.objects.all()
+        if options["user"]:
+            reviews = reviews.filter(user_id__in=options["user"])
+        if options["product"]:
+            reviews = reviews.filter(product__slug__in=options["product"])
+        if options["ids_file"]:
+            with open(options["ids_file"], encoding="utf-8") as f:
+                reviews = reviews.filter(id__in=[int(line) for line in f if line.strip()])
+
+        start = time.perf_counter()
+        deleted = delete_reviews(reviews, batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} reviews in {elapsed:.1f}s."))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apiApp.query_plans import endpoint_requests, seed, sequential_scans
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Call each endpoint against seeded rows, EXPLAIN the queries it ran and report sequential scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=100, help="Rows seeded per table (rolled back afterwards)")
+        parser.add_argument("--fail-on-scan", action="store_true", help="Exit non-zero if any query scans a table")
+
+    def handle(self, *args, **options):
+        if options["seed"] < 1:
+            raise CommandError("--seed must be at least 1.")
+        try:
+            with transaction.atomic():
+                requests = endpoint_requests(*seed(options["seed"]))
+                if connection.vendor == "postgresql":
+                    # Small tables are cheaper to scan; disable seq scans so only missing indexes show up.
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL enable_seqscan = off")
+                        cursor.execute("ANALYZE")
+                try:
+                    scans = sequential_scans(requests)
+                except ValueError as e:
+                    raise CommandError(str(e))
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        for label, found in scans.items():
+            self.stdout.write(self.style.WARNING(f"{label}: sequential scan on {', '.join(t for t, _, _ in found)}"))
+            if options["verbosity"] > 1:
+                for _, sql, plan in found:
+                    self.stdout.write(f"  {sql}\n  {plan}\n")
+        if scans and options["fail_on_scan"]:
+            raise CommandError(f"{len(scans)} endpoints use sequential scans.")
+        if not scans:
+            self.stdout.write(self.style.SUCCESS("No sequential scans found."))
@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from apiApp.images import needs_variants, read_image, render_variants, save_variants
+from apiApp.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = "Render resized WebP/JPEG variants for existing product and category images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+        parser.add_argument("--force", action="store_true", help="Re-render images that already have variants")
+        parser.add_argument("--batch-size", type=int, default=32, help="Images read into memory at a time")
+
+    def handle(self, *args, **options):
+        pending = [
+            instance
+            for model in (Product, Category)
+            for instance in model.objects.exclude(image="").exclude(image__isnull=True).iterator()
+            if options["force"] or needs_variants(instance)
+        ]
+        if not pending:
+            self.stdout.write("All images already have variants.")
+            return
+
+        batch_size = options["batch_size"]
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            # Work in batches so only a bounded number of source images is held in memory.
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                images = [read_image(instance) for instance in batch]
+                for instance, rendered in zip(batch, pool.map(render_variants, images)):
+                    save_variants(type(instance), instance.pk, instance.image.name, rendered)
+                    self.stdout.write(f"{type(instance).__name__} {instance.pk}: {len(rendered)} variants")
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered variants for {len(pending)} images."))
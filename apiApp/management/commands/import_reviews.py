@@ -0,0 +1,50 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+
+from apiApp.models import Review
+from apiApp.ratings import BATCH_SIZE, import_reviews
+
+
+def read_reviews(path, errors):
+    """Reviews from the CSV at `path`; malformed rows are reported in `errors` and skipped."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                rating = int(row["rating"])
+                if not 1 <= rating <= 5:
+                    raise ValueError(f"rating {rating} is outside 1-5")
+                yield Review(
+                    product_id=int(row["product_id"]),
+                    user_id=int(row["user_id"]),
+                    rating=rating,
+                    review=row.get("review", ""),
+                )
+            except (KeyError, ValueError) as e:
+                errors.append(f"{path}:{line}: {e}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import reviews from a CSV with product_id,user_id,rating,review columns. "
+        "Reviews duplicating an existing (user, product) pair are skipped; "
+        "invalid rows are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        errors = []
+        count, skipped = import_reviews(read_reviews(options["path"], errors), batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - start
+        errors += [f"product_id={review.product_id} user_id={review.user_id}: {reason}" for review, reason in skipped]
+        for error in errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {count} reviews in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f}/s); "
+            f"skipped {len(errors)} invalid rows."
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apiApp.recommendations import MAX_TRACKED_PAIRS, mine_bought_together
+
+
+class Command(BaseCommand):
+    help = "Mine 'frequently bought together' associations from order history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rebuild from all orders instead of new ones only")
+        parser.add_argument("--max-pairs", type=int, default=MAX_TRACKED_PAIRS, help="Pairs tracked before pruning")
+        parser.add_argument(
+            "--settle-seconds", type=int, default=60, help="Leave orders newer than this for the next run"
+        )
+
+    def handle(self, *args, **options):
+        orders = mine_bought_together(
+            full=options["full"], max_pairs=options["max_pairs"], settle_seconds=options["settle_seconds"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Processed {orders} orders."))
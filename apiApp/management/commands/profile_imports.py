@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def parse_importtime(output):
+    """[(module, self_us, cumulative_us)] from `python -X importtime` stderr."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Import the WSGI application in a fresh interpreter under -X importtime and summarise the slowest modules."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--module", default=settings.WSGI_APPLICATION.rsplit(".", 1)[0],
+            help="Module to import (default: the WSGI application module)."
+        )
+        parser.add_argument("--top", type=int, default=20)
+        parser.add_argument(
+            "--by", choices=["package", "self", "cumulative"], default="package",
+            help="Rank top-level packages by total self time, or single modules by self or cumulative time."
+        )
+
+    def handle(self, *args, **options):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE)}
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {options['module']}"],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        rows = parse_importtime(result.stderr)
+        total_us = sum(self_us for _, self_us, _ in rows)
+
+        if options["by"] == "package":
+            packages = defaultdict(lambda: [0, 0])
+            for module, self_us, _ in rows:
+                package = packages[module.split(".")[0]]
+                package[0] += self_us
+                package[1] += 1
+            ranked = sorted(packages.items(), key=lambda item: item[1][0], reverse=True)
+            lines = [f"{us / 1000:9.1f} ms  {name} ({count} modules)" for name, (us, count) in ranked]
+        else:
+            column = 1 if options["by"] == "self" else 2
+            ranked = sorted(rows, key=lambda row: row[column], reverse=True)
+            lines = [f"{row[column] / 1000:9.1f} ms  {row[0]}" for row in ranked]
+
+        self.stdout.write(f"Importing {options['module']}: {total_us / 1000:.1f} ms across {len(rows)} modules")
+        for line in lines[:options["top"]]:
+            self.stdout.write(line)
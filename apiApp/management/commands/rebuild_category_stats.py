@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apiApp.catalog import refresh_category_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute product counts, price ranges and top rated products for every category."
+
+    def handle(self, *args, **options):
+        count = refresh_category_stats()
+        self.stdout.write(self.style.SUCCESS(f"Updated {count} categories."))
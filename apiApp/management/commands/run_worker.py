@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from apiApp.tasks import (
+    claim_tasks, enqueue_periodic, prune_finished_tasks, requeue_stale_tasks, run_task, task_stats
+)
+
+logger = logging.getLogger("apiApp.tasks")
+
+HOUSEKEEPING_SECONDS = 60
+
+
+class Shutdown:
+    """Set from signal handlers. Event.set() can't be used there: it deadlocks if the handler interrupts Event.wait()."""
+    requested = False
+
+    @classmethod
+    def request(cls, signum, frame):
+        cls.requested = True
+
+
+def work(worker_id, stop, batch_size, poll_interval, once=False):
+    """Claim and run due tasks until `stop` is set (or, with once, until none are due)."""
+    if not once:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent turns Ctrl-C into `stop`
+        signal.signal(signal.SIGTERM, Shutdown.request)
+    processed = 0
+    while not (stop.is_set() or Shutdown.requested):
+        claimed = claim_tasks(worker_id, batch_size)
+        for claimed_task in claimed:
+            run_task(claimed_task)
+        processed += len(claimed)
+        close_old_connections()
+        if not claimed:
+            if once:
+                break
+            stop.wait(poll_interval)
+    return processed
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the database queue in worker processes, plus periodic tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=2, help="Worker processes (tasks run concurrently)")
+        parser.add_argument("--batch-size", type=int, default=1, help="Tasks a worker claims per poll")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds an idle worker waits")
+        parser.add_argument("--once", action="store_true", help="Run due tasks in this process, then exit")
+        parser.add_argument("--stats", action="store_true", help="Print queue metrics and exit")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            return self.print_stats()
+        worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        if options["once"]:
+            stop = multiprocessing.Event()
+            enqueue_periodic(settings.TASK_SCHEDULE, {})
+            processed = work(worker_prefix, stop, options["batch_size"], 0, once=True)
+            self.stdout.write(self.style.SUCCESS(f"Ran {processed} tasks."))
+            return
+
+        context = multiprocessing.get_context("fork")
+        stop = context.Event()
+        for handled in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(handled, Shutdown.request)
+
+        def start(index):
+            connections.close_all()  # Children must open their own connections
+            process = context.Process(
+                target=work, name=f"task-worker-{index}",
+                args=(f"{worker_prefix}/{index}", stop, options["batch_size"], options["poll_interval"]),
+            )
+            process.start()
+            return process
+
+        workers = [start(index) for index in range(options["processes"])]
+        logger.info("Task workers started", extra={"processes": len(workers)})
+        last_enqueued, last_housekeeping = {}, 0.0
+        try:
+            while not Shutdown.requested:
+                enqueue_periodic(settings.TASK_SCHEDULE, last_enqueued)
+                if time.monotonic() - last_housekeeping > HOUSEKEEPING_SECONDS:
+                    last_housekeeping = time.monotonic()
+                    requeued, failed = requeue_stale_tasks(settings.TASK_STALE_SECONDS)
+                    if requeued or failed:
+                        logger.warning("Stale tasks taken back", extra={"requeued": requeued, "failed": failed})
+                    prune_finished_tasks(settings.TASK_RETENTION_DAYS)
+                    stats, oldest_wait = task_stats()
+                    logger.info("Task queue", extra={"tasks": stats, "oldest_due_seconds": round(oldest_wait, 1)})
+                for index, process in enumerate(workers):
+                    if not process.is_alive():
+                        logger.warning("Task worker exited; restarting", extra={"exitcode": process.exitcode})
+                        workers[index] = start(index)
+                close_old_connections()
+                time.sleep(options["poll_interval"])
+        finally:
+            stop.set()
+            for process in workers:
+                process.join()
+        self.stdout.write("Task workers stopped.")
+
+    def print_stats(self):
+        stats, oldest_wait = task_stats()
+        for name, counts in sorted(stats.items()):
+            summary = ", ".join(f"{key}={value}" for key, value in sorted(counts.items()))
+            self.stdout.write(f"{name}: {summary}")
+        self.stdout.write(f"Oldest due task has waited {oldest_wait:.1f}s.")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apiApp.inventory import reshard_stock
+from apiApp.models import Product
+
+
+class Command(BaseCommand):
+    help = "Split a hot product's stock across several counter rows (0 shards merges them back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("slug")
+        parser.add_argument("--shards", type=int, required=True)
+
+    def handle(self, *args, **options):
+        try:
+            product = reshard_stock(Product.objects.get(slug=options["slug"]), options["shards"])
+        except (Product.DoesNotExist, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"{product.name} now uses {product.stock_shards} stock shards."))
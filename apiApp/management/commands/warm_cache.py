@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apiApp.response_cache import warm
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute cached product/category detail responses: the busiest products by recent order and "
+        "cart activity, and every category. Needs a cache backend shared with the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=None, help="Products to warm (default: RESPONSE_CACHE_WARM_PRODUCTS)")
+        parser.add_argument("--days", type=int, default=7, help="Activity window used to rank products")
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--db-concurrency", type=int, default=4, help="Pages computed against the database at once")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        products, categories = warm(
+            top_products=options["top"], threads=options["threads"],
+            db_concurrency=options["db_concurrency"], days=options["days"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {products} product and {categories} category pages in {time.perf_counter() - start:.1f}s."
+        ))
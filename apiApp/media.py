@@ -0,0 +1,125 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified,
+    HttpResponseRedirect, StreamingHttpResponse
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+# Names produced by apiApp.images carry a content hash, so they never change.
+HASHED_NAME = re.compile(r"-[0-9a-f]{12}\.[a-z0-9]+$")
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+DEFAULT_CACHE = "public, max-age=86400"
+
+CHUNK_SIZE = 64 * 1024
+
+
+def cache_control_for(name):
+    return IMMUTABLE_CACHE if HASHED_NAME.search(name) else DEFAULT_CACHE
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _byte_range(header, size):
+    """
+    Parse a single `bytes=` range into (start, end) inclusive.
+
+    Returns None for a header this server doesn't handle (several ranges, other
+    units, malformed), which RFC 9110 says to ignore and answer in full. Raises
+    RangeNotSatisfiable for a valid range outside the file.
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve uploaded media with validators, long-lived caching and range support.
+
+    Full responses go through FileResponse so the WSGI server can use
+    sendfile(). When media lives in object storage, clients are redirected to it.
+    """
+    if not isinstance(default_storage, FileSystemStorage):
+        return HttpResponseRedirect(default_storage.url(path))
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("Media file not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Media file not found")
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": cache_control_for(path),
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("If-None-Match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = _byte_range(range_header, stat.st_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+    if byte_range is not None:
+        start, end = byte_range
+        content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        response = StreamingHttpResponse(
+            _read_range(full_path, start, end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Length"] = end - start + 1
+    else:
+        response = FileResponse(open(full_path, "rb"))
+
+    for name, value in headers.items():
+        response[name] = value
+    return response
@@ -0,0 +1,62 @@
+from django.core.cache import cache
+
+from .models import Cart, Wishlist
+
+# Backstop expiry; writes delete the shared entry so every worker sees them at once.
+MEMBERSHIP_TTL = 60 * 60
+
+
+class MembershipCache:
+    """{key: list of product ids} in the shared cache, so an invalidation reaches every worker."""
+
+    def __init__(self, prefix, ttl=MEMBERSHIP_TTL):
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key):
+        return f"membership:{self.prefix}:{key}"
+
+    def get(self, key):
+        product_ids = cache.get(self._key(key))
+        return None if product_ids is None else frozenset(product_ids)
+
+    def set(self, key, product_ids):
+        cache.set(self._key(key), sorted(product_ids), timeout=self.ttl)
+
+    def invalidate(self, key):
+        cache.delete(self._key(key))
+
+
+wishlist_cache = MembershipCache("wishlist")
+cart_cache = MembershipCache("cart")
+
+
+def _cart_code_key(cart_id):
+    # Cart items only carry cart_id, so remember which cart_code each cached cart has.
+    return f"membership:cart-code:{cart_id}"
+
+
+def wishlist_product_ids(user_id):
+    product_ids = wishlist_cache.get(user_id)
+    if product_ids is None:
+        product_ids = frozenset(Wishlist.objects.filter(user_id=user_id).values_list("product_id", flat=True))
+        wishlist_cache.set(user_id, product_ids)
+    return product_ids
+
+
+def cart_product_ids(cart_code):
+    product_ids = cart_cache.get(cart_code)
+    if product_ids is None:
+        # LEFT JOIN, so an empty cart still yields its id for later invalidation.
+        rows = list(Cart.objects.filter(cart_code=cart_code).values_list("id", "cartitems__product_id"))
+        product_ids = frozenset(product_id for _, product_id in rows if product_id is not None)
+        for cart_id, _ in rows[:1]:
+            cache.set(_cart_code_key(cart_id), cart_code, timeout=MEMBERSHIP_TTL)
+        cart_cache.set(cart_code, product_ids)
+    return product_ids
+
+
+def invalidate_cart(cart_id):
+    cart_code = cache.get(_cart_code_key(cart_id))
+    if cart_code is not None:
+        cart_cache.invalidate(cart_code)
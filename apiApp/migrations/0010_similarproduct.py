@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0009_alter_category_slug_alter_order_amount_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='apiApp.product')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='apiApp.product')),
+            ],
+            options={
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['product', '-score'], name='similar_product_score_idx')],
+                'unique_together': {('product', 'similar')},
+            },
+        ),
+    ]
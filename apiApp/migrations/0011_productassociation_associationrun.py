@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0010_similarproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssociationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.PositiveBigIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductAssociation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('associated', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='apiApp.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='associations', to='apiApp.product')),
+            ],
+            options={
+                'ordering': ['-count'],
+                'indexes': [models.Index(fields=['product', '-count'], name='product_association_count_idx')],
+                'unique_together': {('product', 'associated')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0011_productassociation_associationrun'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at'], name='cart_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customeraddress',
+            index=models.Index(fields=['customer', '-id'], name='address_customer_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('featured', True)), fields=['id'], name='product_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'rating', '-created', '-id'], name='review_product_rating_idx'),
+        ),
+    ]
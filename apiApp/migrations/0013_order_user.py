@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def link_orders_to_users(apps, schema_editor):
+    Order = apps.get_model("apiApp", "Order")
+    User = apps.get_model("apiApp", "CustomUser")
+    Order.objects.filter(user__isnull=True).update(
+        user=Subquery(User.objects.filter(email=OuterRef("customer_email")).values("id")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0012_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(link_orders_to_users, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created'], name='order_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0014_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, help_text='Units available. Leave empty to sell without a limit.', null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0, help_text='When above zero, stock is split across this many StockShard rows to spread hot-SKU writes.'),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_code', models.CharField(db_index=True, max_length=11)),
+                ('quantity', models.PositiveIntegerField()),
+                ('shard', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='apiApp.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='apiApp.product')),
+            ],
+            options={
+                'unique_together': {('product', 'shard')},
+            },
+        ),
+    ]
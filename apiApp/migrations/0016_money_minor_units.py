@@ -0,0 +1,76 @@
+from django.db import migrations, models
+from django.db.models import BigIntegerField, DecimalField, F, Value
+from django.db.models.functions import Cast, Round
+
+import apiApp.money
+
+MONEY_FIELDS = (("Product", "price"), ("Order", "amount"))
+
+
+def to_minor_units(apps, schema_editor):
+    # One UPDATE per table; rounded before the cast so 19.99 stored as 19.989999... becomes 1999.
+    for model_name, field in MONEY_FIELDS:
+        model = apps.get_model("apiApp", model_name)
+        model.objects.filter(**{f"{field}__isnull": False}).update(
+            **{f"{field}_minor": Cast(Round(F(field) * 100), BigIntegerField())}
+        )
+
+
+def to_major_units(apps, schema_editor):
+    # A float divisor: SQLite casts 100.00 to an integer and would divide without the cents.
+    for model_name, field in MONEY_FIELDS:
+        model = apps.get_model("apiApp", model_name)
+        model.objects.update(**{field: Cast(
+            F(f"{field}_minor") / Value(100.0), DecimalField(max_digits=10, decimal_places=2)
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0015_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='price_minor',
+            field=apiApp.money.MoneyField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='amount_minor',
+            field=apiApp.money.MoneyField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(to_minor_units, to_major_units),
+        migrations.RemoveField(
+            model_name='product',
+            name='price',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='amount',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='price_minor',
+            new_name='price',
+        ),
+        migrations.RenameField(
+            model_name='order',
+            old_name='amount_minor',
+            new_name='amount',
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:50
+
+import apiApp.money
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def fill_category_stats(apps, schema_editor):
+    # Counts and price range only; `manage.py rebuild_category_stats` also fills top_rated.
+    Category = apps.get_model("apiApp", "Category")
+    categories = Category.objects.annotate(
+        count=Count("products"), lowest=Min("products__price"), highest=Max("products__price")
+    )
+    for category in categories:
+        Category.objects.filter(pk=category.pk).update(
+            product_count=category.count, min_price=category.lowest, max_price=category.highest
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0016_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='max_price',
+            field=apiApp.money.MoneyField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='min_price',
+            field=apiApp.money.MoneyField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='top_rated',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(fill_category_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0018_product_category_price_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-created', '-id'], name='review_product_created_idx'),
+        ),
+    ]
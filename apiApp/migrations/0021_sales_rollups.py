@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:08
+
+import apiApp.money
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0020_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', apiApp.money.MoneyField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=apiApp.money.MoneyField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', apiApp.money.MoneyField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='apiApp.category')),
+            ],
+            options={
+                'unique_together': {('category', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', apiApp.money.MoneyField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='apiApp.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='daily_product_sales_date_idx')],
+                'unique_together': {('product', 'date')},
+            },
+        ),
+    ]
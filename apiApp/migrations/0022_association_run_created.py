@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:19
+
+from django.db import migrations, models
+
+
+def fill_last_order_created(apps, schema_editor):
+    AssociationRun = apps.get_model("apiApp", "AssociationRun")
+    Order = apps.get_model("apiApp", "Order")
+    for run in AssociationRun.objects.filter(last_order_created__isnull=True):
+        run.last_order_created = Order.objects.filter(id=run.last_order_id).values_list("created", flat=True).first()
+        run.save(update_fields=["last_order_created"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0021_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='associationrun',
+            name='last_order_created',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_last_order_created, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def link_orders_to_users(apps, schema_editor):
+    # Guest orders from users who registered after 0013 ran
+    Order = apps.get_model("apiApp", "Order")
+    User = apps.get_model("apiApp", "CustomUser")
+    Order.objects.filter(user__isnull=True).update(
+        user=Subquery(User.objects.filter(email=OuterRef("customer_email")).values("id")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0022_association_run_created'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('user__isnull', True)), fields=['customer_email'], name='order_unlinked_email_idx'),
+        ),
+        migrations.RunPython(link_orders_to_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0023_order_unlinked_email_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='backordered',
+            field=models.BooleanField(default=False, help_text='Paid for, but some units were out of stock by then.'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='backordered',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0024_order_backordered'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
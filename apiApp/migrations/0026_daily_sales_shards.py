@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0025_task_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailysales',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dailysales',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailysales',
+            unique_together={('date', 'shard')},
+        ),
+    ]
@@ -2,7 +2,8 @@ from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.utils.text import slugify
-from decimal import Decimal
+
+from .money import MoneyField
 
 # ----------------------------
 # Custom User Model
@@ -22,6 +23,13 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, blank=True)
     image = models.ImageField(upload_to="category_img", blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Denormalized navigation data, maintained by apiApp.catalog.refresh_category_stats
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    min_price = MoneyField(null=True, blank=True, editable=False)
+    max_price = MoneyField(null=True, blank=True, editable=False)
+    top_rated = models.JSONField(default=list, blank=True, editable=False)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -48,9 +56,10 @@ class Category(models.Model):
 class Product(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
-    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price = MoneyField()  # Minor units (cents)
     slug = models.SlugField(unique=True, blank=True)
     image = models.ImageField(upload_to="product_img", blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     featured = models.BooleanField(default=True)
     category = models.ForeignKey(
         Category,
@@ -59,6 +68,21 @@ class Product(models.Model):
         blank=True,
         null=True
     )
+    stock = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Units available. Leave empty to sell without a limit."
+    )
+    stock_shards = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="When above zero, stock is split across this many StockShard rows to spread hot-SKU writes."
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["id"], condition=models.Q(featured=True), name="product_featured_idx"),
+            models.Index(fields=["category", "price"], name="product_category_price_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -91,15 +115,18 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["updated_at"], name="cart_updated_at_idx")]
+
     def __str__(self):
         return f"{self.cart_code} ({self.user.username if self.user else 'No User'})"
 
     @property
     def total_amount(self):
-        total = Decimal("0.00")
-        for item in self.cartitems.all():
-            total += item.sub_total
-        return round(total, 2)
+        """Cart total in minor units."""
+        from .catalog import cart_total_cents
+
+        return cart_total_cents(self.cartitems.all())
 
 
 # ----------------------------
@@ -123,11 +150,12 @@ class CartItem(models.Model):
 
     @property
     def sub_total(self):
-        """Safely calculate subtotal as Decimal"""
-        try:
-            return Decimal(str(self.product.price)) * Decimal(self.quantity)
-        except Exception:
-            return Decimal("0.00")
+        """Subtotal in minor units, priced from the product snapshot rather than a row load when there is one."""
+        from .catalog import product_snapshots
+
+        snapshot = product_snapshots.get(self.product_id)
+        price = snapshot.price_cents if snapshot else self.product.price
+        return price * self.quantity
 
 
 # ----------------------------
@@ -155,6 +183,11 @@ class Review(models.Model):
     class Meta:
         unique_together = ["user", "product"]
         ordering = ["-created"]
+        indexes = [
+            # Keyset pagination of a product's reviews, newest first, optionally for one rating
+            models.Index(fields=["product", "-created", "-id"], name="review_product_created_idx"),
+            models.Index(fields=["product", "rating", "-created", "-id"], name="review_product_rating_idx"),
+        ]
 
 
 # ----------------------------
@@ -196,6 +229,9 @@ class CustomerAddress(models.Model):
     phone = models.CharField(max_length=20)
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["customer", "-id"], name="address_customer_latest_idx")]
+
     def __str__(self):
         return f"{self.email} - {self.city}"
 
@@ -205,12 +241,29 @@ class CustomerAddress(models.Model):
 # ----------------------------
 class Order(models.Model):
     stripe_checkout_id = models.CharField(max_length=255, unique=True)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="orders",
+        null=True,
+        blank=True
+    )
+    amount = MoneyField()  # Minor units of `currency`
     currency = models.CharField(max_length=10)
     customer_email = models.EmailField()
     status = models.CharField(max_length=50, choices=[("Pending", "Pending"), ("Paid", "Paid")])
+    backordered = models.BooleanField(default=False, help_text="Paid for, but some units were out of stock by then.")
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created"], name="order_user_created_idx"),
+            # Guest orders waiting to be linked to an account registered with their email
+            models.Index(
+                fields=["customer_email"], condition=models.Q(user__isnull=True), name="order_unlinked_email_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Order {self.stripe_checkout_id} - {self.customer_email}"
 
@@ -222,6 +275,171 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    unit_price = MoneyField(null=True, blank=True)  # Minor units paid per unit; empty on orders placed before it was recorded
+    backordered = models.PositiveIntegerField(default=0)  # Units of `quantity` that were out of stock at payment
 
     def __str__(self):
         return f"{self.product.name} × {self.quantity}"
+
+
+# ----------------------------
+# Similar Product Model
+# ----------------------------
+class SimilarProduct(models.Model):
+    """Precomputed neighbour of a product, rebuilt by `build_similar_products`."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="neighbours")
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ["product", "similar"]
+        ordering = ["-score"]
+        indexes = [models.Index(fields=["product", "-score"], name="similar_product_score_idx")]
+
+    def __str__(self):
+        return f"{self.product_id} → {self.similar_id} ({self.score:.2f})"
+
+
+# ----------------------------
+# Product Association Model
+# ----------------------------
+class ProductAssociation(models.Model):
+    """How often two products were bought in the same order, mined by `mine_bought_together`."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="associations")
+    associated = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["product", "associated"]
+        ordering = ["-count"]
+        indexes = [models.Index(fields=["product", "-count"], name="product_association_count_idx")]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.associated_id} ({self.count})"
+
+
+class AssociationRun(models.Model):
+    """Watermark (created, id) of the last order folded into ProductAssociation."""
+    last_order_id = models.PositiveBigIntegerField(default=0)
+    last_order_created = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Association run up to order {self.last_order_id}"
+
+
+# ----------------------------
+# Stock Shard Model
+# ----------------------------
+class StockShard(models.Model):
+    """One slice of a hot product's stock; decrements pick a shard so they don't all lock one row."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="shards")
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["product", "shard"]
+
+    def __str__(self):
+        return f"{self.product_id} shard {self.shard}: {self.quantity}"
+
+
+# ----------------------------
+# Stock Reservation Model
+# ----------------------------
+class StockReservation(models.Model):
+    """Stock held for a cart between checkout and payment; released by the sweeper when it expires."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    cart_code = models.CharField(max_length=11, db_index=True)
+    quantity = models.PositiveIntegerField()
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} × {self.product_id} for cart {self.cart_code}"
+
+
+# ----------------------------
+# Task Model
+# ----------------------------
+class Task(models.Model):
+    """A queued call to a function registered with apiApp.tasks.task, run by `manage.py run_worker`."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Renewed by the worker while the task runs
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for due tasks in run_at order
+            models.Index(fields=["run_at"], condition=models.Q(status="queued"), name="task_due_idx"),
+            models.Index(fields=["status", "finished_at"], name="task_status_finished_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+# ----------------------------
+# Sales Rollup Models
+# ----------------------------
+class DailySales(models.Model):
+    """
+    Order totals per day, kept current by apiApp.analytics.record_order and rebuilt by `backfill_sales`.
+
+    Each day is split over up to SALES_SHARDS rows so concurrent checkouts don't all lock one row;
+    a day's totals are the sum of its shards.
+    """
+    date = models.DateField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = MoneyField(default=0)
+
+    class Meta:
+        unique_together = ["date", "shard"]
+
+    def __str__(self):
+        return f"{self.date} shard {self.shard}: {self.orders} orders"
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    units = models.PositiveIntegerField(default=0)
+    revenue = MoneyField(default=0)
+
+    class Meta:
+        unique_together = ["product", "date"]
+        indexes = [models.Index(fields=["date"], name="daily_product_sales_date_idx")]
+
+    def __str__(self):
+        return f"{self.date}: product {self.product_id} × {self.units}"
+
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="+")
+    units = models.PositiveIntegerField(default=0)
+    revenue = MoneyField(default=0)
+
+    class Meta:
+        unique_together = ["category", "date"]
+
+    def __str__(self):
+        return f"{self.date}: category {self.category_id} × {self.units}"
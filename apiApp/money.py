@@ -0,0 +1,90 @@
+"""
+Money is stored and computed as integer minor units (cents for USD), the same
+representation Stripe uses, and only turned into decimal strings at the edges.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django import forms
+from django.conf import settings
+from django.db import models
+from rest_framework import serializers
+
+MINOR_UNIT_EXPONENT = 2
+# MoneyField is a BigIntegerField.
+MAX_MINOR = 2 ** 63 - 1
+
+
+def default_currency():
+    return getattr(settings, "DEFAULT_CURRENCY", "usd")
+
+
+def to_minor(value):
+    """
+    Convert a major-unit amount ("12.50", Decimal("12.5"), 12) to minor units (1250).
+
+    Raises ValueError for anything that isn't a finite amount a MoneyField can
+    store, e.g. "abc", "NaN" or "1e30".
+    """
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Not a money amount: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Not a money amount: {value!r}")
+    # Checked in major units first: scaling or quantizing a huge exponent raises Overflow/InvalidOperation.
+    if not to_major(-MAX_MINOR - 1) <= amount <= to_major(MAX_MINOR):
+        raise ValueError(f"Money amount out of range: {value!r}")
+    return int(amount.scaleb(MINOR_UNIT_EXPONENT).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_major(minor):
+    """1250 -> Decimal("12.50")."""
+    return Decimal(minor).scaleb(-MINOR_UNIT_EXPONENT)
+
+
+def format_minor(minor):
+    """1250 -> "12.50"."""
+    return f"{to_major(minor):.{MINOR_UNIT_EXPONENT}f}"
+
+
+class MoneyFormField(forms.DecimalField):
+    """Edits minor units as a major-unit decimal, e.g. 1250 is shown and entered as 12.50."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("decimal_places", MINOR_UNIT_EXPONENT)
+        kwargs.pop("max_value", None)
+        kwargs.pop("min_value", None)
+        super().__init__(**kwargs)
+
+    def prepare_value(self, value):
+        if isinstance(value, int):
+            return to_major(value)
+        return super().prepare_value(value)
+
+    def clean(self, value):
+        value = super().clean(value)
+        try:
+            return None if value is None else to_minor(value)
+        except ValueError as e:
+            raise forms.ValidationError(str(e), code="invalid")
+
+
+class MoneyField(models.BigIntegerField):
+    """An amount in integer minor units."""
+    description = "Amount in minor currency units"
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{"form_class": MoneyFormField, **kwargs})
+
+
+class MoneySerializerField(serializers.Field):
+    """Renders minor units as a decimal string ("12.50") and parses the same back."""
+
+    def to_representation(self, value):
+        return format_minor(value)
+
+    def to_internal_value(self, data):
+        try:
+            return to_minor(data)
+        except ValueError:
+            raise serializers.ValidationError("A valid money amount is required.")
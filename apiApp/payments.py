@@ -0,0 +1,35 @@
+"""
+Lazy access to the Stripe SDK.
+
+Importing `stripe` costs more than the rest of the URLconf put together, so it
+is loaded the first time a checkout or webhook request needs it rather than on
+every worker boot.
+"""
+from functools import cache
+
+from django.conf import settings
+
+
+@cache
+def stripe_client():
+    """The configured `stripe` module, imported on first use."""
+    import stripe
+
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    return stripe
+
+
+def paid_unit_prices(session_id):
+    """
+    {product_id: unit amount in minor units} as Stripe charged it for a checkout
+    session. Lines from sessions created without a product_id in their
+    product metadata are left out.
+    """
+    stripe = stripe_client()
+    line_items = stripe.checkout.Session.list_line_items(session_id, limit=100, expand=["data.price.product"])
+    prices = {}
+    for line in line_items.auto_paging_iter():
+        product_id = line["price"]["product"]["metadata"].get("product_id")
+        if product_id is not None:
+            prices[int(product_id)] = line["price"]["unit_amount"]
+    return prices
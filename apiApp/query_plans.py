@@ -0,0 +1,112 @@
+"""
+EXPLAIN the queries endpoints actually run.
+
+Each endpoint is called through its real view while its queries are captured,
+then every captured SELECT is EXPLAINed. The plans checked are therefore the
+ones the views build, not copies of them. Used by the explain_queries command
+and by the test suite.
+"""
+import re
+
+from django.db import connections
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    Cart, CartItem, Category, CustomerAddress, CustomUser, Order, OrderItem, Product, Review, Wishlist
+)
+from .response_cache import invalidate
+
+SEQ_SCAN_PATTERNS = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (\w+)$", re.MULTILINE),
+}
+
+
+def seed(rows):
+    """Bulk insert `rows` synthetic rows per table. Returns (product, category, cart, user) to request."""
+    category = Category.objects.create(name="Explain seed")
+    products = Product.objects.bulk_create(
+        Product(name=f"Seed {i}", slug=f"explain-seed-{i}", description="", price=1, featured=i % 2 == 0, category=category)
+        for i in range(rows)
+    )
+    users = CustomUser.objects.bulk_create(
+        CustomUser(username=f"explain-seed-{i}", email=f"explain-seed-{i}@example.com") for i in range(rows)
+    )
+    orders = Order.objects.bulk_create(
+        Order(stripe_checkout_id=f"explain-seed-{i}", user=users[i], amount=1, currency="usd",
+              customer_email=users[i].email, status="Paid")
+        for i in range(rows)
+    )
+    OrderItem.objects.bulk_create(OrderItem(order=orders[i], product=products[i]) for i in range(rows))
+    Review.objects.bulk_create(
+        Review(product=products[i], user=users[i], rating=i % 5 + 1, review="") for i in range(rows)
+    )
+    Wishlist.objects.bulk_create(Wishlist(product=products[i], user=users[i]) for i in range(rows))
+    carts = Cart.objects.bulk_create(Cart(cart_code=f"s{i:010d}") for i in range(rows))
+    CartItem.objects.bulk_create(CartItem(cart=carts[i], product=products[i]) for i in range(rows))
+    CustomerAddress.objects.bulk_create(
+        CustomerAddress(customer=users[i], email=users[i].email, street="", city="", state="", phone="")
+        for i in range(rows)
+    )
+    return products[0], category, carts[0], users[0]
+
+
+def endpoint_requests(product, category, cart, user):
+    """(label, path, user or None) for every endpoint whose lookups must use an index."""
+    return [
+        ("product_list", reverse("product_list"), None),
+        ("product_detail", reverse("product_detail", args=[product.slug]), None),
+        ("product_reviews", reverse("product_reviews", args=[product.slug]) + "?rating=5", None),
+        ("category_detail", reverse("category_detail", args=[category.slug]), None),
+        ("get_cart", reverse("get_cart", args=[cart.cart_code]), None),
+        ("product_in_cart", reverse("product_in_cart") + f"?cart_code={cart.cart_code}&product_id={product.id}", None),
+        ("my_wishlists", reverse("my_wishlists"), user),
+        ("product_in_wishlist", reverse("product_in_wishlist") + f"?product_id={product.id}", user),
+        ("get_orders", reverse("get_orders"), user),
+        ("get_address", reverse("get_address"), user),
+    ]
+
+
+def capture_queries(path, user=None, using="default"):
+    """Call the view behind `path` (GET) and return the SELECTs it ran."""
+    headers = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"} if user else {}
+    request = RequestFactory().get(path, **headers)
+    match = resolve(request.path_info)
+    if match.url_name in ("product_detail", "category_detail"):
+        # Skip the response cache so the page's queries run.
+        invalidate(match.url_name.split("_")[0], [match.kwargs["slug"]])
+    with CaptureQueriesContext(connections[using]) as captured:
+        response = match.func(request, *match.args, **match.kwargs)
+    if response.status_code >= 400:
+        raise AssertionError(f"GET {path} returned {response.status_code}")
+    return [query["sql"] for query in captured.captured_queries if query["sql"].lstrip().upper().startswith("SELECT")]
+
+
+def explain(sql, using="default"):
+    connection = connections[using]
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        return "\n".join(str(row[-1]) for row in cursor.fetchall())
+
+
+def sequential_scans(requests, using="default"):
+    """
+    {label: [(table, sql, plan)]} for every endpoint query whose plan scans a table.
+
+    On PostgreSQL run this with enable_seqscan off, since small tables are
+    otherwise cheaper to scan and only missing indexes should show up.
+    """
+    pattern = SEQ_SCAN_PATTERNS.get(connections[using].vendor)
+    if pattern is None:
+        raise ValueError(f"Unsupported database backend: {connections[using].vendor}")
+    scans = {}
+    for label, path, user in requests:
+        for sql in capture_queries(path, user, using):
+            plan = explain(sql, using)
+            for table in pattern.findall(plan):
+                scans.setdefault(label, []).append((table, sql, plan))
+    return scans
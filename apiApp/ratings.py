@@ -0,0 +1,134 @@
+"""
+Product rating maintenance and bulk review changes.
+
+Saving or deleting a single review recomputes its product's ProductRating via
+signals. Bulk work (imports, spam clean-ups) suspends that per-row work,
+writes reviews in batches, and then recomputes only the affected products with
+one grouped aggregate per batch of products.
+"""
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from .catalog import refresh_category_stats
+from .models import Product, ProductRating, Review
+from .response_cache import invalidate
+
+BATCH_SIZE = 5000
+
+_state = threading.local()
+
+
+@contextmanager
+def suspend_rating_updates():
+    """Skip the per-review rating signals on this thread; the caller recomputes afterwards."""
+    previous = getattr(_state, "suspended", False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def rating_updates_suspended():
+    return getattr(_state, "suspended", False)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def recompute_product_ratings(product_ids):
+    """Rewrite ProductRating for the given products from their reviews. Returns the number of products."""
+    product_ids = sorted(set(product_ids))
+    category_ids = set()
+    for batch in _batches(product_ids, BATCH_SIZE):
+        totals = {
+            row["product_id"]: row
+            for row in Review.objects.filter(product_id__in=batch)
+            .values("product_id")
+            .annotate(count=Count("id"), average=Avg("rating"))
+            .order_by()
+        }
+        existing = {
+            product_id: (category_id, slug)
+            for product_id, category_id, slug in Product.objects.filter(id__in=batch).values_list("id", "category_id", "slug")
+        }
+        category_ids.update(category_id for category_id, _ in existing.values())
+        ProductRating.objects.bulk_create(
+            [
+                ProductRating(
+                    product_id=product_id,
+                    average_rating=totals[product_id]["average"] if product_id in totals else 0.0,
+                    total_reviews=totals[product_id]["count"] if product_id in totals else 0,
+                )
+                for product_id in batch if product_id in existing
+            ],
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=["average_rating", "total_reviews"],
+        )
+        # Product pages embed the rating and the newest reviews.
+        invalidate("product", [slug for _, slug in existing.values()])
+    if category_ids:
+        # bulk_create skips ProductRating's post_save, so refresh top-rated lists here.
+        refresh_category_stats(category_ids)
+    return len(product_ids)
+
+
+def import_reviews(reviews, batch_size=BATCH_SIZE):
+    """
+    Insert unsaved Review instances in batches, skipping any that duplicate an
+    existing (user, product) review, then recompute the affected ratings.
+
+    Reviews naming a product or user that doesn't exist are left out rather
+    than failing the whole import at commit. Returns (reviews submitted,
+    [(review, reason)] for those left out).
+    """
+    product_ids = set()
+    count, skipped = 0, []
+    with transaction.atomic(), suspend_rating_updates():
+        for batch in _batches(reviews, batch_size):
+            batch, invalid = _check_references(batch)
+            skipped.extend(invalid)
+            Review.objects.bulk_create(batch, ignore_conflicts=True)
+            product_ids.update(review.product_id for review in batch)
+            count += len(batch)
+        recompute_product_ratings(product_ids)
+    return count, skipped
+
+
+def _check_references(batch):
+    """Split `batch` into (reviews whose product and user exist, [(review, reason)] for the rest)."""
+    products = set(Product.objects.filter(id__in={review.product_id for review in batch}).values_list("id", flat=True))
+    users = set(
+        get_user_model().objects.filter(id__in={review.user_id for review in batch}).values_list("id", flat=True)
+    )
+    valid, invalid = [], []
+    for review in batch:
+        if review.product_id not in products:
+            invalid.append((review, f"no product with id {review.product_id}"))
+        elif review.user_id not in users:
+            invalid.append((review, f"no user with id {review.user_id}"))
+        else:
+            valid.append(review)
+    return valid, invalid
+
+
+def delete_reviews(queryset, batch_size=BATCH_SIZE):
+    """Delete the reviews in `queryset` in batches, then recompute the affected ratings. Returns the number deleted."""
+    product_ids = set()
+    deleted = 0
+    with transaction.atomic(), suspend_rating_updates():
+        # Re-query each round rather than hold a cursor open over rows being deleted.
+        while batch := list(queryset.values_list("id", "product_id")[:batch_size]):
+            deleted += Review.objects.filter(id__in=[review_id for review_id, _ in batch]).delete()[0]
+            product_ids.update(product_id for _, product_id in batch)
+        recompute_product_ratings(product_ids)
+    return deleted
@@ -0,0 +1,241 @@
+"""
+Product recommendations: precomputed similar products and frequently bought together.
+
+The product × product co-occurrence matrix is sparse and is kept as nested
+dicts ({product_id: {other_id: score}}) rather than a scipy.sparse matrix:
+scipy isn't a dependency, and the matrix is only ever read one row at a time
+to rank a product's neighbours, never multiplied. Memory grows with the
+number of distinct co-occurring pairs, not with the catalogue squared. For
+catalogues where even that is too much, compute_similar_products(batch_size=N)
+(`build_similar_products --batch-size N`) holds the rows of N products at a
+time and re-reads the baskets once per batch.
+"""
+import heapq
+import random
+from collections import defaultdict
+from datetime import timedelta
+from itertools import combinations, groupby, islice
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import (
+    AssociationRun, CartItem, Order, OrderItem, Product,
+    ProductAssociation, SimilarProduct, Wishlist
+)
+
+# Number of neighbours kept per product and served on the detail page.
+SIMILAR_PRODUCTS_LIMIT = 8
+
+# Same-category candidates considered per product (best rated first).
+CATEGORY_CANDIDATES = 50
+
+# Baskets larger than this are sampled down so one huge cart can't blow up the pair count.
+MAX_BASKET_SIZE = 50
+
+# Associations served per product as "frequently bought together".
+BOUGHT_TOGETHER_LIMIT = 10
+
+# Distinct pairs held in memory before rare ones are pruned.
+MAX_TRACKED_PAIRS = 500_000
+
+ORDER_WEIGHT = 3.0
+CART_WEIGHT = 1.0
+WISHLIST_WEIGHT = 1.0
+CATEGORY_WEIGHT = 2.0
+RATING_WEIGHT = 0.5
+
+
+def _baskets(queryset, group_field):
+    """Yield the sorted product ids per group, streaming rows in group order."""
+    rows = queryset.order_by(group_field).values_list(group_field, "product_id").iterator(chunk_size=2000)
+    for key, group in groupby(rows, key=lambda row: row[0]):
+        basket = sorted({product_id for _, product_id in group})
+        if len(basket) > MAX_BASKET_SIZE:
+            # Seeded by the group so rebuilds sample the same products, without favouring low ids.
+            basket = sorted(random.Random(key).sample(basket, MAX_BASKET_SIZE))
+        yield basket
+
+
+def _add_cooccurrence(scores, baskets, weight, rows=None):
+    """Add `weight` per basket to each pair's score, only for products in `rows` if given."""
+    for basket in baskets:
+        for a, b in combinations(basket, 2):
+            if rows is None or a in rows:
+                scores[a][b] += weight
+            if rows is None or b in rows:
+                scores[b][a] += weight
+
+
+def _rank(product_id, cooccurrence, category_candidates, ratings, limit):
+    combined = dict(cooccurrence)
+    for candidate in category_candidates:
+        if candidate != product_id:
+            combined[candidate] = combined.get(candidate, 0.0) + CATEGORY_WEIGHT
+    ranked = (
+        (candidate, score + RATING_WEIGHT * ratings[candidate] / 5)
+        for candidate, score in combined.items()
+        if candidate in ratings
+    )
+    return heapq.nlargest(limit, ranked, key=itemgetter(1))
+
+
+def _cooccurrence(rows=None):
+    scores = defaultdict(lambda: defaultdict(float))
+    _add_cooccurrence(scores, _baskets(OrderItem.objects.all(), "order_id"), ORDER_WEIGHT, rows)
+    _add_cooccurrence(scores, _baskets(CartItem.objects.all(), "cart_id"), CART_WEIGHT, rows)
+    _add_cooccurrence(scores, _baskets(Wishlist.objects.all(), "user_id"), WISHLIST_WEIGHT, rows)
+    return scores
+
+
+def compute_similar_products(limit=SIMILAR_PRODUCTS_LIMIT, batch_size=None):
+    """
+    Yield (product_id, [(similar_id, score), ...]) with at most `limit` entries per product.
+
+    Scores combine co-occurrence in orders, carts and wishlists with a bonus for
+    sharing a category and for the neighbour's average rating. With
+    `batch_size`, co-occurrence rows are built for that many products per pass
+    over the baskets instead of for the whole catalogue at once.
+    """
+    ratings = {}
+    categories = {}
+    by_category = defaultdict(list)
+    for product_id, category_id, rating in Product.objects.values_list(
+        "id", "category_id", "rating__average_rating"
+    ).order_by("id").iterator(chunk_size=2000):
+        ratings[product_id] = rating or 0.0
+        categories[product_id] = category_id
+        by_category[category_id].append(product_id)
+    candidates = {
+        category_id: heapq.nlargest(CATEGORY_CANDIDATES, members, key=ratings.__getitem__)
+        for category_id, members in by_category.items() if category_id is not None
+    }
+    del by_category
+
+    product_ids = list(ratings)
+    batch_size = batch_size or len(product_ids) or 1
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        scores = _cooccurrence(None if len(batch) == len(product_ids) else set(batch))
+        for product_id in batch:
+            ranked = _rank(
+                product_id, scores.pop(product_id, {}), candidates.get(categories[product_id], []), ratings, limit
+            )
+            if ranked:
+                yield product_id, ranked
+
+
+def rebuild_similar_products(limit=SIMILAR_PRODUCTS_LIMIT, batch_size=None):
+    """Replace the neighbour table with a fresh computation. Returns the number of rows written."""
+    rows = (
+        SimilarProduct(product_id=product_id, similar_id=similar_id, score=score)
+        for product_id, ranked in compute_similar_products(limit, batch_size)
+        for similar_id, score in ranked
+    )
+    written = 0
+    with transaction.atomic():
+        SimilarProduct.objects.all().delete()
+        # Written in slices so the whole table is never held in memory.
+        while chunk := list(islice(rows, 1000)):
+            SimilarProduct.objects.bulk_create(chunk)
+            written += len(chunk)
+    return written
+
+
+def similar_products_for(product, limit=SIMILAR_PRODUCTS_LIMIT):
+    """Neighbours for the detail page, falling back to best rated products in the same category."""
+    neighbours = SimilarProduct.objects.filter(product=product).select_related("similar")[:limit]
+    products = [neighbour.similar for neighbour in neighbours]
+    if products or product.category_id is None:
+        return products
+    return list(
+        Product.objects.filter(category_id=product.category_id)
+        .exclude(id=product.id)
+        .order_by(F("rating__average_rating").desc(nulls_last=True), "id")[:limit]
+    )
+
+
+# ----------------------------
+# Frequently bought together
+# ----------------------------
+def _count_order_pairs(orders, max_pairs=MAX_TRACKED_PAIRS):
+    """
+    Count product pairs across `orders`.
+
+    Whenever more than `max_pairs` distinct pairs are tracked, pairs at or below a
+    rising threshold are dropped (lossy counting), which bounds memory at the cost
+    of undercounting very rare pairs.
+    """
+    pairs = defaultdict(int)
+    threshold = 0
+    for basket in _baskets(OrderItem.objects.filter(order__in=orders), "order_id"):
+        for pair in combinations(basket, 2):
+            pairs[pair] += 1
+        if len(pairs) > max_pairs:
+            threshold += 1
+            pairs = defaultdict(int, {pair: n for pair, n in pairs.items() if n > threshold})
+    return pairs
+
+
+def _chunks(values, size=500):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def mine_bought_together(full=False, max_pairs=MAX_TRACKED_PAIRS, settle_seconds=60):
+    """
+    Fold orders placed since the last run into ProductAssociation.
+
+    Runs resume after the (created, id) of the last order they counted, and
+    leave orders newer than `settle_seconds` for the next run, so an order
+    that commits after a later one is still counted. Every pair count is kept;
+    bought_together_for() takes the top ones. With `full=True` the table is
+    rebuilt from every order. Returns the number of orders processed.
+    """
+    last_run = None if full else AssociationRun.objects.order_by("-id").first()
+    orders = Order.objects.filter(created__lte=timezone.now() - timedelta(seconds=settle_seconds))
+    if last_run is not None and last_run.last_order_created is not None:
+        orders = orders.filter(
+            Q(created__gt=last_run.last_order_created)
+            | Q(created=last_run.last_order_created, id__gt=last_run.last_order_id)
+        )
+    last = orders.order_by("-created", "-id").values_list("created", "id").first()
+    if last is None and not full:
+        return 0
+    if last is not None:
+        # Fix the window so orders settling while this runs wait for the next run.
+        orders = orders.filter(Q(created__lt=last[0]) | Q(created=last[0], id__lte=last[1]))
+
+    counts = defaultdict(dict)
+    for (a, b), n in _count_order_pairs(orders, max_pairs).items():
+        counts[a][b] = n
+        counts[b][a] = n
+
+    with transaction.atomic():
+        if full:
+            ProductAssociation.objects.all().delete()
+        else:
+            for product_ids in _chunks(counts):
+                existing = ProductAssociation.objects.filter(product_id__in=product_ids)
+                for product_id, associated_id, n in existing.values_list("product_id", "associated_id", "count"):
+                    counts[product_id][associated_id] = counts[product_id].get(associated_id, 0) + n
+                existing.delete()
+
+        rows = [
+            ProductAssociation(product_id=product_id, associated_id=associated_id, count=n)
+            for product_id, associated in counts.items()
+            for associated_id, n in associated.items()
+        ]
+        ProductAssociation.objects.bulk_create(rows, batch_size=1000)
+        if last is not None:
+            AssociationRun.objects.create(last_order_created=last[0], last_order_id=last[1])
+
+    return orders.count()
+
+
+def bought_together_for(product, limit=BOUGHT_TOGETHER_LIMIT):
+    associations = ProductAssociation.objects.filter(product=product).select_related("associated")[:limit]
+    return [association.associated for association in associations]
@@ -0,0 +1,167 @@
+"""
+Cached product and category detail responses.
+
+Entries are keyed by slug plus a per-page version that invalidate() replaces
+when something shown on the page changes (see apiApp.signals and
+apiApp.ratings), so a product change only drops the pages that show it. A stale
+computation lands under an old key and is never served. Concurrent misses for
+the same page in one process are coalesced so the page is computed once
+(single-flight).
+
+warm() precomputes the busiest product pages and every category page. With the
+default per-process cache it is run in the gunicorn master before workers fork
+(see gunicorn.conf.py); with a shared cache backend the warm_cache command or
+task fills it for all workers. The same goes for invalidation: with a
+per-process cache, changes made in another process (e.g. rating updates in the
+task worker) only show on other workers' pages once RESPONSE_CACHE_SECONDS pass,
+which is why it defaults to 30 seconds unless REDIS_URL is set.
+"""
+import json
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving meanwhile share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+flights = SingleFlight()
+
+
+def _version_key(kind, slug):
+    return f"response-version:{kind}:{slug}"
+
+
+def _key(kind, slug):
+    return f"response:{kind}:{slug}:{cache.get(_version_key(kind, slug), 0)}"
+
+
+def cached_response(kind, slug, compute):
+    """The cached response data for a page, computing (once per process) and storing it on a miss."""
+    key = _key(kind, slug)
+    data = cache.get(key)
+    if data is None:
+        data = flights.do(key, lambda: _compute_and_store(key, compute))
+    return data
+
+
+def _compute_and_store(key, compute):
+    # Store plain JSON types rather than serializer ReturnDicts, which carry the serializer along.
+    data = json.loads(JSONRenderer().render(compute()))
+    cache.set(key, data, settings.RESPONSE_CACHE_SECONDS)
+    return data
+
+
+def invalidate(kind, slugs):
+    """Drop the cached pages of `kind` for `slugs`, in one cache round trip."""
+    # A fresh random version rather than incr(), so any number of pages move in one set_many().
+    version = uuid.uuid4().hex
+    cache.set_many({_version_key(kind, slug): version for slug in set(slugs) if slug}, timeout=None)
+
+
+def pages_showing(product, previous_slug=None, previous_category_id=None):
+    """
+    (product slugs, category slugs) of the pages that show `product`: its own
+    page, its category pages, and product pages listing it as similar.
+    """
+    from .models import Category, Product, SimilarProduct
+
+    category_ids = {product.category_id, previous_category_id} - {None}
+    product_slugs = {product.slug, previous_slug}
+    product_slugs.update(SimilarProduct.objects.filter(similar_id=product.id).values_list("product__slug", flat=True))
+    # Pages without precomputed neighbours list products from their category instead.
+    product_slugs.update(
+        Product.objects.filter(category_id__in=category_ids, neighbours__isnull=True).values_list("slug", flat=True)
+    )
+    category_slugs = set(Category.objects.filter(id__in=category_ids).values_list("slug", flat=True))
+    return product_slugs - {None}, category_slugs
+
+
+# ----------------------------
+# Warming
+# ----------------------------
+def busiest_product_slugs(limit, days=7):
+    """Slugs of the products with the most recent order and cart activity."""
+    from .models import CartItem, OrderItem, Product
+
+    since = timezone.now() - timedelta(days=days)
+    activity = Counter()
+    for model, recent in ((OrderItem, {"order__created__gte": since}), (CartItem, {"cart__updated_at__gte": since})):
+        rows = model.objects.filter(**recent).values_list("product_id").annotate(n=Count("id")).order_by()
+        activity.update(dict(rows))
+    top_ids = [product_id for product_id, _ in activity.most_common(limit)]
+    slugs = dict(Product.objects.filter(id__in=top_ids).values_list("id", "slug"))
+    return [slugs[product_id] for product_id in top_ids if product_id in slugs]
+
+
+def warm(top_products=None, threads=8, db_concurrency=4, days=7):
+    """Compute and cache the busiest product pages and every category page. Returns (products, categories)."""
+    from .models import Category
+    from .views import category_detail_data, product_detail_data
+
+    top_products = settings.RESPONSE_CACHE_WARM_PRODUCTS if top_products is None else top_products
+    product_slugs = busiest_product_slugs(top_products, days)
+    category_slugs = list(Category.objects.values_list("slug", flat=True))
+    database_slots = threading.BoundedSemaphore(db_concurrency)
+
+    def warm_page(kind, slug, compute):
+        try:
+            with database_slots:
+                cached_response(kind, slug, lambda: compute(slug))
+        finally:
+            connections.close_all()  # Pool threads each opened their own connection
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        jobs = [pool.submit(warm_page, "product", slug, product_detail_data) for slug in product_slugs]
+        jobs += [pool.submit(warm_page, "category", slug, category_detail_data) for slug in category_slugs]
+        for job in jobs:
+            job.result()
+    return len(product_slugs), len(category_slugs)
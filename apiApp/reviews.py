@@ -0,0 +1,44 @@
+"""
+Keyset pagination for product reviews.
+
+Pages are ordered newest first on (created, id) and continue from an opaque
+cursor holding the last row's key, so fetching page 500 costs the same index
+range scan as page 1 instead of an ever-growing OFFSET.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Review
+
+REVIEW_PAGE_SIZE = 10
+MAX_REVIEW_PAGE_SIZE = 50
+
+
+def encode_cursor(review):
+    return base64.urlsafe_b64encode(f"{review.created.isoformat()}|{review.id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created, review_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created), int(review_id)
+    except ValueError:
+        raise ValidationError({"cursor": "Invalid cursor."})
+
+
+def review_page(product_id, cursor=None, rating=None, page_size=REVIEW_PAGE_SIZE):
+    """Return (reviews, next_cursor) for one page of a product's reviews; next_cursor is None on the last page."""
+    reviews = Review.objects.filter(product_id=product_id).select_related("user")
+    if rating is not None:
+        reviews = reviews.filter(rating=rating)
+    if cursor:
+        created, review_id = decode_cursor(cursor)
+        reviews = reviews.filter(Q(created__lt=created) | Q(created=created, id__lt=review_id))
+
+    page = list(reviews.order_by("-created", "-id")[:page_size + 1])
+    if len(page) > page_size:
+        return page[:page_size], encode_cursor(page[page_size - 1])
+    return page, None
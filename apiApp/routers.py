@@ -0,0 +1,204 @@
+"""
+Read replica routing.
+
+GET requests to the views in REPLICA_READ_VIEWS read from one replica, chosen
+once per request. Replicas that fail to connect, or that report more than
+REPLICA_MAX_LAG_SECONDS of replication lag, are skipped for a while.
+
+A request that writes pins its client to the primary for REPLICA_PIN_SECONDS
+so it reads its own writes. The response carries an X-DB-Pin header (the pin's
+expiry, in Unix seconds) for the client to send back on its next requests, and
+authenticated writers are also pinned by user id in the cache, which covers
+clients that don't echo the header as long as the cache is shared.
+"""
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import CachedJWTAuthentication
+
+# URL names whose GET requests may be answered from a read replica. product_detail
+# and category_detail are left out: they only query on a response cache miss, which
+# right after invalidate() must see the write, or a lagging replica's page would be
+# cached under the new version.
+REPLICA_READ_VIEWS = {
+    "product_list", "product_reviews", "category_list",
+    "search", "filter_products", "get_orders", "my_wishlists", "sales_report",
+}
+
+# Header marking a client that wrote recently; its reads stay on the primary
+# until the replicas have had time to catch up.
+PIN_HEADER = "X-DB-Pin"
+
+_use_replica = ContextVar("use_replica", default=False)
+_wrote = ContextVar("wrote", default=False)
+_replica = ContextVar("replica", default=None)  # (alias or None,) once picked for the request
+
+# PostgreSQL standby lag in seconds; 0 when everything received has been replayed.
+LAG_QUERY = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+"""
+
+
+class ReplicaPool:
+    """
+    Round-robin over the configured replicas, skipping ones that recently failed
+    to connect or were lagging by more than `max_lag` seconds when last checked.
+    """
+
+    def __init__(self, aliases, retry_after, max_lag=None, lag_check_every=5):
+        self.aliases = list(aliases)
+        self.retry_after = retry_after
+        self.max_lag = max_lag
+        self.lag_check_every = lag_check_every
+        self._cycle = itertools.cycle(self.aliases)
+        self._down_until = {}
+        self._lag_checked = {}
+        self._lock = threading.Lock()
+
+    def mark_down(self, alias):
+        self._down_until[alias] = time.monotonic() + self.retry_after
+
+    def is_up(self, alias):
+        return self._down_until.get(alias, 0) <= time.monotonic()
+
+    def _connects(self, alias):
+        connection = connections[alias]
+        if connection.connection is not None:
+            return True
+        try:
+            connection.ensure_connection()
+        except Exception:
+            self.mark_down(alias)
+            return False
+        return True
+
+    def lag(self, alias):
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            return 0.0
+        with connection.cursor() as cursor:
+            cursor.execute(LAG_QUERY)
+            return float(cursor.fetchone()[0])
+
+    def _caught_up(self, alias):
+        if self.max_lag is None:
+            return True
+        now = time.monotonic()
+        if now - self._lag_checked.get(alias, float("-inf")) < self.lag_check_every:
+            return True  # Checked recently and not marked down since
+        self._lag_checked[alias] = now
+        try:
+            lagging = self.lag(alias) > self.max_lag
+        except Exception:
+            lagging = True
+        if lagging:
+            self.mark_down(alias)
+        return not lagging
+
+    def pick(self):
+        """Return a healthy replica alias, or None to fall back to the primary."""
+        for _ in range(len(self.aliases)):
+            with self._lock:
+                alias = next(self._cycle)
+            if self.is_up(alias) and self._connects(alias) and self._caught_up(alias):
+                return alias
+        return None
+
+
+replicas = ReplicaPool(
+    getattr(settings, "REPLICA_DATABASES", []),
+    getattr(settings, "REPLICA_RETRY_SECONDS", 30),
+    getattr(settings, "REPLICA_MAX_LAG_SECONDS", None),
+)
+
+
+class ReplicaRouter:
+    """Send reads from replica-safe requests to a replica; everything else uses the primary."""
+
+    def db_for_read(self, model, **hints):
+        if not (_use_replica.get() and not _wrote.get() and replicas.aliases):
+            return None
+        picked = _replica.get()
+        if picked is None:
+            # One replica per request, so all of its reads see the same snapshot age.
+            picked = (replicas.pick(),)
+            _replica.set(picked)
+        return picked[0]
+
+    def db_for_write(self, model, **hints):
+        # Once a request writes, its remaining reads go to the primary too.
+        _wrote.set(True)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas.aliases
+
+
+def _pin_key(user_id):
+    return f"replica-pin:user:{user_id}"
+
+
+def _user_id(request):
+    """The caller's user id from their JWT, without touching the database."""
+    try:
+        authenticated = CachedJWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+    return authenticated[0].id if authenticated else None
+
+
+def _pinned(request):
+    try:
+        if float(request.headers.get(PIN_HEADER, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user_id = _user_id(request)
+    return user_id is not None and cache.get(_pin_key(user_id)) is not None
+
+
+class ReplicaRoutingMiddleware:
+    """Decide per request whether reads may use a replica, and pin recent writers to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wrote_token = _wrote.set(False)
+        replica_token = _use_replica.set(False)
+        picked_token = _replica.set(None)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                pin_seconds = getattr(settings, "REPLICA_PIN_SECONDS", 5)
+                response[PIN_HEADER] = str(int(time.time() + pin_seconds) + 1)
+                user_id = _user_id(request)
+                if user_id is not None:
+                    cache.set(_pin_key(user_id), 1, pin_seconds)
+            return response
+        finally:
+            _replica.reset(picked_token)
+            _use_replica.reset(replica_token)
+            _wrote.reset(wrote_token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        _use_replica.set(
+            request.method in ("GET", "HEAD")
+            and match is not None
+            and match.url_name in REPLICA_READ_VIEWS
+            and not _pinned(request)
+        )
+        return None
@@ -1,10 +1,14 @@
 from rest_framework import serializers
-from decimal import Decimal
 from django.contrib.auth import get_user_model
 from .models import (
     Cart, CartItem, Product, Category, Review, Wishlist,
     CustomerAddress, Order, OrderItem, ProductRating
 )
+from .catalog import cart_total_cents, product_snapshots
+from .images import variant_srcsets
+from .money import MoneySerializerField, to_major
+from .recommendations import similar_products_for
+from .reviews import review_page
 
 User = get_user_model()
 
@@ -12,9 +16,15 @@ User = get_user_model()
 # Product Serializers
 # ----------------------------
 class ProductListSerializer(serializers.ModelSerializer):
+    price = MoneySerializerField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
-        fields = ["id", "name", "slug", "image", "price"]
+        fields = ["id", "name", "slug", "image", "image_variants", "price"]
+
+    def get_image_variants(self, product):
+        return variant_srcsets(product.image_variants)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -38,7 +48,9 @@ class ProductRatingSerializer(serializers.ModelSerializer):
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
-    reviews = ReviewSerializer(read_only=True, many=True)
+    price = MoneySerializerField(read_only=True)
+    reviews = serializers.SerializerMethodField()
+    reviews_next_cursor = serializers.SerializerMethodField()
     rating = ProductRatingSerializer(read_only=True)
     poor_review = serializers.SerializerMethodField()
     fair_review = serializers.SerializerMethodField()
@@ -46,18 +58,36 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     very_good_review = serializers.SerializerMethodField()
     excellent_review = serializers.SerializerMethodField()
     similar_products = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
-            "id", "name", "description", "slug", "image", "price",
-            "reviews", "rating", "similar_products",
+            "id", "name", "description", "slug", "image", "image_variants", "price",
+            "reviews", "reviews_next_cursor", "rating", "similar_products",
             "poor_review", "fair_review", "good_review",
             "very_good_review", "excellent_review"
         ]
 
+    def get_image_variants(self, product):
+        return variant_srcsets(product.image_variants)
+
+    def _first_review_page(self, product):
+        # Only the newest page is embedded; the rest come from products/<slug>/reviews.
+        if not hasattr(self, "_review_page"):
+            self._review_page = review_page(product.id)
+        return self._review_page
+
+    def get_reviews(self, product):
+        reviews, _ = self._first_review_page(product)
+        return ReviewSerializer(reviews, many=True).data
+
+    def get_reviews_next_cursor(self, product):
+        _, next_cursor = self._first_review_page(product)
+        return next_cursor
+
     def get_similar_products(self, product):
-        products = Product.objects.filter(category=product.category).exclude(id=product.id)
+        products = similar_products_for(product)
         serializer = ProductListSerializer(products, many=True)
         return serializer.data
 
@@ -81,9 +111,19 @@ class ProductDetailSerializer(serializers.ModelSerializer):
 # Category Serializers
 # ----------------------------
 class CategoryListSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+    min_price = MoneySerializerField(read_only=True)
+    max_price = MoneySerializerField(read_only=True)
+
     class Meta:
         model = Category
-        fields = ["id", "name", "image", "slug"]
+        fields = [
+            "id", "name", "image", "image_variants", "slug",
+            "product_count", "min_price", "max_price", "top_rated"
+        ]
+
+    def get_image_variants(self, category):
+        return variant_srcsets(category.image_variants)
 
 
 class CategoryDetailSerializer(serializers.ModelSerializer):
@@ -106,10 +146,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ["id", "product", "quantity", "sub_total"]
 
     def get_sub_total(self, cart_item):
-        try:
-            return round(Decimal(str(cart_item.product.price)) * Decimal(str(cart_item.quantity)), 2)
-        except Exception:
-            return Decimal("0.00")
+        return to_major(cart_item.sub_total)
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -120,11 +157,13 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ["id", "cart_code", "cartitems", "cart_total"]
 
+    def to_representation(self, cart):
+        # Load every line's snapshot in one go before the items price themselves.
+        product_snapshots.get_many({item.product_id for item in cart.cartitems.all()})
+        return super().to_representation(cart)
+
     def get_cart_total(self, cart):
-        total = sum(
-            Decimal(str(item.product.price)) * Decimal(str(item.quantity)) for item in cart.cartitems.all()
-        )
-        return round(total, 2)
+        return to_major(cart_total_cents(cart.cartitems.all()))
 
 
 class CartStatSerializer(serializers.ModelSerializer):
@@ -166,18 +205,22 @@ class WishlistSerializer(serializers.ModelSerializer):
 # ----------------------------
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductListSerializer(read_only=True)
+    unit_price = MoneySerializerField(read_only=True)
 
     class Meta:
         model = OrderItem
-        fields = ["id", "quantity", "product"]
+        fields = ["id", "quantity", "backordered", "unit_price", "product"]
 
 
 class OrderSerializer(serializers.ModelSerializer):
+    amount = MoneySerializerField(read_only=True)
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ["id", "stripe_checkout_id", "amount", "currency", "customer_email", "status", "created", "items"]
+        fields = [
+            "id", "stripe_checkout_id", "amount", "currency", "customer_email", "status", "backordered", "created", "items"
+        ]
 
 
 # ----------------------------
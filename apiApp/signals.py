@@ -1,37 +1,109 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from django.db.models import Avg
 
-from apiApp.models import ProductRating, Review
+from apiApp import membership
+from apiApp.catalog import product_snapshots, refresh_category_stats
+from apiApp.images import needs_variants
+from apiApp.jobs import recompute_ratings, render_image_variants
+from apiApp.models import Cart, CartItem, Category, CustomUser, Order, Product, ProductRating, Review, Wishlist
+from apiApp.ratings import rating_updates_suspended
+from apiApp.response_cache import invalidate, pages_showing
 
 
-# When a review is created or updated
+# When a review is created, updated or deleted (bulk operations in apiApp.ratings recompute afterwards instead)
 @receiver(post_save, sender=Review)
-def update_product_rating_on_save(sender, instance, **kwargs):
-    product = instance.product
-    reviews = product.reviews.all()
-    total_reviews = reviews.count()
+@receiver(post_delete, sender=Review)
+def update_product_rating(sender, instance, **kwargs):
+    if not rating_updates_suspended():
+        recompute_ratings.delay(product_ids=[instance.product_id])
 
-    review_average = reviews.aggregate(Avg("rating"))["rating__avg"] or 0.0
 
-    product_rating, created = ProductRating.objects.get_or_create(product=product)
-    product_rating.average_rating = review_average
-    product_rating.total_reviews = total_reviews
-    product_rating.save()
+# When a product or category image is uploaded or replaced
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def generate_image_variants(sender, instance, **kwargs):
+    if needs_variants(instance):
+        render_image_variants.delay(model=instance._meta.label, pk=instance.pk, source=instance.image.name)
 
 
-# When a review is deleted
-@receiver(post_delete, sender=Review)
-def update_product_rating_on_delete(sender, instance, **kwargs):
-    product = instance.product
-    reviews = product.reviews.all()
-    total_reviews = reviews.count()
+# Keep the shared wishlist/cart membership caches in step with writes (after commit, so a
+# concurrent read can't cache the old rows again)
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+def invalidate_wishlist_membership(sender, instance, **kwargs):
+    transaction.on_commit(lambda: membership.wishlist_cache.invalidate(instance.user_id))
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_membership(sender, instance, **kwargs):
+    transaction.on_commit(lambda: membership.invalidate_cart(instance.cart_id))
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def invalidate_cart_code_membership(sender, instance, **kwargs):
+    transaction.on_commit(lambda: membership.cart_cache.invalidate(instance.cart_code))
+
+
+# Keep the per-worker product snapshot used for pricing current
+@receiver(post_save, sender=Product)
+def refresh_product_snapshot(sender, instance, **kwargs):
+    transaction.on_commit(lambda: product_snapshots.refresh(instance))
+
+
+@receiver(post_delete, sender=Product)
+def discard_product_snapshot(sender, instance, **kwargs):
+    transaction.on_commit(lambda: product_snapshots.discard(instance.id))
+
+
+# Keep category product counts, price ranges and top rated products current
+@receiver(pre_save, sender=Product)
+def remember_previous_category(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_category_id, instance._previous_slug = (
+            Product.objects.filter(pk=instance.pk).values_list("category_id", "slug").first() or (None, None)
+        )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_category_stats_for_product(sender, instance, **kwargs):
+    category_ids = {instance.category_id, getattr(instance, "_previous_category_id", None)}
+    transaction.on_commit(lambda: refresh_category_stats(category_ids))
+
+
+@receiver(post_save, sender=ProductRating)
+def update_category_top_rated(sender, instance, **kwargs):
+    category_id = Product.objects.filter(pk=instance.product_id).values_list("category_id", flat=True).first()
+    transaction.on_commit(lambda: refresh_category_stats([category_id]))
+
+
+# Cached product and category pages showing a changed product (pre_delete, while its neighbour rows still exist)
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def invalidate_product_pages(sender, instance, **kwargs):
+    product_slugs, category_slugs = pages_showing(
+        instance, getattr(instance, "_previous_slug", None), getattr(instance, "_previous_category_id", None)
+    )
+
+    def invalidate_pages():
+        invalidate("product", product_slugs)
+        invalidate("category", category_slugs)
+
+    transaction.on_commit(invalidate_pages)
 
-    review_average = reviews.aggregate(Avg("rating"))["rating__avg"] or 0.0
 
-    product_rating, created = ProductRating.objects.get_or_create(product=product)
-    product_rating.average_rating = review_average
-    product_rating.total_reviews = total_reviews
-    product_rating.save()
+# Cached category pages
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_page(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate("category", [instance.slug]))
 
 
+# Give a new account the orders already placed with its email, so they show in get_orders
+@receiver(post_save, sender=CustomUser)
+def link_guest_orders(sender, instance, created, **kwargs):
+    if created and instance.email:
+        Order.objects.filter(user__isnull=True, customer_email=instance.email).update(user=instance)
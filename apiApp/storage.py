@@ -0,0 +1,12 @@
+from storages.backends.s3 import S3Storage
+
+from .media import cache_control_for
+
+
+class MediaStorage(S3Storage):
+    """S3-compatible media storage that marks content-hashed variants as immutable."""
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        params.setdefault("CacheControl", cache_control_for(name))
+        return params
@@ -0,0 +1,214 @@
+"""
+A small database-backed task queue.
+
+Functions decorated with @task can be called later with `.delay(**kwargs)`
+(JSON-serialisable keyword arguments only). The Task row is inserted in the
+caller's transaction, so work is enqueued only if the request's writes commit,
+and `manage.py run_worker` processes pick it up.
+
+Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED where the database
+supports it (PostgreSQL). Elsewhere (SQLite) each candidate is claimed with a
+conditional UPDATE ... WHERE status='queued', which only one worker can win.
+
+A claim is a lease: while a task runs, its worker renews heartbeat_at every
+TASK_HEARTBEAT_SECONDS, and only tasks whose heartbeat is older than
+TASK_STALE_SECONDS are taken back from a worker presumed dead.
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class RegisteredTask:
+    def __init__(self, func, name, max_attempts, retry_delay):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def schedule(self, run_at, **kwargs):
+        """Enqueue a call to run no earlier than `run_at`."""
+        if getattr(settings, "TASK_ALWAYS_EAGER", False):
+            transaction.on_commit(lambda: self.func(**kwargs))
+            return None
+        return Task.objects.create(name=self.name, kwargs=kwargs, run_at=run_at, max_attempts=self.max_attempts)
+
+    def delay(self, **kwargs):
+        return self.schedule(timezone.now(), **kwargs)
+
+
+def task(name=None, max_attempts=3, retry_delay=30):
+    """Register a function as a task. Failed attempts retry after retry_delay, doubling each time."""
+    def register(func):
+        registered = RegisteredTask(func, name or f"{func.__module__}.{func.__name__}", max_attempts, retry_delay)
+        TASKS[registered.name] = registered
+        return registered
+    return register
+
+
+# ----------------------------
+# Worker side
+# ----------------------------
+def claim_tasks(worker_id, limit):
+    """Mark up to `limit` due tasks as running for this worker and return them."""
+    now = timezone.now()
+    due = Task.objects.filter(status=Task.QUEUED, run_at__lte=now).order_by("run_at", "id")
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            claimed = list(due.select_for_update(skip_locked=True)[:limit])
+            Task.objects.filter(id__in=[t.id for t in claimed]).update(
+                status=Task.RUNNING, locked_by=worker_id, started_at=now, heartbeat_at=now,
+                attempts=F("attempts") + 1,
+            )
+    else:
+        claimed = []
+        for candidate in due[:limit]:
+            won = Task.objects.filter(id=candidate.id, status=Task.QUEUED).update(
+                status=Task.RUNNING, locked_by=worker_id, started_at=now, heartbeat_at=now,
+                attempts=F("attempts") + 1,
+            )
+            if won:
+                claimed.append(candidate)
+    for claimed_task in claimed:
+        claimed_task.attempts += 1
+        claimed_task.status, claimed_task.locked_by = Task.RUNNING, worker_id
+        claimed_task.started_at = claimed_task.heartbeat_at = now
+    return claimed
+
+
+class Heartbeat:
+    """Renews a claimed task's heartbeat from a background thread until the block exits."""
+
+    def __init__(self, claimed, interval):
+        self._claimed = claimed
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"task-heartbeat-{claimed.id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self._interval):
+                try:
+                    _lease(self._claimed).update(heartbeat_at=timezone.now())
+                except Exception:
+                    logger.warning("Task heartbeat failed", exc_info=True, extra={"task_id": self._claimed.id})
+        finally:
+            connection.close()  # This thread's own connection
+
+
+def _lease(claimed):
+    """The task's row while this worker still holds it (not requeued and claimed elsewhere)."""
+    return Task.objects.filter(id=claimed.id, status=Task.RUNNING, locked_by=claimed.locked_by)
+
+
+def run_task(claimed):
+    """Run a claimed task and record the outcome; failures are requeued with backoff until max_attempts."""
+    registered = TASKS.get(claimed.name)
+    start = time.perf_counter()
+    try:
+        if registered is None:
+            raise LookupError(f"No task registered as {claimed.name!r}")
+        with Heartbeat(claimed, getattr(settings, "TASK_HEARTBEAT_SECONDS", 30)):
+            registered(**claimed.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        retry = registered is not None and claimed.attempts < claimed.max_attempts
+        update = {"last_error": error, "locked_by": ""}
+        if retry:
+            update.update(status=Task.QUEUED, run_at=timezone.now() + timedelta(
+                seconds=registered.retry_delay * 2 ** (claimed.attempts - 1)
+            ))
+        else:
+            update.update(status=Task.FAILED, finished_at=timezone.now())
+        _lease(claimed).update(**update)
+        logger.warning(
+            "Task failed", exc_info=True,
+            extra={"task": claimed.name, "task_id": claimed.id, "attempt": claimed.attempts, "will_retry": retry},
+        )
+        return False
+
+    _lease(claimed).update(status=Task.DONE, finished_at=timezone.now(), locked_by="")
+    logger.info("Task done", extra={
+        "task": claimed.name, "task_id": claimed.id,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+    })
+    return True
+
+
+def requeue_stale_tasks(timeout_seconds):
+    """
+    Take back running tasks whose heartbeat stopped `timeout_seconds` ago (the
+    worker died mid-run). Tasks with attempts left are queued again, the rest
+    marked failed. Returns (requeued, failed).
+    """
+    now = timezone.now()
+    stale = Task.objects.annotate(last_seen=Coalesce("heartbeat_at", "started_at")).filter(
+        status=Task.RUNNING, last_seen__lt=now - timedelta(seconds=timeout_seconds)
+    )
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Task.FAILED, finished_at=now, locked_by="",
+        last_error="The worker stopped sending heartbeats while running the task.",
+    )
+    requeued = stale.filter(attempts__lt=F("max_attempts")).update(status=Task.QUEUED, locked_by="")
+    return requeued, failed
+
+
+def prune_finished_tasks(days):
+    cutoff = timezone.now() - timedelta(days=days)
+    return Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff).delete()[0]
+
+
+def enqueue_periodic(schedule, last_enqueued):
+    """
+    Enqueue each {task name: interval seconds} entry whose interval has passed,
+    unless one is already queued or running. `last_enqueued` is updated in place.
+    """
+    now = time.monotonic()
+    for name, interval in schedule.items():
+        if now - last_enqueued.get(name, float("-inf")) < interval:
+            continue
+        last_enqueued[name] = now
+        if not Task.objects.filter(name=name, status__in=[Task.QUEUED, Task.RUNNING]).exists():
+            TASKS[name].delay()
+
+
+def task_stats():
+    """Per task name: counts by status, average run time of finished tasks, and the oldest due task's wait."""
+    stats = {}
+    for row in Task.objects.values("name", "status").annotate(count=Count("id")).order_by("name"):
+        stats.setdefault(row["name"], {})[row["status"]] = row["count"]
+    durations = (
+        Task.objects.filter(status=Task.DONE, started_at__isnull=False)
+        .values("name")
+        .annotate(average=Avg(F("finished_at") - F("started_at")))
+    )
+    for row in durations:
+        if row["average"] is not None:
+            stats[row["name"]]["avg_ms"] = round(row["average"].total_seconds() * 1000, 1)
+    oldest = Task.objects.filter(status=Task.QUEUED, run_at__lte=timezone.now()).order_by("run_at").first()
+    return stats, (timezone.now() - oldest.run_at).total_seconds() if oldest else 0.0
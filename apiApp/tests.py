@@ -1,3 +1,1366 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from botocore.stub import ANY, Stubber
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .analytics import rebuild_days, sales_series
+from .authentication import TokenCache, token_cache
+from .models import (
+    Cart, CartItem, Category, CustomUser, DailySales, Order, OrderItem, Product, ProductAssociation, ProductRating,
+    Review, SimilarProduct, Task, Wishlist
+)
+from .catalog import TOP_RATED_PER_CATEGORY, product_snapshots
+from .exports import read_watermarks
+from .facets import MAX_OFFSET
+from .images import render_variants, variant_srcsets
+from .jobs import fulfill_checkout_session
+from .inventory import (
+    OutOfStock, _take_across_shards, available_stock, commit_cart, reserve_cart, reshard_stock, take_stock
+)
+from .media import DEFAULT_CACHE, IMMUTABLE_CACHE
+from .money import MAX_MINOR, to_minor
+from .payments import paid_unit_prices
+from .query_plans import endpoint_requests, seed, sequential_scans
+from .ratings import import_reviews
+from .reviews import REVIEW_PAGE_SIZE
+from .storage import MediaStorage
+from . import routers
+from .tasks import TASKS, claim_tasks, requeue_stale_tasks, run_task, task
+from .throttling import hit, rejected_counts
+from .tracing import (
+    KIND_CLIENT, STATUS_ERROR, STATUS_OK, BackgroundHandler, JsonFormatter, span, trace_id_for
+)
+from .recommendations import (
+    BOUGHT_TOGETHER_LIMIT, MAX_BASKET_SIZE, _baskets, bought_together_for, compute_similar_products,
+    mine_bought_together, similar_products_for
+)
+from .views import fulfill_checkout
+
+
+def make_product(name, price=1000, **fields):
+    return Product.objects.create(name=name, description=name, price=price, **fields)
+
+
+def make_order(products, created=None, **fields):
+    order = Order.objects.create(**{
+        "stripe_checkout_id": f"cs_{Order.objects.count() + 1}", "amount": 0, "currency": "usd",
+        "customer_email": "buyer@example.com", "status": "Paid", **fields,
+    })
+    OrderItem.objects.bulk_create(OrderItem(order=order, product=product) for product in products)
+    if created is not None:
+        Order.objects.filter(id=order.id).update(created=created)
+    return order
+
+
+def make_user(name, **fields):
+    return CustomUser.objects.create_user(username=name, email=f"{name}@example.com", password="x", **fields)
+
+
+def auth(user):
+    return {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+
+
+_cart_codes = itertools.count()
+
+
+def make_cart(products, user=None, quantity=1):
+    # A counter rather than the row count: checkouts delete their carts.
+    cart = Cart.objects.create(cart_code=f"c{next(_cart_codes):010d}", user=user)
+    CartItem.objects.bulk_create(CartItem(cart=cart, product=product, quantity=quantity) for product in products)
+    return cart
+
+
+def checkout_session(cart, email="buyer@example.com", amount=0):
+    return {
+        "id": f"cs_{cart.cart_code}", "amount_total": amount, "currency": "usd",
+        "customer_email": email, "metadata": {"cart_code": cart.cart_code},
+    }
+
+
+def race(func, threads):
+    """Run func(i) on `threads` threads released together; returns results (exceptions included) by i."""
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def run(i):
+        try:
+            barrier.wait()
+            results[i] = func(i)
+        except Exception as e:
+            results[i] = e
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+class ConcurrentTestCase(TransactionTestCase):
+    """
+    For tests writing from several threads at once. That needs PostgreSQL, or a
+    file-backed SQLite test database whose writers queue (OPTIONS
+    transaction_mode "IMMEDIATE" plus a timeout); an in-memory SQLite database
+    fails them with "database table is locked".
+    """
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "postgresql":
+            return
+        queued = connection.settings_dict.get("OPTIONS", {}).get("transaction_mode") == "IMMEDIATE"
+        if connection.vendor != "sqlite" or connection.is_in_memory_db() or not queued:
+            self.skipTest("needs a database that serves concurrent writers")
+
+
+# ----------------------------
+# Wishlist
+# ----------------------------
+class WishlistRaceTests(ConcurrentTestCase):
+    def test_concurrent_toggles_never_duplicate_or_fail(self):
+        user = make_user("racer")
+        product = make_product("Contested")
+        headers = auth(user)
+
+        def toggle(i):
+            return Client().post(reverse("add_to_wishlist"), {"product_id": product.id}, **headers).status_code
+
+        for _ in range(10):
+            statuses = race(toggle, 4)
+            self.assertTrue(set(statuses) <= {200, 201}, statuses)
+            self.assertLessEqual(Wishlist.objects.filter(user=user, product=product).count(), 1)
+
+
+class MembershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("member")
+        self.products = [make_product(f"Tile {i}") for i in range(3)]
+        self.cart = make_cart(self.products[:1])
+
+    def membership(self, **headers):
+        ids = ",".join(str(product.id) for product in self.products)
+        response = self.client.get(
+            reverse("product_membership"), {"product_ids": ids, "cart_code": self.cart.cart_code}, **headers
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_reports_wishlist_and_cart_members(self):
+        Wishlist.objects.create(user=self.user, product=self.products[2])
+        self.assertEqual(
+            self.membership(**auth(self.user)), {"wishlist": [self.products[2].id], "cart": [self.products[0].id]}
+        )
+        self.assertEqual(self.membership(), {"wishlist": [], "cart": [self.products[0].id]})
+
+    def test_repeat_reads_are_served_from_the_shared_cache(self):
+        self.membership(**auth(self.user))
+        with self.assertNumQueries(0):
+            self.membership(**auth(self.user))
+
+    def test_adds_and_removes_invalidate(self):
+        headers = auth(self.user)
+        self.assertEqual(self.membership(**headers), {"wishlist": [], "cart": [self.products[0].id]})
+
+        self.client.post(reverse("add_to_wishlist"), {"product_id": self.products[1].id}, **headers)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("add_to_cart"), {"cart_code": self.cart.cart_code, "product_id": self.products[2].id})
+        self.assertEqual(self.membership(**headers), {
+            "wishlist": [self.products[1].id], "cart": [self.products[0].id, self.products[2].id]
+        })
+
+        self.client.post(reverse("add_to_wishlist"), {"product_id": self.products[1].id}, **headers)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse("delete_cartitem", args=[self.cart.cartitems.get(product=self.products[0]).id]))
+        self.assertEqual(self.membership(**headers), {"wishlist": [], "cart": [self.products[2].id]})
+
+    def test_invalid_and_too_many_ids_are_rejected(self):
+        url = reverse("product_membership")
+        self.assertEqual(self.client.get(url, {"product_ids": "1,x"}).status_code, 400)
+        ids = ",".join(str(i) for i in range(1, 202))
+        self.assertEqual(self.client.get(url, {"product_ids": ids}).status_code, 400)
+        ids = ",".join(str(i) for i in range(1, 201))
+        self.assertEqual(self.client.get(url, {"product_ids": ids}).status_code, 200)
+
+
+# ----------------------------
+# Authentication
+# ----------------------------
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = make_user("holder")
+
+    def test_verified_tokens_skip_validation_and_the_user_row(self):
+        headers = auth(self.user)
+        verify = mock.patch.object(AccessToken, "verify", autospec=True, side_effect=AccessToken.verify)
+        with verify as verified:
+            for _ in range(3):
+                with self.assertNumQueries(1):  # The wishlist itself; the caller comes from the claims
+                    self.assertEqual(self.client.get(reverse("my_wishlists"), **headers).status_code, 200)
+        self.assertEqual(verified.call_count, 1)
+
+    def test_cached_tokens_expire_and_forged_tokens_are_rejected(self):
+        token = AccessToken.for_user(self.user)
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        self.assertEqual(self.client.get(reverse("my_wishlists"), **headers).status_code, 200)
+        with mock.patch("apiApp.authentication.time.time", return_value=token["exp"] + 1):
+            self.assertIsNone(token_cache.get(str(token)))
+
+        forged = str(token).rsplit(".", 1)[0] + ".c2lnbmF0dXJl"
+        response = self.client.get(reverse("my_wishlists"), HTTP_AUTHORIZATION=f"Bearer {forged}")
+        self.assertEqual(response.status_code, 401)
+
+    def test_least_recently_used_tokens_are_evicted(self):
+        tokens = TokenCache(max_size=2)
+        first, second, third = (AccessToken.for_user(make_user(f"user{i}")) for i in range(3))
+        tokens.set("first", first)
+        tokens.set("second", second)
+        tokens.get("first")
+        tokens.set("third", third)
+        self.assertIsNone(tokens.get("second"))
+        self.assertIs(tokens.get("first"), first)
+        self.assertIs(tokens.get("third"), third)
+
+# ----------------------------
+# Product snapshots and prices
+# ----------------------------
+class SnapshotTests(TestCase):
+    def setUp(self):
+        product_snapshots.clear()
+
+    def assertSnapshotsMatchDatabase(self, products, cart):
+        ids = [product.id for product in products]
+        snapshots = product_snapshots.get_many(ids)
+        rows = Product.objects.filter(id__in=ids).values_list("id", "name", "slug", "price")
+        self.assertEqual({(s.id, s.name, s.slug, s.price_cents) for s in snapshots.values()}, set(rows))
+        expected = cart.cartitems.aggregate(total=Sum(F("product__price") * F("quantity")))["total"]
+        self.assertEqual(cart.total_amount, expected)
+        self.assertEqual(sum(item.sub_total for item in cart.cartitems.all()), expected)
+
+    def test_snapshots_match_the_database_after_changes(self):
+        products = [make_product(f"Item {i}", price=199 + i * 1000) for i in range(3)]
+        cart = make_cart(products, quantity=3)
+        self.assertSnapshotsMatchDatabase(products, cart)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            products[1].price = 4321
+            products[1].name = "Renamed"
+            products[1].save()
+        self.assertSnapshotsMatchDatabase(products, cart)
+
+    def test_sub_total_without_a_snapshot_is_priced_from_the_database(self):
+        cart = make_cart([make_product("Pen", price=250)], quantity=4)
+        with mock.patch.object(product_snapshots, "get", return_value=None):
+            self.assertEqual(cart.cartitems.get().sub_total, 1000)
+
+    def test_order_items_record_what_stripe_charged(self):
+        charged, uncovered = make_product("Charged", price=1000), make_product("Uncovered", price=500)
+        cart = make_cart([charged, uncovered])
+        product_snapshots.get_many([charged.id, uncovered.id])
+        Product.objects.filter(id=uncovered.id).update(price=650)  # Leaves this worker's snapshot stale
+
+        fulfill_checkout(checkout_session(cart, amount=1550), cart.cart_code, {charged.id: 900})
+        prices = dict(OrderItem.objects.values_list("product_id", "unit_price"))
+        self.assertEqual(prices, {charged.id: 900, uncovered.id: 650})
+
+    def test_paid_unit_prices_come_from_session_line_items(self):
+        def line(product_id, amount):
+            metadata = {"product_id": product_id} if product_id else {}
+            return {"price": {"unit_amount": amount, "product": {"metadata": metadata}}}
+
+        stripe = mock.Mock()
+        stripe.checkout.Session.list_line_items.return_value.auto_paging_iter.return_value = [
+            line("7", 900), line("8", 1250), line(None, 300)
+        ]
+        with mock.patch("apiApp.payments.stripe_client", return_value=stripe):
+            self.assertEqual(paid_unit_prices("cs_1"), {7: 900, 8: 1250})
+
+
+# ----------------------------
+# Category stats
+# ----------------------------
+class CategoryStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.books, self.toys = Category.objects.create(name="Books"), Category.objects.create(name="Toys")
+
+    def stats(self, category):
+        return Category.objects.values_list("product_count", "min_price", "max_price").get(id=category.id)
+
+    def top_rated(self, category):
+        return [product["slug"] for product in Category.objects.get(id=category.id).top_rated]
+
+    def test_product_changes_keep_counts_and_prices_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product("Novel", price=1500, category=self.books)
+            atlas = make_product("Atlas", price=6000, category=self.books)
+            kite = make_product("Kite", price=1800, category=self.toys)
+        self.assertEqual(self.stats(self.books), (2, 1500, 6000))
+        self.assertEqual(self.stats(self.toys), (1, 1800, 1800))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            atlas.category = self.toys
+            atlas.save()
+        self.assertEqual(self.stats(self.books), (1, 1500, 1500))
+        self.assertEqual(self.stats(self.toys), (2, 1800, 6000))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kite.delete()
+            atlas.delete()
+        self.assertEqual(self.stats(self.toys), (0, None, None))
+
+    def test_top_rated_follows_ratings(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            products = [make_product(f"Book {i}", category=self.books) for i in range(TOP_RATED_PER_CATEGORY + 2)]
+        self.assertEqual(self.top_rated(self.books), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for score, product in enumerate(products):
+                ProductRating.objects.create(product=product, average_rating=1.0 + score * 0.5, total_reviews=1)
+        self.assertEqual(
+            self.top_rated(self.books), [product.slug for product in products[::-1][:TOP_RATED_PER_CATEGORY]]
+        )
+
+    def test_rebuild_command_repairs_drifted_stats(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product("Novel", price=1500, category=self.books)
+            make_product("Atlas", price=6050, category=self.books)
+        Category.objects.update(product_count=99, min_price=1, max_price=None, top_rated=[{"slug": "gone"}])
+
+        call_command("rebuild_category_stats", stdout=StringIO())
+        self.assertEqual(self.stats(self.books), (2, 1500, 6050))
+        self.assertEqual(self.stats(self.toys), (0, None, None))
+        listed = {row["slug"]: row for row in self.client.get(reverse("category_list")).json()}
+        self.assertEqual(
+            [listed[self.books.slug][field] for field in ("product_count", "min_price", "max_price", "top_rated")],
+            [2, "15.00", "60.50", []],
+        )
+
+# ----------------------------
+# Inventory
+# ----------------------------
+class StockRaceTests(ConcurrentTestCase):
+    def sell(self, product, quantity, threads):
+        def buy(i):
+            return take_stock(product, quantity)
+
+        results = race(buy, threads)
+        self.assertTrue(all(isinstance(result, (list, OutOfStock)) for result in results), results)
+        return sum(sum(units for _, units in result) for result in results if isinstance(result, list))
+
+    def test_concurrent_buyers_never_oversell(self):
+        product = make_product("Limited", stock=10)
+        self.assertEqual(self.sell(product, 1, 30), 10)
+        self.assertEqual(available_stock(Product.objects.get(id=product.id)), 0)
+
+    def test_concurrent_buyers_never_oversell_a_sharded_product(self):
+        product = reshard_stock(make_product("Hot", stock=10), 4)
+        self.assertEqual(self.sell(product, 2, 12), 10)
+        self.assertEqual(available_stock(Product.objects.get(id=product.id)), 0)
+
+
+class StockTests(TestCase):
+    def test_order_larger_than_any_shard_is_filled(self):
+        product = reshard_stock(make_product("Hot", stock=10), 4)  # 3, 3, 2, 2
+        self.assertEqual(sum(units for _, units in take_stock(product, 4)), 4)
+        self.assertEqual(available_stock(product), 6)
+        take_stock(product, 6)
+        with self.assertRaises(OutOfStock):
+            take_stock(product, 1)
+
+    def test_take_across_shards_drains_shards_in_order_then_product_stock(self):
+        product = reshard_stock(make_product("Hot", stock=10), 4)  # 3, 3, 2, 2
+        self.assertEqual(_take_across_shards(product, 7), [(0, 3), (1, 3), (2, 1)])
+        Product.objects.filter(id=product.id).update(stock=2)
+        self.assertEqual(_take_across_shards(product, 4), [(2, 1), (3, 2), (None, 1)])
+        self.assertEqual(available_stock(Product.objects.get(id=product.id)), 1)
+
+    def test_take_across_shards_takes_nothing_when_the_total_is_short(self):
+        product = reshard_stock(make_product("Hot", stock=5), 2)
+        with self.assertRaises(OutOfStock):
+            _take_across_shards(product, 6)
+        self.assertEqual(sorted(product.shards.values_list("quantity", flat=True)), [2, 3])
+
+    def test_commit_reports_unreserved_lines_it_cannot_supply(self):
+        scarce, plenty, unlimited = make_product("Scarce", stock=1), make_product("Plenty", stock=9), make_product("Free")
+        cart = make_cart([scarce, plenty, unlimited], quantity=3)
+        self.assertEqual(commit_cart(cart), {scarce.id: 3})
+        stock = dict(Product.objects.values_list("id", "stock"))
+        self.assertEqual((stock[scarce.id], stock[plenty.id], stock[unlimited.id]), (1, 6, None))
+
+    def test_commit_returns_reserved_units_the_cart_no_longer_needs(self):
+        product = make_product("Mug", stock=5)
+        cart = make_cart([product], quantity=3)
+        reserve_cart(cart)
+        cart.cartitems.update(quantity=1)
+        fulfill_checkout(checkout_session(cart), cart.cart_code)
+        self.assertEqual(available_stock(Product.objects.get(id=product.id)), 4)
+
+    def test_paid_order_for_sold_out_stock_is_backordered(self):
+        product = make_product("Sold out", stock=0)
+        cart = make_cart([product], quantity=2)
+        fulfill_checkout(checkout_session(cart), cart.cart_code)
+        order = Order.objects.get()
+        self.assertTrue(order.backordered)
+        self.assertEqual(order.items.get().backordered, 2)
+
+    def test_admin_save_keeps_concurrent_sales(self):
+        self.client.force_login(CustomUser.objects.create_superuser("admin", "admin@example.com", "x"))
+        product = make_product("Desk", stock=10)
+        take_stock(product, 3)  # Sold while the change form is open
+        response = self.client.post(reverse("admin:apiApp_product_change", args=[product.id]), {
+            "name": "Desk", "description": "Desk", "price": "10.00", "slug": product.slug,
+            "featured": "on", "stock_adjustment": "5",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.get(id=product.id).stock, 12)
+
+
+# ----------------------------
+# Money
+# ----------------------------
+class MoneyTests(TestCase):
+    def test_to_minor_rejects_what_a_money_field_cannot_store(self):
+        self.assertEqual(to_minor("12.345"), 1235)
+        self.assertEqual(to_minor("92233720368547758.07"), MAX_MINOR)
+        for value in ("abc", "NaN", "-Infinity", "1e30", "-1e17", "1e999999999"):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                to_minor(value)
+
+    def test_unusable_price_filters_are_400(self):
+        for value in ("1e30", "NaN", "abc"):
+            with self.subTest(value=value):
+                response = self.client.get(reverse("filter_products"), {"min_price": value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("min_price", response.json())
+
+
+# ----------------------------
+# Filtering
+# ----------------------------
+class FacetTests(TestCase):
+    def setUp(self):
+        self.books, self.toys = Category.objects.create(name="Books"), Category.objects.create(name="Toys")
+        make_product("Novel", price=1500, category=self.books, featured=True)
+        make_product("Atlas", price=6000, category=self.books, featured=False)
+        make_product("Kite", price=1800, category=self.toys, featured=True)
+        make_product("Puzzle", price=30000, category=self.toys, featured=False)
+
+    def search(self, **params):
+        response = self.client.get(reverse("filter_products"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_a_selected_facet_counts_without_its_own_filter(self):
+        data = self.search(category="books")
+        self.assertEqual(data["count"], 2)
+        counts = {row["slug"]: row["count"] for row in data["facets"]["category"]}
+        self.assertEqual(counts, {self.books.slug: 2, self.toys.slug: 2})
+        self.assertEqual(data["facets"]["featured"], {"true": 1, "false": 1})
+
+        data = self.search(category="books", featured="true")
+        self.assertEqual(data["count"], 1)
+        counts = {row["slug"]: row["count"] for row in data["facets"]["category"]}
+        self.assertEqual(counts, {self.books.slug: 1, self.toys.slug: 1})
+        self.assertEqual(data["facets"]["featured"], {"true": 1, "false": 1})
+
+        data = self.search(max_price="20.00")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual([bucket["count"] for bucket in data["facets"]["price"]["buckets"]], [2, 0, 1, 0, 1, 0])
+
+    def test_non_finite_ratings_are_400(self):
+        for value in ("nan", "inf", "-Infinity", "four"):
+            with self.subTest(value=value):
+                response = self.client.get(reverse("filter_products"), {"min_rating": value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("min_rating", response.json())
+
+    def test_deep_pages_are_400(self):
+        self.assertEqual(self.search(page=MAX_OFFSET // 24 + 1)["count"], 4)
+        for page in (MAX_OFFSET // 24 + 2, 10 ** 20):
+            with self.subTest(page=page):
+                response = self.client.get(reverse("filter_products"), {"page": page})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("page", response.json())
+
+# ----------------------------
+# Tracing
+# ----------------------------
+class TracingTests(TestCase):
+    def exported(self, logs):
+        return [
+            json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+            for line in (record.getMessage() for record in logs.records)
+        ]
+
+    def test_spans_nest_and_record_errors(self):
+        with self.assertLogs("apiApp.traces", "INFO") as logs:
+            with self.assertRaises(RuntimeError), span("outer", {"step": 1}) as outer:
+                with span("inner", kind=KIND_CLIENT):
+                    pass
+                raise RuntimeError("boom")
+        inner, exported_outer = self.exported(logs)
+        self.assertEqual(exported_outer["spanId"], outer.span_id)
+        self.assertEqual((inner["traceId"], inner["parentSpanId"]), (outer.trace_id, outer.span_id))
+        self.assertNotIn("parentSpanId", exported_outer)
+        self.assertEqual(inner["status"], {"code": STATUS_OK})
+        self.assertEqual(exported_outer["status"], {"code": STATUS_ERROR, "message": "RuntimeError: boom"})
+        self.assertEqual(exported_outer["attributes"], [{"key": "step", "value": {"intValue": "1"}}])
+
+    def test_trace_key_correlates_separate_requests(self):
+        with self.assertLogs("apiApp.traces", "INFO") as logs:
+            with span("checkout.create", trace_key="c0000000042"):
+                pass
+            with span("unrelated request"):
+                with span("stripe.webhook", trace_key="c0000000042") as webhook:
+                    pass
+        create, joined, unrelated = self.exported(logs)
+        self.assertEqual(create["traceId"], trace_id_for("c0000000042"))
+        self.assertEqual(joined["traceId"], create["traceId"])
+        # Rejoining another trace starts a root span there rather than pointing at a foreign parent.
+        self.assertNotIn("parentSpanId", joined)
+        self.assertNotEqual(unrelated["traceId"], create["traceId"])
+
+        record = logging.makeLogRecord({"msg": "inside", "name": "apiApp.views", "order_id": 7})
+        with span("formatted", trace_key="c0000000042") as current:
+            entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual((entry["trace_id"], entry["span_id"]), (current.trace_id, current.span_id))
+        self.assertEqual(entry["order_id"], 7)
+
+    @skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_background_handler_writes_from_forked_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "app.log")
+        handler = BackgroundHandler(filename=path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler.handle(logging.makeLogRecord({"msg": f"parent {os.getpid()}"}))
+
+        pid = os.fork()
+        if pid == 0:
+            # The parent's writer thread didn't survive the fork; this record needs a new one.
+            try:
+                handler.handle(logging.makeLogRecord({"msg": f"child {os.getpid()}"}))
+                handler.close()
+            finally:
+                os._exit(0)
+        _, exit_status = os.waitpid(pid, 0)
+        handler.close()
+
+        self.assertEqual(exit_status, 0)
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(sorted(f.read().splitlines()), [f"child {pid}", f"parent {os.getpid()}"])
+
+# ----------------------------
+# Task queue
+# ----------------------------
+class StaleTaskTests(TestCase):
+    def running_task(self, attempts, heartbeat_age):
+        seen = timezone.now() - timedelta(seconds=heartbeat_age)
+        return Task.objects.create(
+            name="tests.stale", status=Task.RUNNING, run_at=seen, started_at=seen, heartbeat_at=seen,
+            attempts=attempts, max_attempts=3, locked_by="dead-worker",
+        )
+
+    def test_stale_tasks_are_requeued_until_out_of_attempts(self):
+        retry = self.running_task(attempts=1, heartbeat_age=600)
+        exhausted = self.running_task(attempts=3, heartbeat_age=600)
+        alive = self.running_task(attempts=3, heartbeat_age=10)
+
+        self.assertEqual(requeue_stale_tasks(300), (1, 1))
+        statuses = dict(Task.objects.values_list("id", "status"))
+        self.assertEqual(statuses, {retry.id: Task.QUEUED, exhausted.id: Task.FAILED, alive.id: Task.RUNNING})
+
+
+@override_settings(TASK_HEARTBEAT_SECONDS=0.05)
+class TaskHeartbeatTests(TransactionTestCase):
+    def tearDown(self):
+        TASKS.pop("tests.slow", None)
+
+    def test_long_running_task_is_not_taken_back(self):
+        requeued = []
+
+        @task(name="tests.slow")
+        def slow():
+            time.sleep(0.5)
+            # Started longer ago than the stale timeout, but its heartbeat is fresh.
+            requeued.append(requeue_stale_tasks(0.3))
+
+        slow.delay()
+        [claimed] = claim_tasks("worker", 1)
+        self.assertTrue(run_task(claimed))
+        self.assertEqual(requeued, [(0, 0)])
+        done = Task.objects.get()
+        self.assertEqual((done.status, done.attempts), (Task.DONE, 1))
+        self.assertGreater(done.heartbeat_at, done.started_at)
+
+
+# ----------------------------
+# Throttling
+# ----------------------------
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_new_cart_codes_do_not_reset_the_checkout_limit(self):
+        statuses = [
+            self.client.post(reverse("create_checkout_session"), {"cart_code": f"x{i:010d}", "email": "a@b.c"}).status_code
+            for i in range(11)
+        ]
+        self.assertNotIn(429, statuses[:10])
+        self.assertEqual(statuses[10], 429)
+
+    def test_rejections_are_counted_per_scope(self):
+        self.assertEqual(rejected_counts(["checkout", "cart"]), {"checkout": 0, "cart": 0})
+        for i in range(12):
+            self.client.post(reverse("create_checkout_session"), {"cart_code": f"x{i:010d}", "email": "a@b.c"})
+        self.assertEqual(rejected_counts(["checkout", "cart"]), {"checkout": 2, "cart": 0})
+
+    def test_concurrent_requests_admit_exactly_the_limit(self):
+        now = 1_000_000.0
+        results = race(lambda i: hit("race", limit=10, window=60, now=now)[0], 25)
+        self.assertEqual(results.count(True), 10)
+
+    def test_previous_window_counts_while_it_overlaps(self):
+        for _ in range(10):
+            self.assertTrue(hit("slide", limit=10, window=60, now=59.0)[0])
+        # Halfway into the next window half of the previous one still counts.
+        self.assertEqual([hit("slide", limit=10, window=60, now=90.0)[0] for _ in range(6)], [True] * 5 + [False])
+        self.assertTrue(hit("slide", limit=10, window=60, now=119.0)[0])
+
+
+# ----------------------------
+# Orders
+# ----------------------------
+class OrderHistoryTests(TestCase):
+    def test_query_count_does_not_grow_with_orders(self):
+        user = make_user("shopper")
+        products = [make_product(f"Thing {i}") for i in range(3)]
+        make_order(products, user=user)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("get_orders"), **auth(user))
+        self.assertEqual(len(response.json()), 1)
+
+        for _ in range(5):
+            make_order(products, user=user)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("get_orders"), **auth(user))
+        self.assertEqual(len(response.json()), 6)
+
+    def test_guest_orders_are_linked_when_the_account_is_created(self):
+        make_order([make_product("Gift")], customer_email="later@example.com")
+        user = make_user("later")
+        response = self.client.get(reverse("get_orders"), **auth(user))
+        self.assertEqual(len(response.json()), 1)
+
+    def test_checkout_links_the_cart_owner_paying_with_another_email(self):
+        user = make_user("owner")
+        cart = make_cart([make_product("Lamp")], user=user)
+        fulfill_checkout(checkout_session(cart, email="work@example.com"), cart.cart_code)
+        self.assertEqual(Order.objects.get().user, user)
+
+
+class CheckoutTaskTests(TestCase):
+    def run_fulfilment(self, session, cart_code):
+        stripe = mock.Mock()
+        stripe.checkout.Session.retrieve.return_value = session
+        stripe.checkout.Session.list_line_items.return_value.auto_paging_iter.return_value = []
+        fulfill_checkout_session.delay(session_id=session["id"], cart_code=cart_code)
+        with mock.patch("apiApp.payments.stripe_client", return_value=stripe):
+            [claimed] = claim_tasks("worker", 1)
+            self.assertTrue(run_task(claimed))
+        self.assertEqual(Task.objects.get(id=claimed.id).status, Task.DONE)
+        return stripe
+
+    def test_missing_cart_is_not_retried(self):
+        cart = make_cart([make_product("Gone")])
+        session = checkout_session(cart)
+        cart.delete()
+        with self.assertLogs("apiApp.jobs", "ERROR"):
+            self.run_fulfilment(session, cart.cart_code)
+        self.assertFalse(Order.objects.exists())
+
+    def test_fulfilled_session_skips_stripe(self):
+        cart = make_cart([make_product("Once")])
+        session = checkout_session(cart)
+        self.run_fulfilment(session, cart.cart_code)
+        self.assertEqual(Order.objects.count(), 1)
+
+        stripe = self.run_fulfilment(session, cart.cart_code)
+        stripe.checkout.Session.retrieve.assert_not_called()
+        self.assertEqual(Order.objects.count(), 1)
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.lamps = Category.objects.create(name="Lamps")
+        self.desk = make_product("Desk lamp", price=2500, category=self.lamps)
+        self.floor = make_product("Floor lamp", price=9000, category=self.lamps)
+        self.bulb = make_product("Bulb", price=300)
+
+    def checkout(self, products, quantity, amount, unit_prices=None):
+        cart = make_cart(products, quantity=quantity)
+        fulfill_checkout(checkout_session(cart, amount=amount), cart.cart_code, unit_prices)
+
+    def series(self):
+        return [
+            sales_series(self.today, self.today),
+            sales_series(self.today, self.today, product=self.desk),
+            sales_series(self.today, self.today, category=self.lamps),
+        ]
+
+    def test_orders_are_added_to_the_rollups(self):
+        self.checkout([self.desk, self.bulb], quantity=2, amount=5600)
+        self.checkout([self.desk, self.floor], quantity=1, amount=11000, unit_prices={self.desk.id: 2000})
+        overall, desk, lamps = self.series()
+        self.assertEqual(overall, [{"date": self.today, "orders": 2, "units": 6, "revenue": 16600}])
+        self.assertEqual(desk, [{"date": self.today, "units": 3, "revenue": 7000}])
+        self.assertEqual(lamps, [{"date": self.today, "units": 4, "revenue": 16000}])
+
+    def test_rebuild_matches_the_incremental_totals(self):
+        for i in range(12):
+            self.checkout([self.desk, self.floor, self.bulb][: i % 3 + 1], quantity=i % 2 + 1, amount=1000 * i)
+        incremental = self.series()
+        self.assertGreater(DailySales.objects.filter(date=self.today).count(), 1)
+
+        self.assertEqual(rebuild_days(self.today, self.today), 12)
+        self.assertEqual(self.series(), incremental)
+
+    def test_series_sums_shards_and_zero_fills(self):
+        yesterday = self.today - timedelta(days=1)
+        DailySales.objects.create(date=self.today, shard=0, orders=1, units=2, revenue=500)
+        DailySales.objects.create(date=self.today, shard=3, orders=2, units=1, revenue=700)
+        self.assertEqual(sales_series(yesterday, self.today), [
+            {"date": yesterday, "orders": 0, "units": 0, "revenue": 0},
+            {"date": self.today, "orders": 3, "units": 3, "revenue": 1200},
+        ])
+
+    def test_report_is_staff_only(self):
+        self.checkout([self.floor], quantity=1, amount=9000)
+        url = reverse("sales_report")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, **auth(make_user("shopper"))).status_code, 403)
+
+        response = self.client.get(url, {"category": self.lamps.slug}, **auth(make_user("boss", is_staff=True)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["days"]), 30)
+        self.assertEqual(response.json()["totals"], {"units": 1, "revenue": "90.00"})
+
+
+# ----------------------------
+# Replica routing
+# ----------------------------
+class StubPool(routers.ReplicaPool):
+    def __init__(self, aliases, lags=None, **kwargs):
+        super().__init__(aliases, retry_after=30, **kwargs)
+        self.lags = lags or {}
+        self.picks = 0
+
+    def _connects(self, alias):
+        return True
+
+    def lag(self, alias):
+        return self.lags.get(alias, 0.0)
+
+    def pick(self):
+        self.picks += 1
+        return super().pick()
+
+
+class ReplicaRoutingTests(TestCase):
+    def run_request(self, request, view):
+        """Pass `request` for a replica-eligible view through the middleware; `view` runs the queries."""
+        def get_response(request):
+            middleware.process_view(request, None, (), {})
+            view(request)
+            return HttpResponse()
+
+        middleware = routers.ReplicaRoutingMiddleware(get_response)
+        request.resolver_match = mock.Mock(url_name="product_reviews")
+        return middleware(request)
+
+    def test_one_replica_serves_the_whole_request(self):
+        pool = StubPool(["replica_1", "replica_2"])
+        router = routers.ReplicaRouter()
+        used = []
+        with mock.patch.object(routers, "replicas", pool):
+            self.run_request(RequestFactory().get("/"), lambda request: used.extend(
+                router.db_for_read(Product) for _ in range(3)
+            ))
+        self.assertEqual(used, ["replica_1"] * 3)
+        self.assertEqual(pool.picks, 1)
+
+    def test_lagging_replica_is_skipped(self):
+        pool = StubPool(["replica_1", "replica_2"], lags={"replica_1": 30.0}, max_lag=5)
+        self.assertEqual(pool.pick(), "replica_2")
+        self.assertEqual(pool.pick(), "replica_2")
+
+    def test_writer_is_pinned_by_header_and_by_token(self):
+        user = make_user("writer")
+        router = routers.ReplicaRouter()
+        pool = StubPool(["replica_1"])
+        with mock.patch.object(routers, "replicas", pool):
+            response = self.run_request(RequestFactory().post("/", **auth(user)), lambda request: router.db_for_write(Product))
+            pin = response[routers.PIN_HEADER]
+            self.assertGreater(float(pin), time.time())
+
+            used = []
+            read = lambda request: used.append(router.db_for_read(Product))  # noqa: E731
+            self.run_request(RequestFactory().get("/", HTTP_X_DB_PIN=pin), read)
+            self.run_request(RequestFactory().get("/", **auth(user)), read)
+            self.run_request(RequestFactory().get("/"), read)
+        self.assertEqual(used, [None, None, "replica_1"])
+
+
+# ----------------------------
+# Reviews
+# ----------------------------
+class ReviewPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product("Tent")
+        users = CustomUser.objects.bulk_create(
+            CustomUser(username=f"reviewer{i}", email=f"reviewer{i}@example.com") for i in range(25)
+        )
+        Review.objects.bulk_create(
+            Review(product=self.product, user=user, rating=i % 5 + 1, review=f"Review {i}")
+            for i, user in enumerate(users)
+        )
+        # Groups of three share a timestamp, so pages must break ties on id.
+        now = timezone.now()
+        for i, review in enumerate(Review.objects.order_by("id")):
+            Review.objects.filter(id=review.id).update(created=now - timedelta(minutes=i // 3))
+        self.newest_first = list(Review.objects.order_by("-created", "-id").values_list("id", flat=True))
+
+    def walk(self, url, **params):
+        ids, cursor, pages = [], None, 0
+        while True:
+            response = self.client.get(url, {**params, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            ids += [review["id"] for review in response.json()["results"]]
+            cursor, pages = response.json()["next_cursor"], pages + 1
+            if cursor is None:
+                return ids, pages
+
+    def test_cursors_walk_every_review_once_newest_first(self):
+        url = reverse("product_reviews", args=[self.product.slug])
+        self.assertEqual(self.walk(url), (self.newest_first, 3))
+        self.assertEqual(self.walk(url, page_size=7), (self.newest_first, 4))
+
+        five_stars = [review.id for review in Review.objects.filter(rating=5).order_by("-created", "-id")]
+        self.assertEqual(self.walk(url, rating=5, page_size=2), (five_stars, 3))
+
+    def test_bad_parameters_are_400(self):
+        url = reverse("product_reviews", args=[self.product.slug])
+        for cursor in ("not-a-cursor!", "bm8gc2VwYXJhdG9y", "eHx5"):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.json())
+        self.assertEqual(self.client.get(url, {"rating": "6"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"page_size": "ten"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("product_reviews", args=["missing"])).status_code, 404)
+
+    def test_detail_page_embeds_the_first_page_and_its_cursor(self):
+        detail = self.client.get(reverse("product_detail", args=[self.product.slug])).json()
+        self.assertEqual([review["id"] for review in detail["reviews"]], self.newest_first[:REVIEW_PAGE_SIZE])
+        counts = [detail[f"{name}_review"] for name in ("poor", "fair", "good", "very_good", "excellent")]
+        self.assertEqual(counts, [5] * 5)
+
+        url = reverse("product_reviews", args=[self.product.slug])
+        rest = self.client.get(url, {"cursor": detail["reviews_next_cursor"]}).json()
+        self.assertEqual(
+            [review["id"] for review in rest["results"]], self.newest_first[REVIEW_PAGE_SIZE:2 * REVIEW_PAGE_SIZE]
+        )
+
+        quiet = make_product("Quiet")
+        detail = self.client.get(reverse("product_detail", args=[quiet.slug])).json()
+        self.assertEqual((detail["reviews"], detail["reviews_next_cursor"]), ([], None))
+
+
+class ReviewImportTests(TestCase):
+    def test_reviews_with_unknown_references_are_skipped(self):
+        product, user = make_product("Tent"), make_user("camper")
+        reviews = [
+            Review(product_id=product.id, user_id=user.id, rating=5, review="Dry all night"),
+            Review(product_id=product.id + 100, user_id=user.id, rating=1, review=""),
+            Review(product_id=product.id, user_id=user.id + 100, rating=2, review=""),
+        ]
+        count, skipped = import_reviews(reviews, batch_size=2)
+
+        self.assertEqual(count, 1)
+        self.assertEqual([reason for _, reason in skipped], [
+            f"no product with id {product.id + 100}", f"no user with id {user.id + 100}",
+        ])
+        self.assertEqual(Review.objects.get().review, "Dry all night")
+        self.assertEqual(ProductRating.objects.get(product=product).total_reviews, 1)
+
+    def test_command_reports_bad_rows_and_imports_the_rest(self):
+        product, user = make_product("Stove"), make_user("cook")
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("product_id,user_id,rating,review\n")
+            f.write(f"{product.id},{user.id},4,Boils fast\n")
+            f.write(f"{product.id},{user.id},9,Out of range\n")
+            f.write(f"{product.id + 100},{user.id},3,Unknown product\n")
+        self.addCleanup(os.remove, f.name)
+        stdout, stderr = StringIO(), StringIO()
+
+        call_command("import_reviews", f.name, stdout=stdout, stderr=stderr)
+
+        self.assertEqual(Review.objects.get().review, "Boils fast")
+        self.assertIn(f"{f.name}:3: rating 9 is outside 1-5", stderr.getvalue())
+        self.assertIn(f"product_id={product.id + 100} user_id={user.id}: no product", stderr.getvalue())
+        self.assertIn("skipped 2 invalid rows", stdout.getvalue())
+
+
+# ----------------------------
+# Admin
+# ----------------------------
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(CustomUser.objects.create_superuser("admin", "admin@example.com", "x"))
+
+    def add_rows(self, count):
+        category = Category.objects.create(name=f"Category {Category.objects.count()}")
+        user = make_user(f"customer{CustomUser.objects.count()}")
+        for i in range(count):
+            product = make_product(f"{category.name} item {i}", category=category)
+            make_order([product], user=user)
+            Review.objects.create(product=product, user=user, rating=4, review="Good")
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        # Session, user, COUNT and the page; the product list also loads the category filter choices.
+        for model, queries in (("product", 5), ("order", 4), ("review", 4)):
+            url = reverse(f"admin:apiApp_{model}_changelist")
+            for rows in (1, 10):
+                self.add_rows(rows)
+                with self.subTest(model=model, rows=rows), self.assertNumQueries(queries):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+
+# ----------------------------
+# Media
+# ----------------------------
+class MediaTests(TestCase):
+    name = "product_img/photo-0123456789ab.webp"
+    body = bytes(range(100))
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        os.makedirs(os.path.join(media_root, "product_img"))
+        with open(os.path.join(media_root, self.name), "wb") as f:
+            f.write(self.body)
+        self.url = reverse("media", kwargs={"path": self.name})
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        return response, b"".join(response.streaming_content) if response.streaming else response.content
+
+    def test_full_response_carries_validators_and_immutable_caching(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.body))
+        self.assertEqual(response["Cache-Control"], IMMUTABLE_CACHE)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertTrue(response["ETag"])
+
+    def test_matching_etag_is_304(self):
+        etag = self.get()[0]["ETag"]
+        response, body = self.get(if_none_match=etag)
+        self.assertEqual((response.status_code, body), (304, b""))
+        self.assertEqual(response["ETag"], etag)
+
+    def test_ranges_are_206(self):
+        for header, start, end in (("bytes=10-19", 10, 19), ("bytes=-5", 95, 99), ("bytes=90-500", 90, 99)):
+            with self.subTest(header=header):
+                response, body = self.get(range=header)
+                self.assertEqual((response.status_code, body), (206, self.body[start:end + 1]))
+                self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/100")
+
+    def test_unsatisfiable_range_is_416(self):
+        response, _ = self.get(range="bytes=100-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_unsupported_or_stale_ranges_get_the_full_body(self):
+        for headers in ({"range": "bytes=0-1,5-6"}, {"range": "items=0-1"}, {"range": "bytes=5-2"},
+                        {"range": "bytes=0-9", "if_range": '"stale"'}):
+            with self.subTest(headers=headers):
+                response, body = self.get(**headers)
+                self.assertEqual((response.status_code, body), (200, self.body))
+
+    def test_unhashed_names_are_cached_for_a_day(self):
+        with open(os.path.join(settings.MEDIA_ROOT, "product_img/photo.jpg"), "wb") as f:
+            f.write(b"jpeg")
+        response = self.client.get(reverse("media", kwargs={"path": "product_img/photo.jpg"}))
+        self.assertEqual(response["Cache-Control"], DEFAULT_CACHE)
+
+
+S3_OPTIONS = {
+    "bucket_name": "media", "endpoint_url": "http://s3.test", "region_name": "us-east-1",
+    "access_key": "test", "secret_key": "test", "querystring_auth": False, "use_threads": False,
+}
+
+
+class MediaStorageTests(TestCase):
+    def test_uploads_set_cache_control_from_the_name(self):
+        storage = MediaStorage(**S3_OPTIONS)
+        client = storage.connection.meta.client
+        with Stubber(client) as stubber:
+            for name, cache_control in (("product_img/a-0123456789ab.webp", IMMUTABLE_CACHE),
+                                        ("product_img/a.jpg", DEFAULT_CACHE)):
+                stubber.add_response("put_object", {}, {
+                    "Bucket": "media", "Key": name, "Body": ANY, "ContentType": ANY,
+                    "CacheControl": cache_control, "ChecksumAlgorithm": ANY,
+                })
+                self.assertEqual(storage.save(name, ContentFile(b"image")), name)
+            stubber.assert_no_pending_responses()
+
+    def test_media_requests_redirect_to_object_storage(self):
+        storages_setting = {**settings.STORAGES, "default": {
+            "BACKEND": "apiApp.storage.MediaStorage", "OPTIONS": S3_OPTIONS,
+        }}
+        with override_settings(STORAGES=storages_setting):
+            response = self.client.get(reverse("media", kwargs={"path": "product_img/a.jpg"}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], "http://s3.test/media/product_img/a.jpg")
+
+
+def png(width, height):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new("RGBA", (width, height), (200, 40, 40, 128)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def run_tasks(self):
+        for claimed in claim_tasks("worker", 10):
+            self.assertTrue(run_task(claimed))
+
+    def test_variants_are_never_upscaled(self):
+        from PIL import Image
+
+        rendered = render_variants(png(500, 250))
+        self.assertEqual(sorted((fmt, width) for fmt, width, _ in rendered), [
+            ("jpeg", 320), ("jpeg", 500), ("webp", 320), ("webp", 500)
+        ])
+        for fmt, width, data in rendered:
+            with Image.open(BytesIO(data)) as image:
+                self.assertEqual((image.format.lower(), image.size), (fmt, (width, width // 2)))
+
+    def test_upload_renders_variants_served_as_srcsets(self):
+        product = make_product("Poster", image=ContentFile(png(800, 400), name="poster.png"))
+        self.run_tasks()
+        product.refresh_from_db()
+        variants = product.image_variants
+        self.assertEqual(variants["source"], product.image.name)
+        self.assertEqual(sorted(variants["webp"]), ["320", "640", "800"])
+        for name in [*variants["webp"].values(), *variants["jpeg"].values()]:
+            self.assertTrue(default_storage.exists(name))
+
+        srcsets = self.client.get(reverse("product_detail", args=[product.slug])).json()["image_variants"]
+        self.assertEqual(srcsets, variant_srcsets(variants))
+        self.assertEqual(
+            [entry.rsplit(" ", 1)[1] for entry in srcsets["jpeg"].split(", ")], ["320w", "640w", "800w"]
+        )
+
+        product.name = "Renamed poster"
+        product.save()
+        self.assertFalse(Task.objects.filter(status=Task.QUEUED).exists())
+
+    def test_replaced_image_gets_new_variants(self):
+        product = make_product("Swap", image=ContentFile(png(400, 400), name="swap.png"))
+        product.image = ContentFile(png(300, 300), name="swap2.png")
+        product.save()
+        self.run_tasks()
+        product.refresh_from_db()
+        # The render for the first image finds it replaced and stores nothing.
+        self.assertEqual(product.image_variants["source"], product.image.name)
+        self.assertEqual(sorted(product.image_variants["webp"]), ["300"])
+
+# ----------------------------
+# Response cache
+# ----------------------------
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def served_from_cache(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return not queries.captured_queries
+
+    def test_product_change_only_drops_pages_that_show_it(self):
+        books, toys = Category.objects.create(name="Books"), Category.objects.create(name="Toys")
+        changed = make_product("Atlas", category=books)
+        fallback = make_product("Almanac", category=books)  # No neighbours: lists Books products
+        neighbour = make_product("Globe", category=toys)
+        unrelated = make_product("Kite", category=toys)
+        SimilarProduct.objects.create(product=neighbour, similar=changed, score=1.0)
+        SimilarProduct.objects.create(product=unrelated, similar=neighbour, score=1.0)
+        urls = {
+            "changed": reverse("product_detail", args=[changed.slug]),
+            "fallback": reverse("product_detail", args=[fallback.slug]),
+            "neighbour": reverse("product_detail", args=[neighbour.slug]),
+            "unrelated": reverse("product_detail", args=[unrelated.slug]),
+            "books": reverse("category_detail", args=[books.slug]),
+            "toys": reverse("category_detail", args=[toys.slug]),
+        }
+        for url in urls.values():
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            changed.name = "Atlas, revised"
+            changed.save()
+
+        cached = {page for page, url in urls.items() if self.served_from_cache(url)}
+        self.assertEqual(cached, {"unrelated", "toys"})
+        self.assertEqual(self.client.get(urls["neighbour"]).json()["similar_products"][0]["name"], "Atlas, revised")
+
+    def test_pages_recomputed_after_a_write_do_not_read_a_lagging_replica(self):
+        product = make_product("Lamp")
+        url = reverse("product_detail", args=[product.slug])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = "Lamp, brass"
+            product.save()
+
+        # A replica that hasn't replayed the rename; reading from it would cache the old name under the new version.
+        pool = StubPool(["replica_1"])
+        with mock.patch.object(routers, "replicas", pool):
+            response = self.client.get(url)
+        self.assertEqual(response.json()["name"], "Lamp, brass")
+        self.assertEqual(pool.picks, 0)
+
+    def test_failed_warming_does_not_stop_gunicorn(self):
+        spec = importlib.util.spec_from_file_location("gunicorn_conf", settings.BASE_DIR / "gunicorn.conf.py")
+        conf = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(conf)
+        server = mock.Mock()
+        with mock.patch("apiApp.response_cache.warm", side_effect=RuntimeError("database unavailable")), \
+                mock.patch.object(connections, "close_all"):
+            conf.when_ready(server)
+        server.log.exception.assert_called_once()
+
+
+# ----------------------------
+# Query plans
+# ----------------------------
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.requests = endpoint_requests(*seed(50))
+
+    def test_endpoint_queries_use_indexes(self):
+        if connection.vendor == "postgresql":
+            # Tables this small are cheaper to scan; only a missing index should show up.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("ANALYZE")
+        scans = sequential_scans(self.requests)
+        self.assertEqual(scans, {}, "\n\n".join(
+            f"{label}: {sql}\n{plan}" for label, found in scans.items() for _, sql, plan in found
+        ))
+
+
+# ----------------------------
+# Exports
+# ----------------------------
+class ExportTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.product = make_product("Mug")
+
+    def export(self, *args):
+        stdout = StringIO()
+        call_command(
+            "export_data", self.directory, "--table", "orders", "--table", "order_items", *args, stdout=stdout
+        )
+        return stdout.getvalue()
+
+    def csv_rows(self, table):
+        rows = []
+        for name in sorted(os.listdir(os.path.join(self.directory, table))):
+            self.assertTrue(name.endswith(".csv.gz"), name)
+            with gzip.open(os.path.join(self.directory, table, name), "rt", newline="", encoding="utf-8") as f:
+                header, *body = csv.reader(f)
+            rows += [dict(zip(header, row)) for row in body]
+        return rows
+
+    def test_incremental_runs_export_each_settled_row_once(self):
+        now = timezone.now()
+        settled = [make_order([self.product], created=now - timedelta(minutes=10), amount=1250) for _ in range(3)]
+        settling = make_order([self.product], created=now - timedelta(seconds=5))
+
+        output = self.export("--format", "csv", "--chunk-size", "1", "--rows-per-file", "2")
+        self.assertIn("orders: 3 rows in 2 files", output)
+        orders = self.csv_rows("orders")
+        self.assertEqual([int(row["id"]) for row in orders], [order.id for order in settled])
+        self.assertEqual(orders[0]["amount"], "1250")
+        self.assertEqual([row["order_id"] for row in self.csv_rows("order_items")], [row["id"] for row in orders])
+        watermarks = read_watermarks(self.directory)
+        self.assertEqual(watermarks["orders"]["id"], settled[-1].id)
+
+        later = make_order([self.product], created=now - timedelta(minutes=2))
+        self.assertIn("orders: 1 rows in 1 files", self.export("--format", "csv", "--incremental"))
+        settle_now = ["--format", "csv", "--incremental", "--settle-seconds", "0"]
+        self.assertIn("orders: 1 rows in 1 files", self.export(*settle_now))
+        self.assertIn("orders: 0 rows in 0 files", self.export(*settle_now))
+        self.assertEqual(
+            sorted(int(row["id"]) for row in self.csv_rows("orders")),
+            sorted(order.id for order in [*settled, later, settling]),
+        )
+        self.assertEqual(read_watermarks(self.directory)["orders"]["id"], settling.id)
+
+    def test_rows_sharing_the_watermark_timestamp_are_not_skipped(self):
+        created = timezone.now() - timedelta(minutes=10)
+        first = make_order([self.product], created=created)
+        self.export("--format", "csv")
+        # Same timestamp, higher id: e.g. a checkout that committed after the last run.
+        second = make_order([self.product], created=created)
+        self.assertIn("orders: 1 rows in 1 files", self.export("--format", "csv", "--incremental"))
+        self.assertEqual([int(row["id"]) for row in self.csv_rows("orders")], [first.id, second.id])
+
+    @skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet_parts_keep_column_types(self):
+        import pyarrow.parquet
+
+        order = make_order([self.product], created=timezone.now() - timedelta(minutes=10), amount=999)
+        self.export("--format", "parquet")
+        [name] = os.listdir(os.path.join(self.directory, "orders"))
+        table = pyarrow.parquet.read_table(os.path.join(self.directory, "orders", name))
+        self.assertEqual(table.column("id").to_pylist(), [order.id])
+        self.assertEqual(table.column("amount").to_pylist(), [999])
+        self.assertEqual(str(table.schema.field("user_id").type), "int64")
+
+    @skipUnless(importlib.util.find_spec("pyarrow") is None, "pyarrow is installed")
+    def test_parquet_without_pyarrow_is_a_command_error(self):
+        with self.assertRaisesMessage(CommandError, "needs pyarrow"):
+            self.export("--format", "parquet")
+
+
+# ----------------------------
+# Recommendations
+# ----------------------------
+class SimilarProductsTests(TestCase):
+    def test_fallback_lists_unrated_products_last(self):
+        category = Category.objects.create(name="Books")
+        product = make_product("Reader", category=category)
+        unrated = make_product("Unrated", category=category)
+        low = make_product("Low", category=category)
+        high = make_product("High", category=category)
+        ProductRating.objects.create(product=low, average_rating=2.0, total_reviews=1)
+        ProductRating.objects.create(product=high, average_rating=4.5, total_reviews=3)
+
+        self.assertEqual(similar_products_for(product), [high, low, unrated])
+
+    def test_large_baskets_are_sampled_across_all_products(self):
+        products = [make_product(f"Item {i}") for i in range(MAX_BASKET_SIZE + 20)]
+        make_order(products)
+
+        [basket] = _baskets(OrderItem.objects.all(), "order_id")
+        self.assertEqual(len(basket), MAX_BASKET_SIZE)
+        self.assertEqual(basket, sorted(basket))
+        self.assertNotEqual(basket, sorted(product.id for product in products)[:MAX_BASKET_SIZE])
+        self.assertEqual(basket, next(_baskets(OrderItem.objects.all(), "order_id")))
+
+    def test_batched_build_matches_a_single_pass(self):
+        books, toys = Category.objects.create(name="Books"), Category.objects.create(name="Toys")
+        products = [make_product(f"Item {i}", category=[books, toys, None][i % 3]) for i in range(12)]
+        for i in range(10):
+            make_order(products[i:i + 3])
+        make_cart(products[::4])
+        ProductRating.objects.create(product=products[5], average_rating=4.0, total_reviews=2)
+
+        single = dict(compute_similar_products())
+        self.assertEqual(dict(compute_similar_products(batch_size=5)), single)
+
+        call_command("build_similar_products", "--batch-size", "5", stdout=StringIO())
+        stored = defaultdict(list)
+        for product_id, similar_id, score in SimilarProduct.objects.order_by("product_id", "-score", "id").values_list(
+            "product_id", "similar_id", "score"
+        ):
+            stored[product_id].append((similar_id, score))
+        self.assertEqual(
+            {product_id: sorted(ranked) for product_id, ranked in stored.items()},
+            {product_id: sorted(ranked) for product_id, ranked in single.items()},
+        )
+
+
+class BoughtTogetherTests(TestCase):
+    def counts(self, product):
+        return dict(ProductAssociation.objects.filter(product=product).values_list("associated_id", "count"))
+
+    def test_order_committed_after_a_newer_one_is_still_mined(self):
+        a, b, c = make_product("A"), make_product("B"), make_product("C")
+        now = timezone.now()
+        # Lower id but still inside the settle window, e.g. a checkout that hasn't committed yet.
+        make_order([a, b], created=now - timedelta(seconds=10))
+        make_order([a, c], created=now - timedelta(minutes=5))
+
+        self.assertEqual(mine_bought_together(settle_seconds=60), 1)
+        self.assertEqual(self.counts(a), {c.id: 1})
+        self.assertEqual(mine_bought_together(settle_seconds=0), 1)
+        self.assertEqual(self.counts(a), {b.id: 1, c.id: 1})
+        self.assertEqual(mine_bought_together(settle_seconds=0), 0)
+
+    def test_incremental_runs_keep_full_counts(self):
+        hub = make_product("Hub")
+        others = [make_product(f"Other {i}") for i in range(BOUGHT_TOGETHER_LIMIT + 5)]
+        past = timezone.now() - timedelta(hours=1)
+        for other in others:
+            make_order([hub, other], created=past)
+        mine_bought_together(settle_seconds=0)
+        for other in others:
+            make_order([hub, other], created=past + timedelta(minutes=1))
+        mine_bought_together(settle_seconds=0)
+
+        self.assertEqual(self.counts(hub), {other.id: 2 for other in others})
+        mine_bought_together(full=True, settle_seconds=0)
+        self.assertEqual(self.counts(hub), {other.id: 2 for other in others})
+        self.assertEqual(len(bought_together_for(hub)), BOUGHT_TOGETHER_LIMIT)
+
+    def test_unknown_product_is_404(self):
+        response = self.client.get(reverse("frequently_bought_together", args=["missing"]))
+        self.assertEqual(response.status_code, 404)
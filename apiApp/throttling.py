@@ -0,0 +1,118 @@
+"""
+Rate limits for expensive endpoints, shared by every worker through the cache.
+
+Each client gets a sliding-window counter per scope. Requests in the current
+and previous fixed windows are counted with atomic cache.add()/cache.incr(),
+and the previous window's count is weighted by how much of it still overlaps
+the rolling window, so "30/min" allows about 30 requests in any rolling
+minute. With the default per-process cache each worker counts on its own; set
+REDIS_URL in production so the limits hold across workers and restarts.
+
+Rejections are counted per scope in the same cache (rejected_counts()) and
+each one is logged with the scope's running total.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """"30/min" -> (limit, window in seconds)."""
+    num, period = rate.split("/")
+    return int(num), DURATIONS[period[0]]
+
+
+def _count(key, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.add(key, 1, timeout)
+        return 1
+
+
+def _rejected_key(scope):
+    return f"throttle:rejected:{scope}"
+
+
+def record_rejection(scope):
+    """Count a rejected request for `scope`; returns the scope's total so far."""
+    return _count(_rejected_key(scope), timeout=None)
+
+
+def rejected_counts(scopes=None):
+    """{scope: rejected requests} for `scopes` (default: every scope with a rate)."""
+    scopes = list(api_settings.DEFAULT_THROTTLE_RATES) if scopes is None else list(scopes)
+    counts = cache.get_many([_rejected_key(scope) for scope in scopes])
+    return {scope: counts.get(_rejected_key(scope), 0) for scope in scopes}
+
+
+def hit(key, limit, window, now=None):
+    """Count a request for `key`. Returns (allowed, seconds until one would be)."""
+    now = time.time() if now is None else now
+    current = int(now // window)
+    elapsed = now - current * window
+    counter = f"throttle:{key}:{current}"
+    count = _count(counter, timeout=2 * window + 1)
+    previous = cache.get(f"throttle:{key}:{current - 1}", 0)
+    overlap = (window - elapsed) / window
+    if previous * overlap + count <= limit:
+        return True, 0.0
+
+    try:
+        cache.decr(counter)  # Rejected requests don't use up the allowance
+    except ValueError:
+        pass
+    if count > limit or not previous:
+        return False, window - elapsed
+    # The previous window's weight has to fall far enough to admit one more.
+    excess = previous * overlap + count - limit
+    return False, min(window - elapsed, excess * window / previous)
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Throttle for views with a `throttle_scope`.
+
+    Rates come from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"][scope]. `throttle_key`
+    picks the client identity: "ip", or "user" for authenticated callers
+    (falling back to the IP address).
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+
+        limit, window = parse_rate(rate)
+        client = self.get_client_key(request, getattr(view, "throttle_key", "ip"))
+        allowed, self._wait = hit(f"{scope}:{client}", limit, window)
+        if not allowed:
+            rejected = record_rejection(scope)
+            logger.info("Request throttled", extra={"scope": scope, "client": client, "rejected": rejected})
+        return allowed
+
+    def get_client_key(self, request, key):
+        if key == "user" and request.user and request.user.is_authenticated:
+            return f"user:{request.user.id}"
+        return f"ip:{self.get_ident(request)}"
+
+    def wait(self):
+        return self._wait
+
+
+def throttled(view, scope, key="ip"):
+    """Apply the throttle to an @api_view view, for use in urls.py."""
+    view.cls.throttle_scope = scope
+    view.cls.throttle_key = key
+    view.cls.throttle_classes = [SlidingWindowThrottle]
+    return view
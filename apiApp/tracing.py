@@ -0,0 +1,214 @@
+"""
+Structured logging and lightweight span tracing.
+
+Log records are formatted as JSON on the calling thread and written by a
+background thread, so a slow disk or pipe never holds up a request. Spans time
+the stages of a flow (checkout creation, webhook receipt, Stripe calls,
+fulfillment) and are exported one per line in OTLP/JSON, the format the
+OpenTelemetry collector's file receiver reads.
+
+A checkout's trace id is derived from its cart code, so the request that
+creates the Stripe session and the webhook that fulfills it land in one trace.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+trace_logger = logging.getLogger("apiApp.traces")
+
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "ecommerce-api")
+
+# OTLP span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=`.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+# ----------------------------
+# Logging
+# ----------------------------
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, carrying `extra` fields and the current trace/span ids."""
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        current = _current_span.get()
+        if current is not None:
+            entry["trace_id"] = current.trace_id
+            entry["span_id"] = current.span_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Formats records with its own formatter, then queues the finished line for a
+    writer thread that appends it to `filename` (or stderr). When the queue is
+    full, records are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, filename=None, max_queue=10_000):
+        self.max_queue = max_queue
+        super().__init__(queue.Queue(max_queue))
+        self.filename = filename or None
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _target(self):
+        if self.filename:
+            handler = logging.FileHandler(self.filename, delay=True, encoding="utf-8")
+        else:
+            handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        return handler
+
+    def _ensure_listener(self):
+        # Started lazily, and again in each forked worker: threads don't survive fork.
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.max_queue)
+            self._listener = QueueListener(self.queue, self._target())
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # logging.shutdown() calls this at exit, draining whatever is still queued.
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+        super().close()
+
+
+# ----------------------------
+# Tracing
+# ----------------------------
+def trace_id_for(key):
+    """Stable 128-bit trace id (hex) for a correlation key such as a cart code."""
+    return hashlib.sha256(str(key).encode()).hexdigest()[:32]
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name, kind, trace_id, parent_id, attributes):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def export_span(finished):
+    if not trace_logger.hasHandlers():
+        return
+    trace_logger.info(json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": "apiApp"}, "spans": [finished.to_otlp()]}],
+        }]
+    }))
+
+
+@contextmanager
+def span(name, attributes=None, trace_key=None, kind=KIND_INTERNAL):
+    """
+    Time a stage as a span, nested under the current one.
+
+    `trace_key` starts (or rejoins) the trace derived from that key; without it
+    the span joins the current trace, or starts a new random one.
+    """
+    parent = _current_span.get()
+    if trace_key is not None:
+        trace_id = trace_id_for(trace_key)
+    elif parent is not None:
+        trace_id = parent.trace_id
+    else:
+        trace_id = secrets.token_hex(16)
+    parent_id = parent.span_id if parent is not None and parent.trace_id == trace_id else None
+
+    current = Span(name, kind, trace_id, parent_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        export_span(current)
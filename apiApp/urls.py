@@ -1,17 +1,22 @@
 from django.urls import path
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from . import views
+from .throttling import throttled
 
 urlpatterns = [
     # Product endpoints
     path("product_list", views.product_list, name="product_list"),
+    path("filter_products", views.filter_products, name="filter_products"),
     path("products/<slug:slug>", views.product_detail, name="product_detail"),
+    path("products/<slug:slug>/reviews", views.product_reviews, name="product_reviews"),
+    path("products/<slug:slug>/bought_together", views.frequently_bought_together, name="frequently_bought_together"),
     
     # Category endpoints
     path("category_list", views.category_list, name="category_list"),
     path("categories/<slug:slug>", views.category_detail, name="category_detail"),
     
     # Cart endpoints
-    path("add_to_cart/", views.add_to_cart, name="add_to_cart"),
+    path("add_to_cart/", throttled(views.add_to_cart, "cart"), name="add_to_cart"),
     path("update_cartitem_quantity/", views.update_cartitem_quantity, name="update_cartitem_quantity"),
     path("delete_cartitem/<int:pk>/", views.delete_cartitem, name="delete_cartitem"),
     path("get_cart/<str:cart_code>", views.get_cart, name="get_cart"),
@@ -19,7 +24,7 @@ urlpatterns = [
     path("product_in_cart", views.product_in_cart, name="product_in_cart"),
 
     # Review endpoints
-    path("add_review/", views.add_review, name="add_review"),
+    path("add_review/", throttled(views.add_review, "reviews", key="user"), name="add_review"),
     path("update_review/<int:pk>/", views.update_review, name="update_review"),
     path("delete_review/<int:pk>/", views.delete_review, name="delete_review"),
 
@@ -27,17 +32,28 @@ urlpatterns = [
     path("add_to_wishlist/", views.add_to_wishlist, name="add_to_wishlist"),
     path("my_wishlists", views.my_wishlists, name="my_wishlists"),
     path("product_in_wishlist", views.product_in_wishlist, name="product_in_wishlist"),
+    path("product_membership", views.product_membership, name="product_membership"),
 
     # Search endpoint
-    path("search/", views.product_search, name="search"),
+    path("search/", throttled(views.product_search, "search"), name="search"),
+
+    # Auth endpoints
+    path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
+    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 
     # User endpoints
     path("create_user/", views.create_user, name="create_user"),
     path("existing_user/<str:email>", views.existing_user, name="existing_user"),
     path("add_address/", views.add_address, name="add_address"),
     path("get_address", views.get_address, name="get_address"),
+    path("get_orders", views.get_orders, name="get_orders"),
+    path("sales_report", views.sales_report, name="sales_report"),
 
     # Stripe Payment endpoints
-    path("create_checkout_session/", views.create_checkout_session, name="create_checkout_session"),
+    path(
+        "create_checkout_session/",
+        throttled(views.create_checkout_session, "checkout"),
+        name="create_checkout_session",
+    ),
     path("webhook/", views.my_webhook_view, name="webhook"),
 ]
@@ -1,12 +1,18 @@
-import stripe
+import logging
+from datetime import datetime, time, timedelta
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from django.db.models import Q
-from rest_framework.decorators import api_view
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import HttpResponse
+from rest_framework.exceptions import ValidationError
+from django.http import Http404, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
 from .models import (
@@ -20,10 +26,22 @@ from .serializers import (
     ProductListSerializer, ProductDetailSerializer,
     ReviewSerializer, WishlistSerializer, UserSerializer
 )
+from .analytics import record_order, sales_series
+from .authentication import CachedJWTAuthentication, IsStaff
+from .catalog import cart_lines, cart_total_cents
+from .facets import filter_products as faceted_products
+from .inventory import OutOfStock, commit_cart, release_cart, reserve_cart
+from .jobs import fulfill_checkout_session
+from .money import default_currency, format_minor
+from .payments import stripe_client
+from .membership import cart_product_ids, wishlist_cache, wishlist_product_ids
+from .recommendations import bought_together_for
+from .response_cache import cached_response
+from .reviews import MAX_REVIEW_PAGE_SIZE, REVIEW_PAGE_SIZE, review_page
+from .tracing import KIND_CLIENT, KIND_SERVER, span
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
-endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 # ----------------------------
@@ -31,13 +49,35 @@ User = get_user_model()
 # ----------------------------
 @api_view(["GET"])
 def product_list(request):
-    products = Product.objects.filter(featured=True)
+    products = Product.objects.filter(featured=True).order_by("id")
     return Response(ProductListSerializer(products, many=True).data)
 
+@api_view(["GET"])
+def filter_products(request):
+    """
+    Filter and sort products with facet counts for the filter panel.
+
+    ?category=books,toys&min_price=10&max_price=50&min_rating=4&featured=true
+    &sort=price|-price|rating|newest&page=1&page_size=24
+    """
+    products, total, facets = faceted_products(request.query_params)
+    return Response({
+        "count": total,
+        "results": ProductListSerializer(products, many=True).data,
+        "facets": facets,
+    }, status=status.HTTP_200_OK)
+
+def product_detail_data(slug):
+    return ProductDetailSerializer(get_object_or_404(Product, slug=slug)).data
+
 @api_view(["GET"])
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug)
-    return Response(ProductDetailSerializer(product).data)
+    return Response(cached_response("product", slug, lambda: product_detail_data(slug)))
+
+@api_view(["GET"])
+def frequently_bought_together(request, slug):
+    products = bought_together_for(get_object_or_404(Product, slug=slug))
+    return Response(ProductListSerializer(products, many=True).data)
 
 
 # ----------------------------
@@ -48,15 +88,24 @@ def category_list(request):
     categories = Category.objects.all()
     return Response(CategoryListSerializer(categories, many=True).data)
 
+def category_detail_data(slug):
+    return CategoryDetailSerializer(get_object_or_404(Category, slug=slug)).data
+
 @api_view(["GET"])
 def category_detail(request, slug):
-    category = get_object_or_404(Category, slug=slug)
-    return Response(CategoryDetailSerializer(category).data)
+    return Response(cached_response("category", slug, lambda: category_detail_data(slug)))
 
 
 # ----------------------------
 # CART VIEWS
 # ----------------------------
+def carts_with_items():
+    """Carts with items and their products loaded up front for CartSerializer."""
+    return Cart.objects.prefetch_related(
+        Prefetch("cartitems", queryset=CartItem.objects.select_related("product"))
+    )
+
+
 @api_view(["POST"])
 def add_to_cart(request):
     cart_code = request.data.get("cart_code")
@@ -72,6 +121,7 @@ def add_to_cart(request):
     else:
         cartitem.quantity = 1
     cartitem.save()
+    cart = carts_with_items().get(pk=cart.pk)
     return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
 
 
@@ -94,7 +144,7 @@ def delete_cartitem(request, pk):
 
 @api_view(["GET"])
 def get_cart(request, cart_code):
-    cart = Cart.objects.filter(cart_code=cart_code).first()
+    cart = carts_with_items().filter(cart_code=cart_code).first()
     if not cart:
         return Response({"error": "Cart not found."}, status=status.HTTP_404_NOT_FOUND)
     return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
@@ -124,20 +174,43 @@ def product_in_cart(request):
 # REVIEW VIEWS
 # ----------------------------
 @api_view(["POST"])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def add_review(request):
     product = get_object_or_404(Product, id=request.data.get("product_id"))
-    user = get_object_or_404(User, email=request.data.get("email"))
-    if Review.objects.filter(product=product, user=user).exists():
+    if Review.objects.filter(product=product, user_id=request.user.id).exists():
         return Response({"error": "You already dropped a review"}, status=status.HTTP_400_BAD_REQUEST)
     review = Review.objects.create(
         product=product,
-        user=user,
+        user_id=request.user.id,
         rating=request.data.get("rating"),
         review=request.data.get("review")
     )
     return Response(ReviewSerializer(review).data, status=status.HTTP_201_CREATED)
 
 
+@api_view(["GET"])
+def product_reviews(request, slug):
+    """A product's reviews, newest first. ?rating=1-5 filters; ?cursor= continues from next_cursor."""
+    product_id = get_object_or_404(Product.objects.values_list("id", flat=True), slug=slug)
+    rating = request.query_params.get("rating")
+    if rating is not None and rating not in {"1", "2", "3", "4", "5"}:
+        raise ValidationError({"rating": "Expected a rating from 1 to 5."})
+    try:
+        page_size = min(max(int(request.query_params.get("page_size", REVIEW_PAGE_SIZE)), 1), MAX_REVIEW_PAGE_SIZE)
+    except ValueError:
+        raise ValidationError({"page_size": "Expected an integer."})
+
+    reviews, next_cursor = review_page(
+        product_id, cursor=request.query_params.get("cursor"),
+        rating=int(rating) if rating else None, page_size=page_size,
+    )
+    return Response({
+        "results": ReviewSerializer(reviews, many=True).data,
+        "next_cursor": next_cursor,
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(["PUT"])
 def update_review(request, pk):
     review = get_object_or_404(Review, id=pk)
@@ -157,32 +230,85 @@ def delete_review(request, pk):
 # WISHLIST VIEWS
 # ----------------------------
 @api_view(["POST"])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def add_to_wishlist(request):
-    user = get_object_or_404(User, email=request.data.get("email"))
-    product = get_object_or_404(Product, id=request.data.get("product_id"))
-    wishlist = Wishlist.objects.filter(user=user, product=product)
-    if wishlist.exists():
-        wishlist.delete()
-        return Response({"message": "Wishlist deleted"}, status=status.HTTP_200_OK)
-    wishlist_item = Wishlist.objects.create(user=user, product=product)
-    return Response(WishlistSerializer(wishlist_item).data, status=status.HTTP_201_CREATED)
+    """
+    Toggle a product in the caller's wishlist without checking first.
+
+    Deleting tells us whether it was there; otherwise insert, ignoring a conflict
+    from a concurrent toggle, so racing requests never hit the unique constraint.
+    """
+    try:
+        product_id = int(request.data.get("product_id"))
+    except (TypeError, ValueError):
+        return Response({"error": "product_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        with transaction.atomic():
+            deleted, _ = Wishlist.objects.filter(user_id=request.user.id, product_id=product_id).delete()
+            if not deleted:
+                Wishlist.objects.bulk_create(
+                    [Wishlist(user_id=request.user.id, product_id=product_id)], ignore_conflicts=True
+                )
+    except IntegrityError:
+        # The only remaining constraint is the product foreign key.
+        raise Http404("Product not found")
+
+    # bulk_create skips post_save, so drop the cached membership here.
+    wishlist_cache.invalidate(request.user.id)
+    if deleted:
+        return Response({"product_id": product_id, "in_wishlist": False}, status=status.HTTP_200_OK)
+    return Response({"product_id": product_id, "in_wishlist": True}, status=status.HTTP_201_CREATED)
 
 
 @api_view(["GET"])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def my_wishlists(request):
-    email = request.query_params.get("email")
-    wishlists = Wishlist.objects.filter(user__email=email)
+    wishlists = Wishlist.objects.filter(user_id=request.user.id).select_related("user", "product")
     return Response(WishlistSerializer(wishlists, many=True).data, status=status.HTTP_200_OK)
 
 
 @api_view(["GET"])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def product_in_wishlist(request):
-    email = request.query_params.get("email")
     product_id = request.query_params.get("product_id")
-    exists = Wishlist.objects.filter(user__email=email, product_id=product_id).exists()
+    exists = Wishlist.objects.filter(user_id=request.user.id, product_id=product_id).exists()
     return Response({"product_in_wishlist": exists}, status=status.HTTP_200_OK)
 
 
+# Largest batch of product ids accepted by product_membership
+MAX_MEMBERSHIP_IDS = 200
+
+
+@api_view(["GET"])
+@authentication_classes([CachedJWTAuthentication])
+def product_membership(request):
+    """
+    Which of ?product_ids=1,2,3 are in the caller's wishlist and in ?cart_code=.
+
+    Answers a whole product grid in one request; the wishlist part needs a token.
+    """
+    try:
+        product_ids = {int(value) for value in request.query_params.get("product_ids", "").split(",") if value}
+    except ValueError:
+        return Response({"error": "product_ids must be comma-separated integers"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(product_ids) > MAX_MEMBERSHIP_IDS:
+        return Response(
+            {"error": f"At most {MAX_MEMBERSHIP_IDS} product_ids per request"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    cart_code = request.query_params.get("cart_code")
+    wishlist = wishlist_product_ids(request.user.id) if request.user.is_authenticated else frozenset()
+    cart = cart_product_ids(cart_code) if cart_code else frozenset()
+    return Response({
+        "wishlist": sorted(product_ids & wishlist),
+        "cart": sorted(product_ids & cart),
+    }, status=status.HTTP_200_OK)
+
+
 # ----------------------------
 # SEARCH
 # ----------------------------
@@ -210,31 +336,55 @@ def create_checkout_session(request):
     if not cart_code or not email:
         return Response({"error": "cart_code and email are required"}, status=status.HTTP_400_BAD_REQUEST)
 
-    cart = get_object_or_404(Cart, cart_code=cart_code)
-    if cart.cartitems.count() == 0:
-        return Response({"error": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
-
-    session = stripe.checkout.Session.create(
-        customer_email=email,
-        payment_method_types=["card"],
-        mode="payment",
-        line_items=[
-            {
-                "price_data": {
-                    "currency": "usd",
-                    "product_data": {"name": item.product.name},
-                    "unit_amount": int(item.product.price * 100),
-                },
-                "quantity": item.quantity,
-            } for item in cart.cartitems.all()
-        ],
-        success_url="http://localhost:3000/success",
-        cancel_url="http://localhost:3000/failed",
-        metadata={"cart_code": cart.cart_code}
-    )
+    with span("checkout.create_session", {"cart.code": cart_code}, trace_key=cart_code, kind=KIND_SERVER) as trace:
+        cart = get_object_or_404(Cart, cart_code=cart_code)
+        lines = cart_lines(cart.cartitems.all())
+        if not lines:
+            return Response({"error": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with span("inventory.reserve"):
+                expires_at = reserve_cart(cart)
+        except OutOfStock as e:
+            logger.info("Checkout refused: out of stock", extra={"cart_code": cart_code, "reason": str(e)})
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+
+        session = _create_stripe_session(cart, lines, email, expires_at)
+        trace.set_attribute("checkout.id", session.id)
+        logger.info("Checkout session created", extra={"cart_code": cart_code, "checkout_id": session.id})
     return Response({"url": session.url}, status=status.HTTP_200_OK)
 
 
+def _create_stripe_session(cart, lines, email, expires_at):
+    stripe = stripe_client()
+    try:
+        with span("stripe.checkout.session.create", kind=KIND_CLIENT):
+            return stripe.checkout.Session.create(
+                customer_email=email,
+                payment_method_types=["card"],
+                mode="payment",
+                line_items=[
+                    {
+                        "price_data": {
+                            "currency": default_currency(),
+                            # Read back at fulfillment to record what each product was charged.
+                            "product_data": {"name": product.name, "metadata": {"product_id": product.id}},
+                            "unit_amount": product.price_cents,
+                        },
+                        "quantity": item.quantity,
+                    } for item, product in lines
+                ],
+                success_url="http://localhost:3000/success",
+                cancel_url="http://localhost:3000/failed",
+                metadata={"cart_code": cart.cart_code},
+                # Payment can't complete after the stock reservation lapses.
+                expires_at=int(expires_at.timestamp()),
+            )
+    except Exception:
+        release_cart(cart.cart_code)
+        raise
+
+
 # ----------------------------
 # STRIPE WEBHOOK
 # ----------------------------
@@ -242,20 +392,19 @@ def create_checkout_session(request):
 def my_webhook_view(request):
     payload = request.body
     sig_header = request.META.get("HTTP_STRIPE_SIGNATURE")
+    stripe = stripe_client()
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, endpoint_secret)
+        event = stripe.Webhook.construct_event(payload, sig_header, settings.STRIPE_WEBHOOK_SECRET)
     except (ValueError, stripe.error.SignatureVerificationError):
         return HttpResponse(status=400)
 
     if event['type'] in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
         session = event['data']['object']
-        session = stripe.checkout.Session.retrieve(session["id"], expand=["customer_details"])
         cart_code = session.get("metadata", {}).get("cart_code")
-        try:
-            fulfill_checkout(session, cart_code)
-        except Exception as e:
-            print("⚠️ Webhook failed:", str(e))
-            return HttpResponse(status=500)
+        attributes = {"checkout.id": session["id"], "stripe.event_type": event["type"]}
+        with span("stripe.webhook", attributes, trace_key=cart_code, kind=KIND_SERVER):
+            # Retrieval and fulfillment run in the worker, retried there on failure.
+            fulfill_checkout_session.delay(session_id=session["id"], cart_code=cart_code)
 
     return HttpResponse(status=200)
 
@@ -263,32 +412,58 @@ def my_webhook_view(request):
 # ----------------------------
 # FULFILL CHECKOUT
 # ----------------------------
-def fulfill_checkout(session, cart_code):
+@transaction.atomic
+def fulfill_checkout(session, cart_code, unit_prices=None):
+    """
+    Turn a paid session's cart into an order. `unit_prices` ({product_id: minor
+    units}) is what Stripe charged per unit; lines it doesn't cover are
+    recorded at the product's current price.
+    """
     if Order.objects.filter(stripe_checkout_id=session["id"]).exists():
-        print("Order already exists:", session["id"])
+        logger.info("Order already exists", extra={"checkout_id": session["id"]})
         return
 
     cart = get_object_or_404(Cart, cart_code=cart_code)
+    # The customer has paid by now, so units that ran out are backordered rather than dropping the order.
+    shortfall = commit_cart(cart)
 
     order = Order.objects.create(
         stripe_checkout_id=session["id"],
-        amount=session["amount_total"] / 100,
+        # The cart owner, even when they paid with another email; otherwise an account with that email.
+        user_id=cart.user_id or User.objects.filter(email=session["customer_email"]).values_list("id", flat=True).first(),
+        amount=session["amount_total"],
         currency=session["currency"],
         customer_email=session["customer_email"],
-        status="Paid"
+        status="Paid",
+        backordered=bool(shortfall),
     )
 
-    for item in cart.cartitems.all():
-        OrderItem.objects.create(
-            order=order,
-            product=item.product,
-            quantity=item.quantity
+    items = list(cart.cartitems.all())
+    products = {
+        product_id: (category_id, price) for product_id, category_id, price in
+        Product.objects.filter(id__in=[item.product_id for item in items]).values_list("id", "category_id", "price")
+    }
+    unit_prices = unit_prices or {}
+    lines = [
+        (item, products[item.product_id][0], unit_prices.get(item.product_id, products[item.product_id][1]))
+        for item in items if item.product_id in products
+    ]
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, product_id=item.product_id, quantity=item.quantity, unit_price=unit_price,
+            backordered=min(item.quantity, shortfall.pop(item.product_id, 0)),
         )
+        for item, _, unit_price in lines
+    ])
+    if order.backordered:
+        logger.warning("Order backordered: out of stock after payment",
+                       extra={"order_id": order.id, "checkout_id": order.stripe_checkout_id})
+    record_order(order, [
+        (item.product_id, category_id, item.quantity, unit_price) for item, category_id, unit_price in lines
+    ])
 
     cart.delete()
-    print("✅ Order created:", order.id)
-    print("Customer:", order.customer_email)
-    print("Items:", order.items.count())
+    logger.info("Order created", extra={"order_id": order.id, "checkout_id": order.stripe_checkout_id, "items": len(lines)})
 
 
 # ----------------------------
@@ -303,12 +478,11 @@ def test_create_order(request):
 
     session_id = f"cs_test_manual_{cart_code}"
     cart = get_object_or_404(Cart, cart_code=cart_code)
-    amount_total = sum(item.product.price * item.quantity for item in cart.cartitems.all())
 
     fake_session = {
         "id": session_id,
-        "amount_total": int(amount_total * 100),
-        "currency": "usd",
+        "amount_total": cart_total_cents(cart.cartitems.all()),
+        "currency": default_currency(),
         "customer_email": email,
         "metadata": {"cart_code": cart.cart_code}
     }
@@ -336,17 +510,81 @@ def existing_user(request, email):
     return Response({"exists": exists}, status=status.HTTP_200_OK)
 
 
+def _date_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: "Expected a date in YYYY-MM-DD format."})
+    return parsed
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
 @api_view(["GET"])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def get_orders(request):
-    email = request.query_params.get("email")
-    orders = Order.objects.filter(customer_email=email)
+    orders = (
+        Order.objects.filter(user_id=request.user.id)
+        .prefetch_related(Prefetch("items", queryset=OrderItem.objects.select_related("product")))
+        .order_by("-created")
+    )
+
+    # Optional inclusive date range: ?start=YYYY-MM-DD&end=YYYY-MM-DD
+    start = _date_param(request, "start")
+    end = _date_param(request, "end")
+    if start:
+        orders = orders.filter(created__gte=_start_of_day(start))
+    if end:
+        orders = orders.filter(created__lt=_start_of_day(end + timedelta(days=1)))
     return Response(OrderSerializer(orders, many=True).data, status=status.HTTP_200_OK)
 
 
+@api_view(["GET"])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsStaff])
+def sales_report(request):
+    """
+    Daily orders, units and revenue from the sales rollups (staff only).
+
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD (default: the last 30 days), optionally
+    narrowed to ?product=<slug> or ?category=<slug>.
+    """
+    end = _date_param(request, "end") or timezone.localdate()
+    start = _date_param(request, "start") or end - timedelta(days=29)
+    if start > end:
+        raise ValidationError({"start": "Must not be after end."})
+    if (end - start).days >= 366:
+        raise ValidationError({"start": "At most 366 days per report."})
+
+    product = category = None
+    if request.query_params.get("product"):
+        product = get_object_or_404(Product, slug=request.query_params["product"])
+    elif request.query_params.get("category"):
+        category = get_object_or_404(Category, slug=request.query_params["category"])
+
+    days = sales_series(start, end, product=product, category=category)
+    totals = {field: sum(day[field] for day in days) for field in days[0] if field != "date"}
+    for row in [*days, totals]:
+        row["revenue"] = format_minor(row["revenue"])
+    return Response({
+        "start": start, "end": end, "currency": default_currency(),
+        "totals": totals, "days": days,
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(["POST"])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def add_address(request):
-    customer = get_object_or_404(User, email=request.data.get("email"))
-    address, _ = CustomerAddress.objects.get_or_create(customer=customer)
+    address, _ = CustomerAddress.objects.get_or_create(customer_id=request.user.id)
     for field in ["email", "street", "city", "state", "phone"]:
         setattr(address, field, request.data.get(field))
     address.save()
@@ -354,8 +592,10 @@ def add_address(request):
 
 
 @api_view(["GET"])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def get_address(request):
-    address = CustomerAddress.objects.filter(customer__email=request.query_params.get("email")).last()
+    address = CustomerAddress.objects.filter(customer_id=request.user.id).last()
     if not address:
         return Response({"error": "Address not found"}, status=status.HTTP_404_NOT_FOUND)
     return Response(CustomerAddressSerializer(address).data, status=status.HTTP_200_OK)
@@ -2,8 +2,10 @@
 Django settings for ecommerceApiProject project.
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 # BASE DIR & LOAD .env
@@ -54,6 +56,7 @@ MIDDLEWARE = [
 
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apiApp.routers.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -66,6 +69,9 @@ CORS_ALLOWED_ORIGINS = [
     "https://next-shop-self.vercel.app",
     "https://villageless-phonotypical-tori.ngrok-free.dev",
 ]
+# The frontend reads X-DB-Pin after a write and sends it back (apiApp.routers)
+CORS_EXPOSE_HEADERS = ["X-DB-Pin"]
+CORS_ALLOW_HEADERS = (*default_headers, "x-db-pin")
 
 # URLS / WSGI
 ROOT_URLCONF = "ecommerceApiProject.urls"
@@ -101,6 +107,14 @@ if os.getenv("PG_HOST"):
             "PORT": os.getenv("PG_PORT", 52020),
         }
     }
+elif os.getenv("SQLITE_REPLICAS"):
+    # Local replica testing: db.sqlite3 is the primary, SQLITE_REPLICAS lists copies of it.
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
 # else:
 #     DATABASES = {
 #         "default": {
@@ -109,6 +123,28 @@ if os.getenv("PG_HOST"):
 #         }
 #     }
 
+# READ REPLICAS
+# PG_REPLICA_HOSTS: comma-separated hosts sharing the primary's credentials.
+# SQLITE_REPLICAS: comma-separated SQLite files, for trying the routing locally.
+REPLICA_DATABASES = []
+if os.getenv("PG_HOST") and os.getenv("PG_REPLICA_HOSTS"):
+    for index, host in enumerate(os.environ["PG_REPLICA_HOSTS"].split(","), start=1):
+        DATABASES[f"replica_{index}"] = {**DATABASES["default"], "HOST": host.strip(), "TEST": {"MIRROR": "default"}}
+        REPLICA_DATABASES.append(f"replica_{index}")
+elif os.getenv("SQLITE_REPLICAS"):
+    for index, path in enumerate(os.environ["SQLITE_REPLICAS"].split(","), start=1):
+        DATABASES[f"replica_{index}"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": path.strip(),
+            "TEST": {"MIRROR": "default"},
+        }
+        REPLICA_DATABASES.append(f"replica_{index}")
+
+DATABASE_ROUTERS = ["apiApp.routers.ReplicaRouter"]
+REPLICA_RETRY_SECONDS = int(os.getenv("REPLICA_RETRY_SECONDS", 30))  # Skip a failed replica this long
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 5))       # Read-your-writes window after a write
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))  # Skip replicas further behind than this
+
 # PASSWORD VALIDATORS
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -132,15 +168,98 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# Optional S3-compatible media storage (AWS S3, or MinIO/LocalStack locally via AWS_S3_ENDPOINT_URL)
+if os.getenv("AWS_STORAGE_BUCKET_NAME"):
+    STORAGES = {
+        "default": {"BACKEND": "apiApp.storage.MediaStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+    AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STORAGE_BUCKET_NAME")
+    AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
+    AWS_S3_CUSTOM_DOMAIN = os.getenv("AWS_S3_CUSTOM_DOMAIN")
+    AWS_QUERYSTRING_AUTH = False
+    AWS_S3_FILE_OVERWRITE = False
+
+# RESPONSE CACHE (apiApp.response_cache)
+# Product/category detail responses. Without a shared cache (REDIS_URL) other processes' invalidations
+# don't reach a worker's copy, so pages are only kept briefly.
+RESPONSE_CACHE_SECONDS = int(os.getenv("RESPONSE_CACHE_SECONDS", 300 if os.getenv("REDIS_URL") else 30))
+RESPONSE_CACHE_WARM_PRODUCTS = int(os.getenv("RESPONSE_CACHE_WARM_PRODUCTS", 200))  # Busiest products warmed
+
+# BACKGROUND TASKS (apiApp.tasks, run by `manage.py run_worker`)
+TASK_ALWAYS_EAGER = os.getenv("TASK_ALWAYS_EAGER", "false").lower() == "true"  # Run tasks in-process after commit
+TASK_HEARTBEAT_SECONDS = 30   # How often a worker renews the heartbeat of the task it is running
+TASK_STALE_SECONDS = 300      # A running task without a heartbeat for this long is assumed orphaned
+TASK_RETENTION_DAYS = 7       # Finished tasks are pruned after this many days
+TASK_SCHEDULE = {             # Periodic tasks: name -> interval in seconds
+    "release_expired_reservations": 300,
+}
+
+# CACHE
+# Throttle counters, replica pins and cached pages must be shared by every
+# worker; without REDIS_URL each process keeps its own (fine for development).
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+
+# REST FRAMEWORK
+# Rates per throttle scope; scopes are attached to routes in apiApp/urls.py.
+REST_FRAMEWORK = {
+    # Proxies in front of the app; the client IP is taken from X-Forwarded-For behind them.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 1)),
+    "DEFAULT_THROTTLE_RATES": {
+        "search": os.getenv("THROTTLE_SEARCH", "60/min"),
+        "checkout": os.getenv("THROTTLE_CHECKOUT", "10/min"),
+        "cart": os.getenv("THROTTLE_CART", "120/min"),
+        "reviews": os.getenv("THROTTLE_REVIEWS", "20/min"),
+    },
+}
+
+# JWT
+# Access tokens identify the caller on user endpoints without a database lookup.
+SIMPLE_JWT = {
+    "ACCESS_TOKEN_LIFETIME": timedelta(minutes=int(os.getenv("JWT_ACCESS_MINUTES", 15))),
+    "REFRESH_TOKEN_LIFETIME": timedelta(days=int(os.getenv("JWT_REFRESH_DAYS", 7))),
+}
+JWT_TOKEN_CACHE_SIZE = 10_000  # Validated tokens remembered per worker
+
 # DEFAULTS
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "apiApp.CustomUser"
 
+# Currency of product prices; all amounts are stored in its minor units
+DEFAULT_CURRENCY = "usd"
+
 # STRIPE KEYS
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY", "")
 STRIPE_PUBLIC_KEY = os.environ.get("STRIPE_PUBLIC_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "")
 
-# Prevent Railway crash if Stripe keys are missing
-if DEBUG and not all([STRIPE_SECRET_KEY, STRIPE_PUBLIC_KEY, STRIPE_WEBHOOK_SECRET]):
-    print("⚠ Stripe environment variables not set. Skipping Stripe in DEBUG mode.")
+# Minutes stock is held for a cart at checkout; also the Stripe session expiry (Stripe needs at least 30)
+STOCK_RESERVATION_MINUTES = int(os.getenv("STOCK_RESERVATION_MINUTES", 35))
+
+# LOGGING
+# JSON log lines written off the request thread; spans go to TRACE_FILE as OTLP/JSON
+# (one resourceSpans object per line) for an OpenTelemetry collector file receiver.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "apiApp.tracing.JsonFormatter"},
+        "raw": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "console": {"()": "apiApp.tracing.BackgroundHandler", "formatter": "json"},
+        "traces": {"()": "apiApp.tracing.BackgroundHandler", "filename": TRACE_FILE, "formatter": "raw"},
+    },
+    "loggers": {
+        "apiApp": {"handlers": ["console"], "level": LOG_LEVEL},
+        "apiApp.traces": {"handlers": ["traces"] if TRACE_FILE else [], "level": "INFO", "propagate": False},
+    },
+}
@@ -0,0 +1,43 @@
+"""
+Gunicorn settings, picked up automatically from the working directory.
+
+With preload_app the master imports Django and the URLconf once and forks
+workers from it, so each worker (and each autoscaled instance's restart) starts
+with everything already imported. Set GUNICORN_PRELOAD=false to load the app
+per worker instead, e.g. to use --reload in development.
+"""
+import os
+
+# Gunicorn already takes the bind address from $PORT and workers from $WEB_CONCURRENCY.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def when_ready(server):
+    if preload_app:
+        # URL patterns (and the views they import) load lazily on the first
+        # request; resolve them in the master so workers inherit them.
+        from django.urls import get_resolver
+
+        get_resolver().url_patterns
+
+        if os.getenv("WARM_CACHE_ON_START", "true").lower() == "true":
+            # Workers inherit the warmed per-process cache when they fork. A failure
+            # (e.g. the database not reachable yet) must not stop the server starting.
+            from django.db import connections
+            from apiApp.response_cache import warm
+
+            try:
+                products, categories = warm()
+                server.log.info("Warmed %d product and %d category pages", products, categories)
+            except Exception:
+                server.log.exception("Cache warming failed; pages will be computed on first request")
+            finally:
+                connections.close_all()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        # Database connections must not be shared with the master or sibling workers.
+        from django.db import connections
+
+        connections.close_all()